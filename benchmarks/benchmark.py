@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+"""
+nb2pdf benchmark suite
+
+Generates synthetic notebooks and times the three conversion phases
+(execute_notebook, story build, doc.build) separately, so regressions in the
+highlighter, table and canvas code show up in the phase they belong to.
+
+Usage:
+    python benchmarks/benchmark.py
+    python benchmarks/benchmark.py --output results.json
+    python benchmarks/benchmark.py --only markdown_heavy,cells_1000 --repeat 5
+    python benchmarks/benchmark.py --compare baseline.json --threshold 0.15
+
+Results are JSON ({"commit": ..., "results": {name: {phase: seconds}}}) and
+can be compared across commits with --compare, which exits with status 1 when
+any phase got slower than the threshold allows.
+"""
+
+import argparse
+import base64
+import contextlib
+import importlib.util
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+import nb2pdf  # noqa: E402
+
+PHASES = ('execute', 'story', 'build', 'total')
+
+CODE_SNIPPET = '''# Compute running statistics for a list of values
+def running_stats_{n}(values, window=5):
+    """Return rolling mean and max for the given window."""
+    means, maxes = [], []
+    for i in range(len(values)):
+        chunk = values[max(0, i - window + 1):i + 1]
+        means.append(sum(chunk) / len(chunk))
+        maxes.append(max(chunk))
+    return means, maxes
+
+class Record{n}:
+    def __init__(self, name, score=0.0):
+        self.name = name
+        self.score = score
+
+    def __repr__(self):
+        return f"Record{n}(name={{self.name!r}}, score={{self.score:.2f}})"
+
+records = [Record{n}('item-' + str(i), i * 1.5) for i in range(10)]
+stats = running_stats_{n}([r.score for r in records])
+total = sum(stats[0]) if stats else None  # 'strings', "quotes" and numbers 3.14
+'''
+
+MARKDOWN_SNIPPET = '''## Section {n}: Problem statement
+
+Read the **instructions** carefully. Each answer must include *working code*
+and a short explanation referencing `numpy` or `pandas` where relevant.
+See [the course page](https://example.com/course/{n}) for details.
+
+- Load the dataset and clean missing values
+- Compute the summary statistics
+  - mean, median and standard deviation
+- Plot the distribution of $x_i$ for $i = 1 \\ldots n$
+
+1. First step
+2. Second step
+
+| Metric | Weight | Notes |
+|--------|-------:|-------|
+| Accuracy | 40 | higher is better |
+| Clarity | 30 | code comments |
+| Style | 30 | PEP 8 |
+
+$$\\bar{{x}} = \\frac{{1}}{{n}} \\sum_{{i=1}}^{{n}} x_i$$
+
+> Late submissions lose 10% per day.
+
+```python
+result = solve(data)
+```
+'''
+
+
+def _code(source):
+    return {'cell_type': 'code', 'metadata': {}, 'source': source.splitlines(True),
+            'outputs': [], 'execution_count': None}
+
+
+def _markdown(source):
+    return {'cell_type': 'markdown', 'metadata': {}, 'source': source.splitlines(True)}
+
+
+def code_heavy(scale):
+    return [_code(CODE_SNIPPET.format(n=n)) for n in range(int(200 * scale) or 1)]
+
+
+def output_heavy(scale):
+    source = "for i in range(200):\n    print(f'line {i:04d}: value={i * 3.7:.3f} status=OK')"
+    return [_code(source) for _ in range(int(50 * scale) or 1)]
+
+
+def plot_heavy(scale):
+    source = (
+        "import matplotlib.pyplot as plt\n"
+        "fig, ax = plt.subplots(figsize=(6, 4))\n"
+        "ax.plot([i * i for i in range(50)], label='quadratic')\n"
+        "ax.scatter(range(50), [(i * 7) % 13 for i in range(50)])\n"
+        "ax.legend()\n"
+        "ax.set_title('Synthetic plot')"
+    )
+    return [_code(source) for _ in range(int(20 * scale) or 1)]
+
+
+def dataframe_heavy(scale):
+    cells = [_code("import pandas as pd")]
+    source = (
+        "df = pd.DataFrame({f'col_{c}': [r * c * 0.5 for r in range(60)] for c in range(8)})\n"
+        "df.index.name = 'row'\n"
+        "display(df)\n"
+        "df.describe()"
+    )
+    cells += [_code(source) for _ in range(int(30 * scale) or 1)]
+    return cells
+
+
+def markdown_heavy(scale):
+    return [_markdown(MARKDOWN_SNIPPET.format(n=n)) for n in range(int(200 * scale) or 1)]
+
+
+def saved_outputs(scale):
+    # Notebooks saved after a run carry their outputs as base64 blobs
+    blob = base64.b64encode(os.urandom(750_000)).decode('ascii')
+    cells = []
+    for n in range(int(40 * scale) or 1):
+        cell = _code(f"value_{n} = {n}")
+        cell['outputs'] = [{'output_type': 'display_data', 'metadata': {},
+                            'data': {'image/png': blob, 'text/plain': ['<Figure size 640x480>']}}]
+        cells.append(cell)
+    return cells
+
+
+def cells_1000(scale):
+    cells = []
+    for n in range(int(500 * scale) or 1):
+        cells.append(_markdown(f"### Step {n}\nCompute value **{n}** and print it."))
+        cells.append(_code(f"value_{n} = {n} * 2\nprint(value_{n})"))
+    return cells
+
+
+SCENARIOS = {
+    'code_heavy': code_heavy,
+    'output_heavy': output_heavy,
+    'plot_heavy': plot_heavy,
+    'dataframe_heavy': dataframe_heavy,
+    'markdown_heavy': markdown_heavy,
+    'saved_outputs': saved_outputs,
+    'cells_1000': cells_1000,
+}
+
+
+def write_notebook(cells, path):
+    notebook = {'cells': cells, 'metadata': {}, 'nbformat': 4, 'nbformat_minor': 5}
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(notebook, f)
+
+
+def clear_caches():
+    """Drop nb2pdf's in-process caches so each run parses from scratch"""
+    for name in ('_MARKDOWN_CACHE', '_MATH_CACHE', '_WIDTH_CACHE', '_WRAP_CACHE', '_FONT_RUNS_CACHE'):
+        getattr(nb2pdf, name, {}).clear()
+
+
+def run_scenario(name, scale, repeat, workdir):
+    """Convert one synthetic notebook `repeat` times and keep the fastest phases"""
+    notebook_path = workdir / f'{name}.ipynb'
+    cells = SCENARIOS[name](scale)
+    write_notebook(cells, notebook_path)
+    config = nb2pdf.load_config(None)
+
+    best = None
+    for _ in range(repeat):
+        clear_caches()
+        output_path = workdir / f'{name}.pdf'
+        timings = {}
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            nb2pdf.create_pdf(notebook_path, output_path, config, timings=timings)
+        output_path.unlink()
+        run = {phase: timings[phase] for phase in PHASES}
+        run['pdf_bytes'] = timings['pdf_bytes']
+        if best is None:
+            best = run
+        else:
+            for phase in PHASES:
+                best[phase] = min(best[phase], run[phase])
+    best['cells'] = len(cells)
+    return best
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def compare(baseline, current, threshold):
+    """Print phase ratios against a baseline; return True if anything regressed"""
+    regressed = False
+    print(f"\nComparison against {baseline.get('commit') or 'baseline'} (threshold {threshold:.0%}):")
+    for name, result in current['results'].items():
+        old = baseline.get('results', {}).get(name)
+        if not old:
+            print(f"  {name:<16} (no baseline)")
+            continue
+        parts = []
+        for phase in PHASES:
+            if not old.get(phase):
+                continue
+            ratio = result[phase] / old[phase]
+            flag = ''
+            # Ignore noise on phases that take only a few milliseconds
+            if ratio > 1 + threshold and result[phase] - old[phase] > 0.005:
+                flag = ' REGRESSION'
+                regressed = True
+            parts.append(f"{phase} {ratio:5.2f}x{flag}")
+        print(f"  {name:<16} " + ', '.join(parts))
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark nb2pdf on synthetic notebooks')
+    parser.add_argument('--output', '-o', help='Write results JSON to this path')
+    parser.add_argument('--only', help='Comma-separated scenarios to run (default: all)')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per scenario; fastest is kept (default: 3)')
+    parser.add_argument('--scale', type=float, default=1.0, help='Multiply notebook sizes, e.g. 0.1 for a smoke run')
+    parser.add_argument('--compare', metavar='BASELINE', help='Compare against an earlier results JSON')
+    parser.add_argument('--threshold', type=float, default=0.10, help='Allowed slowdown ratio (default: 0.10)')
+    args = parser.parse_args()
+
+    names = args.only.split(',') if args.only else list(SCENARIOS)
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(unknown)}")
+
+    results = {
+        'commit': git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'scale': args.scale,
+        'repeat': args.repeat,
+        'results': {},
+    }
+
+    with tempfile.TemporaryDirectory(prefix='nb2pdf-bench-') as tmp:
+        workdir = Path(tmp)
+        # Keep the on-disk math cache inside the run so it starts cold
+        os.environ['NB2PDF_CACHE_DIR'] = str(workdir / 'cache')
+        print(f"{'scenario':<16} {'cells':>6} {'execute':>9} {'story':>9} {'build':>9} {'total':>9} {'KB':>8}")
+        for name in names:
+            if name == 'dataframe_heavy' and importlib.util.find_spec('pandas') is None:
+                print(f"{name:<16} skipped (pandas not installed)")
+                continue
+            result = run_scenario(name, args.scale, args.repeat, workdir)
+            results['results'][name] = result
+            print(f"{name:<16} {result['cells']:>6} {result['execute']:>8.3f}s {result['story']:>8.3f}s "
+                  f"{result['build']:>8.3f}s {result['total']:>8.3f}s {result['pdf_bytes'] / 1024:>8.1f}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to: {args.output}")
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        if compare(baseline, results, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+"""Tests for the batch subcommand"""
+
+import json
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import nb2pdf  # noqa: E402
+
+
+def _write_notebook(path, source):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    cell = {'cell_type': 'code', 'metadata': {}, 'source': source, 'outputs': [], 'execution_count': None}
+    path.write_text(json.dumps({'cells': [cell], 'metadata': {}, 'nbformat': 4, 'nbformat_minor': 5}))
+    return str(path)
+
+
+def _pdf_text(path):
+    pymupdf = pytest.importorskip('pymupdf')
+    with pymupdf.open(path) as doc:
+        return ''.join(page.get_text() for page in doc)
+
+
+def test_same_named_notebooks_get_distinct_pdfs(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    first = _write_notebook(tmp_path / 'b1' / 'x.ipynb', 'import builtins\nbuiltins.leaked = True\nprint("from b1")')
+    second = _write_notebook(tmp_path / 'b2' / 'x.ipynb',
+                             'import builtins\nprint("from b2", hasattr(builtins, "leaked"))')
+    nb2pdf.batch_main([first, second, '--output-dir', 'out', '--jobs', '1', '--preload', ''])
+    
+    assert sorted(path.name for path in (tmp_path / 'out').iterdir()) == ['x.pdf', 'x_2.pdf']
+    assert 'from b1' in _pdf_text(tmp_path / 'out' / 'x.pdf')
+    # Each notebook runs in a fresh forked worker
+    assert 'from b2 False' in _pdf_text(tmp_path / 'out' / 'x_2.pdf')
+
+
+def test_failures_are_reported_after_the_rest_convert(tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    good = _write_notebook(tmp_path / 'good.ipynb', 'print(1)')
+    bad = tmp_path / 'bad.ipynb'
+    bad.write_text('{not json')
+    with pytest.raises(SystemExit) as exit_info:
+        nb2pdf.batch_main([good, str(bad), '--preload', ''])
+    assert exit_info.value.code == 1
+    assert (tmp_path / 'good.pdf').exists()
+    assert '1 converted, 1 failed' in capsys.readouterr().out
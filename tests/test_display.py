@@ -0,0 +1,89 @@
+"""Tests for display() representations"""
+
+import sys
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import nb2pdf  # noqa: E402
+
+STYLES = nb2pdf.create_styles()
+PNG = (b'\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR\x00\x00\x00\x01\x00\x00\x00\x01\x08\x06\x00\x00\x00\x1f\x15\xc4'
+       b'\x89\x00\x00\x00\rIDATx\x9cc\xf8\xff\xff?\x00\x05\xfe\x02\xfe\xa7\x35\x81\x84\x00\x00\x00\x00IEND\xaeB`\x82')
+
+
+class Rich:
+    def __init__(self):
+        self.calls = []
+
+    def _repr_png_(self):
+        self.calls.append('png')
+        return PNG
+
+    def _repr_html_(self):
+        self.calls.append('html')
+        return '<b>html</b>'
+
+
+def _flowables(mime, data):
+    return nb2pdf.display_to_flowables(mime, data, STYLES, STYLES['Markdown'], STYLES['CellCode'],
+                                       STYLES['CellOutput'])
+
+
+def test_only_the_chosen_repr_is_computed():
+    obj = Rich()
+    assert nb2pdf.get_display_data(obj) == ('image/png', PNG)
+    assert obj.calls == ['png']
+
+
+def test_mimebundle_and_failing_reprs():
+    class Bundle:
+        def _repr_mimebundle_(self, include=None, exclude=None):
+            return {'text/markdown': '**md**'}, {}
+
+    class Broken:
+        def _repr_html_(self):
+            raise RuntimeError('no html')
+
+        def __repr__(self):
+            return 'Broken()'
+
+    assert nb2pdf.get_display_data(Bundle()) == ('text/markdown', '**md**')
+    assert nb2pdf.get_display_data(Broken()) == ('text/plain', 'Broken()')
+    assert nb2pdf.get_display_data(Rich) == ('text/plain', repr(Rich))
+
+
+def test_dataframes_are_cut_to_the_rendered_rows():
+    frame = pd.DataFrame({'a': range(500)})
+    mime, data = nb2pdf.get_display_data(frame)
+    assert mime == 'dataframe' and len(data) == nb2pdf.DATAFRAME_MAX_ROWS + 1
+
+
+def test_styler_renders_its_frame():
+    pytest.importorskip('jinja2')
+    mime, data = nb2pdf.get_display_data(pd.DataFrame({'a': range(500)}).style)
+    assert mime == 'dataframe' and len(data) == nb2pdf.DATAFRAME_MAX_ROWS + 1
+
+
+def test_html_table_becomes_a_table():
+    html = '<table><tr><th>a</th><th>b</th></tr><tr><td>1</td><td>2</td></tr></table>'
+    tables = [flowable for flowable in _flowables('text/html', html) if isinstance(flowable, nb2pdf.Table)]
+    assert len(tables) == 1
+    assert tables[0]._cellvalues[1][0] is not None
+
+
+def test_other_html_is_reduced_to_text():
+    flowables = _flowables('text/html', '<p>one</p><script>x()</script><p>two &amp; three</p>')
+    blocks = [flowable for flowable in flowables if isinstance(flowable, nb2pdf.MonospaceBlock)]
+    assert blocks[0].lines == ['one', 'two & three']
+
+
+def test_display_call_emits_events_in_order():
+    results = nb2pdf.execute_notebook({'cells': [{
+        'cell_type': 'code', 'metadata': {}, 'outputs': [], 'execution_count': None,
+        'source': 'import pandas as pd\nprint("before")\ndisplay(pd.DataFrame({"a": [1]}))\nprint("after")'}]})
+    assert [event.get('mime', event['type']) for event in results[0]['outputs']] == \
+        ['stream', 'dataframe', 'stream']
@@ -0,0 +1,100 @@
+"""Tests for notebook execution"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import nb2pdf  # noqa: E402
+
+
+def _notebook(*sources):
+    cells = [{'cell_type': 'code', 'metadata': {}, 'source': source, 'outputs': [], 'execution_count': None}
+             for source in sources]
+    return {'cells': cells, 'metadata': {}, 'nbformat': 4, 'nbformat_minor': 5}
+
+
+@pytest.mark.parametrize('source, expected', [
+    ('plt.plot([1]);', True),
+    ('x;  # done', True),
+    ('f(x);\n\n# trailing comment\n', True),
+    ('x', False),
+    ('x  # not this;', False),
+    ("'a;'", False),
+    ("s = 'a;'\ns", False),
+])
+def test_ends_with_semicolon(source, expected):
+    assert nb2pdf.ends_with_semicolon(source) is expected
+
+
+def test_trailing_semicolon_suppresses_display():
+    results = nb2pdf.execute_notebook(_notebook('1 + 1;', '1 + 2'))
+    assert results[0]['outputs'] == []
+    assert '3' in ''.join(event.get('text', '') for event in results[1]['outputs'])
+
+
+def test_snapshot_namespace_is_independent():
+    namespace = {}
+    nb2pdf.execute_notebook(_notebook('import math\nx = 0\nitems = []'), namespace=namespace)
+    snapshot = nb2pdf.snapshot_namespace(namespace)
+    nb2pdf.execute_notebook(_notebook('x += 1\nitems.append(x)'), namespace=namespace)
+    assert snapshot['x'] == 0 and snapshot['items'] == []
+    assert snapshot['math'] is namespace['math']
+
+
+def test_snapshot_namespace_gives_up_on_uncopyable_values():
+    assert nb2pdf.snapshot_namespace({'g': (i for i in range(3))}) is None
+
+
+def test_traceback_block_has_no_trailing_blank_line():
+    results = nb2pdf.execute_notebook(_notebook('1 / 0'))
+    story, _ = nb2pdf.build_story(results, nb2pdf.DEFAULT_CONFIG)
+    blocks = [flowable for flowable in story if isinstance(flowable, nb2pdf.MonospaceBlock)
+              and any('ZeroDivisionError' in line for line in flowable.lines)]
+    assert blocks and blocks[-1].lines[-1].strip()
+
+
+def _stdout(results):
+    return ''.join(event.get('text', '') for result in results for event in result['outputs'])
+
+
+def test_watch_session_resumes_from_a_single_snapshot():
+    session = nb2pdf.WatchSession()
+    session.run(_notebook('x = 0', 'x += 1\nprint(x)'))
+    results, executed, reused = session.run(_notebook('x = 0', 'x += 1\nprint("v2", x)'))
+    assert 'v2 1' in _stdout(results)
+    
+    results, executed, reused = session.run(_notebook('x = 0', 'x += 1\nprint("v3", x)'))
+    assert 'v3 1' in _stdout(results)
+    assert (executed, reused) == (1, 1)
+    index, snapshot = session.snapshot
+    assert index == 2 and snapshot['x'] == 0
+
+
+def test_watch_session_reruns_from_cell_1_when_namespace_is_too_large():
+    session = nb2pdf.WatchSession(max_snapshot_bytes=64 * 1024)
+    session.run(_notebook('data = bytearray(10**6)\nx = 0', 'x += 1\nprint(x)'))
+    for version in ('v2', 'v3'):
+        results, executed, reused = session.run(
+            _notebook('data = bytearray(10**6)\nx = 0', f'x += 1\nprint("{version}", x)'))
+        assert f'{version} 1' in _stdout(results)
+        assert (executed, reused) == (2, 0)
+        assert session.snapshot is None
+
+
+def test_snapshot_namespace_respects_size_limit():
+    namespace = {'items': [bytearray(1024) for _ in range(100)]}
+    assert nb2pdf.snapshot_namespace(namespace, max_bytes=10 * 1024) is None
+    assert nb2pdf.snapshot_namespace(namespace, max_bytes=1024 * 1024)['items'][0] == bytearray(1024)
+
+
+@pytest.mark.parametrize('close', ['plt.close(fig)', ''])
+def test_displayed_figure_is_rendered_once(close):
+    results = nb2pdf.execute_notebook(_notebook(
+        f'import matplotlib.pyplot as plt\nfig, ax = plt.subplots()\nax.plot([1, 2])\n'
+        f'display(fig)\n{close}\nprint("after")'))
+    outputs = results[0]['outputs']
+    assert [event['type'] for event in outputs] == ['display', 'stream']
+    assert outputs[0]['mime'] == 'image/png' and outputs[0]['data'].startswith(b'\x89PNG')
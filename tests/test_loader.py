@@ -0,0 +1,64 @@
+"""Tests for notebook loading"""
+
+import json
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import nb2pdf  # noqa: E402
+
+NOTEBOOK = {
+    'cells': [
+        {'cell_type': 'markdown', 'metadata': {}, 'source': ['# Title'],
+         'attachments': {'a.png': {'image/png': 'iVBORw0KGgo='}}},
+        {'cell_type': 'code', 'metadata': {'tags': ['x'], 'scale': 1.5}, 'source': ['print("é")'],
+         'execution_count': 3, 'outputs': [{'output_type': 'stream', 'name': 'stdout', 'text': ['é\n']}]},
+    ],
+    'metadata': {'kernelspec': {'name': 'python3'}},
+    'nbformat': 4,
+    'nbformat_minor': 5,
+}
+STRIPPED = json.loads(json.dumps(NOTEBOOK))
+for cell in STRIPPED['cells']:
+    cell.pop('outputs', None)
+    cell.pop('attachments', None)
+
+
+@pytest.fixture
+def notebook_file(tmp_path):
+    path = tmp_path / 'notebook.ipynb'
+    path.write_text(json.dumps(NOTEBOOK, ensure_ascii=False), encoding='utf-8')
+    return path
+
+
+@pytest.fixture(params=['orjson', 'json', 'ijson'])
+def loader(request, monkeypatch):
+    if request.param == 'json':
+        monkeypatch.setattr(nb2pdf, 'orjson', None)
+    elif request.param == 'orjson' and nb2pdf.orjson is None:
+        pytest.skip('orjson is not installed')
+    elif request.param == 'ijson':
+        if nb2pdf.ijson is None:
+            pytest.skip('ijson is not installed')
+        monkeypatch.setattr(nb2pdf, 'STREAMING_LOAD_BYTES', 0)
+    return request.param
+
+
+def test_saved_outputs_are_skipped(notebook_file, loader):
+    nb = nb2pdf.load_notebook(notebook_file)
+    assert nb == STRIPPED
+    assert isinstance(nb['cells'][1]['metadata']['scale'], float)
+
+
+def test_keep_outputs(notebook_file, loader):
+    assert nb2pdf.load_notebook(notebook_file, keep_outputs=True) == NOTEBOOK
+
+
+def test_invalid_json_raises_value_error(tmp_path, loader):
+    path = tmp_path / 'broken.ipynb'
+    path.write_text('{"cells": [')
+    with pytest.raises(ValueError):
+        nb2pdf.load_notebook(path)
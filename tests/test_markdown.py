@@ -0,0 +1,151 @@
+"""Tests for the inline markdown converter"""
+
+import re
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import nb2pdf  # noqa: E402
+
+STYLES = nb2pdf.create_styles()
+
+
+def assert_well_nested(markup):
+    open_tags = []
+    for closing, name in re.findall(r'<(/?)(\w+)[^>]*>', markup):
+        if closing:
+            assert open_tags and open_tags.pop() == name, markup
+        else:
+            open_tags.append(name)
+    assert not open_tags, markup
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('**bold** and *italic*', '<b>bold</b> and <i>italic</i>'),
+    ('__bold__ and _italic_', '<b>bold</b> and <i>italic</i>'),
+    ('~~gone~~', '<strike>gone</strike>'),
+    ('***both***', '<i><b>both</b></i>'),
+    ('*a **b** c*', '<i>a <b>b</b> c</i>'),
+    ('Compute **2*x** for each x*y pair.', 'Compute <b>2*x</b> for each x*y pair.'),
+    ('snake_case_name', 'snake_case_name'),
+    ('2 * 3 * 4', '2 * 3 * 4'),
+    ('~single~', '~single~'),
+    ('**unclosed', '**unclosed'),
+])
+def test_emphasis(text, expected):
+    assert nb2pdf.markdown_inline(text) == expected
+
+
+@pytest.mark.parametrize('text', [
+    'Compute **2*x** for each x*y pair.',
+    '**a *b** c*',
+    '~~a **b~~ c**',
+    '_emph ~~strike_ ~~',
+    '*a _b* c_',
+    '**[link *text**](https://example.com)*',
+    '***a** b* c**',
+])
+def test_overlapping_delimiters_nest(text):
+    markup = nb2pdf.markdown_inline(text)
+    assert_well_nested(markup)
+    nb2pdf.Paragraph(markup, STYLES['Markdown'])
+
+
+def test_code_spans_are_not_emphasised():
+    assert nb2pdf.markdown_inline('`a*b*c` *d*') == \
+        '<font face="Courier" color="#c7254e">a*b*c</font> <i>d</i>'
+
+
+def test_markup_is_escaped():
+    assert nb2pdf.markdown_inline('x < y & *z*') == 'x &lt; y &amp; <i>z</i>'
+
+
+def test_bad_markup_falls_back_to_plain_text():
+    paragraph = nb2pdf.markup_paragraph('<b>2<i>x</b> y</i>', STYLES['Markdown'])
+    assert paragraph.text == '2x y'
+
+
+def test_markdown_cell_with_overlapping_emphasis_renders():
+    flowables = nb2pdf.markdown_to_flowables('Compute **2*x** for each x*y pair.', STYLES,
+                                             STYLES['Markdown'], STYLES['CellCode'])
+    assert len(flowables) == 1
+
+
+@pytest.mark.parametrize('text, expected', [
+    (r'\*x\*', '*x*'),
+    (r'\_a\_ and \~~b\~~', '_a_ and ~~b~~'),
+    (r'\\*x*', r'\<i>x</i>'),
+    (r'\`not code\`', '`not code`'),
+    (r'\[label\](url)', '[label](url)'),
+    (r'\<b\> \& \#', '&lt;b&gt; &amp; #'),
+    (r'costs \$5 and \$6', 'costs $5 and $6'),
+    (r'`a\*b`', '<font face="Courier" color="#c7254e">a\\*b</font>'),
+    (r'\d is not an escape', r'\d is not an escape'),
+])
+def test_backslash_escapes(text, expected):
+    assert nb2pdf.markdown_inline(text) == expected
+
+
+@pytest.mark.parametrize('source, level, title', [
+    ('## Using C#', 2, 'Using C#'),
+    ('## #5', 2, '#5'),
+    ('### Issue #5 ###', 3, 'Issue #5'),
+    ('# Title #  ', 1, 'Title'),
+    ('# a#b', 1, 'a#b'),
+])
+def test_heading_closing_sequence(source, level, title):
+    assert nb2pdf.parse_markdown(source) == (('heading', level, title),)
+
+
+def test_block_parser():
+    source = '\n'.join([
+        '# Title',
+        'First line',
+        'second line  ',
+        'third line',
+        '',
+        '```python',
+        'x = 1',
+        '```',
+        '',
+        '---',
+        '| a | b |',
+        '|---|:-:|',
+        '| 1 | **2** |',
+        '',
+        '> quoted',
+        'lazily',
+        '',
+        '- one',
+        '  - nested',
+        '2. two',
+        '',
+        '$$',
+        'x^2',
+        '$$',
+    ])
+    assert nb2pdf.parse_markdown(source) == (
+        ('heading', 1, 'Title'),
+        ('paragraph', 'First line second line<br/>third line'),
+        ('code', 'python', 'x = 1'),
+        ('rule',),
+        ('table', [['a', 'b'], ['1', '<b>2</b>']]),
+        ('quote', 'quoted lazily'),
+        ('list', [(0, '•', 'one'), (1, '•', 'nested'), (0, '2.', 'two')]),
+        ('math', 'x^2'),
+    )
+
+
+def test_parsed_blocks_are_cached():
+    source = '# Cached\n\ntext'
+    assert nb2pdf.parse_markdown(source) is nb2pdf.parse_markdown(source)
+
+
+def test_every_block_type_renders():
+    source = '# T\n\np\n\n```\nc\n```\n\n---\n\n| a |\n|---|\n| 1 |\n\n> q\n\n- i\n\n$$x^2$$'
+    flowables = nb2pdf.markdown_to_flowables(source, STYLES, STYLES['Markdown'], STYLES['CellCode'])
+    kinds = {type(flowable).__name__ for flowable in flowables}
+    assert {'AnchoredParagraph', 'Paragraph', 'MonospaceBlock', 'HRFlowable', 'Table'} <= kinds
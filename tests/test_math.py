@@ -0,0 +1,71 @@
+"""Tests for LaTeX math rendering"""
+
+import io
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import nb2pdf  # noqa: E402
+
+STYLES = nb2pdf.create_styles()
+
+
+@pytest.fixture
+def math_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(nb2pdf, '_MATH_CACHE', {})
+    monkeypatch.setattr(nb2pdf, '_math_cache_dir', tmp_path)
+    monkeypatch.setattr(nb2pdf, '_math_private_dir', None)
+    return tmp_path
+
+
+def _build(flowables):
+    out = io.BytesIO()
+    nb2pdf.write_pdf(flowables, out)
+    return out.getvalue()
+
+
+def test_rendered_math_is_cached_on_disk(math_cache, monkeypatch):
+    path, width, height, depth = nb2pdf.render_math(r'\alpha^2')
+    assert Path(path).parent == math_cache and width > 0 and height > 0
+    
+    # A new process reads the PNG back with the same metrics
+    monkeypatch.setattr(nb2pdf, '_MATH_CACHE', {})
+    assert nb2pdf.render_math(r'\alpha^2') == (path, width, height, depth)
+
+
+def test_unparseable_math_falls_back_to_text(math_cache):
+    assert nb2pdf.render_math(r'\frac{') is None
+    assert nb2pdf.math_markup(r'\frac{') == r'<font face="Courier">$\frac{$</font>'
+
+
+def test_unwritable_cache_still_renders(tmp_path, monkeypatch):
+    blocker = tmp_path / 'not-a-directory'
+    blocker.write_text('')
+    monkeypatch.setattr(nb2pdf, '_MATH_CACHE', {})
+    monkeypatch.setattr(nb2pdf, '_math_cache_dir', blocker / 'math')
+    monkeypatch.setattr(nb2pdf, '_math_private_dir', None)
+    
+    path, _, _, _ = nb2pdf.render_math('x^2')
+    assert Path(path).exists()
+    flowables = nb2pdf.markdown_to_flowables('Inline $x^2$ and\n\n$$y^2$$', STYLES,
+                                             STYLES['Markdown'], STYLES['CellCode'])
+    assert _build(flowables).startswith(b'%PDF')
+
+
+def test_no_writable_location_falls_back_to_text(tmp_path, monkeypatch):
+    blocker = tmp_path / 'not-a-directory'
+    blocker.write_text('')
+    monkeypatch.setattr(nb2pdf, '_MATH_CACHE', {})
+    monkeypatch.setattr(nb2pdf, '_math_cache_dir', blocker / 'math')
+    monkeypatch.setattr(nb2pdf, '_math_private_dir', None)
+    
+    def read_only(**kwargs):
+        raise OSError('read-only file system')
+    
+    monkeypatch.setattr(tempfile, 'mkdtemp', read_only)
+    
+    assert nb2pdf.math_markup('x^2') == '<font face="Courier">$x^2$</font>'
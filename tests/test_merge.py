@@ -0,0 +1,57 @@
+"""Tests for --merge bundles"""
+
+import json
+import re
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import nb2pdf  # noqa: E402
+
+PLOT = 'import matplotlib.pyplot as plt\nplt.plot([1, 3, 2])\nplt.title("shared")'
+
+
+def _write_notebook(path, *cells):
+    cells = [{'cell_type': kind, 'metadata': {}, 'source': source, 'outputs': [], 'execution_count': None}
+             if kind == 'code' else {'cell_type': kind, 'metadata': {}, 'source': source}
+             for kind, source in cells]
+    path.write_text(json.dumps({'cells': cells, 'metadata': {}, 'nbformat': 4, 'nbformat_minor': 5}))
+    return path
+
+
+@pytest.fixture
+def bundle(tmp_path):
+    first = _write_notebook(tmp_path / 'first.ipynb', ('markdown', '# Intro'), ('code', PLOT))
+    second = _write_notebook(tmp_path / 'second.ipynb', ('code', PLOT), ('code', 'print("second")'))
+    broken = tmp_path / 'broken.ipynb'
+    broken.write_text('{not json')
+    return nb2pdf.merge_notebooks([first, broken, second], reproducible=True, bookmark_cells=True)
+
+
+def test_sections_outline_and_destinations(bundle):
+    pymupdf = pytest.importorskip('pymupdf')
+    with pymupdf.open(stream=bundle, filetype='pdf') as doc:
+        outline = [(level, title) for level, title, _ in doc.get_toc()]
+        pages = [page.get_text() for page in doc]
+    names = ['first.ipynb', 'broken.ipynb', 'second.ipynb']
+    assert [title for level, title in outline if level == 1] == names
+    assert (2, 'Intro') in outline
+    
+    # Every notebook starts a page, under its name; the contents page gives that page number
+    starts = {text.split('\n')[1]: number for number, text in enumerate(pages, 1) if number > 1}
+    assert list(starts) == names
+    for name, number in starts.items():
+        assert re.search(rf'{re.escape(name)}\n{number}\n', pages[0])
+    assert 'Could not convert this notebook' in pages[starts['broken.ipynb'] - 1]
+    assert 'second' in pages[-1]
+    
+    for destination in (b'notebook-1.cell-2', b'notebook-3.cell-2'):
+        assert destination in bundle
+
+
+def test_identical_images_are_stored_once(tmp_path, bundle):
+    single = nb2pdf.merge_notebooks([_write_notebook(tmp_path / 'one.ipynb', ('code', PLOT))])
+    assert bundle.count(b'/Subtype /Image') == single.count(b'/Subtype /Image') > 0
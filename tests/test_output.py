@@ -0,0 +1,64 @@
+"""Tests for PDF writing and --optimize"""
+
+import io
+import sys
+import threading
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import nb2pdf  # noqa: E402
+
+
+def _build(binary_streams):
+    results = nb2pdf.execute_notebook({'cells': [
+        {'cell_type': 'markdown', 'metadata': {}, 'source': '# Report\n\nSome *text*.'},
+        {'cell_type': 'code', 'metadata': {}, 'source': 'import matplotlib.pyplot as plt\n'
+                                                        'plt.plot([1, 3, 2])\nprint("done")',
+         'outputs': [], 'execution_count': None},
+    ]})
+    story, _ = nb2pdf.build_story(results, nb2pdf.DEFAULT_CONFIG)
+    out = io.BytesIO()
+    nb2pdf.write_pdf(story, out, reproducible=True, binary_streams=binary_streams)
+    return out.getvalue()
+
+
+def test_default_pdf_size_matches_default_build():
+    binary, default = _build(True), _build(False)
+    assert len(binary) < len(default)
+    assert abs(nb2pdf.default_pdf_size(binary) - len(default)) <= 2
+
+
+def test_optimize_without_pikepdf_names_skipped_flags(monkeypatch):
+    monkeypatch.setattr(nb2pdf, 'pikepdf', None)
+    messages = []
+    data = b'%PDF-1.4'
+    assert nb2pdf.optimize_pdf(data, {'compression_level': 6, 'linearize': True}, log=messages.append) is data
+    assert any('--compression-level 6' in message for message in messages)
+    assert any('--linearize' in message for message in messages)
+    
+    messages.clear()
+    nb2pdf.optimize_pdf(data, {'linearize': False}, log=messages.append)
+    assert len(messages) == 1
+
+
+def test_concurrent_builds_keep_their_own_settings():
+    measure = nb2pdf.rl_paragraph.stringWidth
+    outputs = {True: [], False: []}
+    
+    def build(binary_streams):
+        for _ in range(5):
+            story = [nb2pdf.Paragraph(f'word {n} ' * 40, nb2pdf.create_styles()['Normal']) for n in range(30)]
+            out = io.BytesIO()
+            nb2pdf.write_pdf(story, out, binary_streams=binary_streams)
+            outputs[binary_streams].append(out.getvalue())
+    
+    threads = [threading.Thread(target=build, args=(binary_streams,)) for binary_streams in (True, False) * 2]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert all(b'ASCII85Decode' not in pdf for pdf in outputs[True])
+    assert all(b'ASCII85Decode' in pdf for pdf in outputs[False])
+    assert len(outputs[True]) == len(outputs[False]) == 10
+    assert nb2pdf.rl_paragraph.stringWidth is measure and nb2pdf.rl_config.useA85
@@ -0,0 +1,117 @@
+"""Tests for progress events, cancellation and partial PDFs"""
+
+import json
+import signal
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import nb2pdf  # noqa: E402
+
+SCRIPT = Path(__file__).resolve().parent.parent / 'nb2pdf.py'
+
+
+def _notebook(*sources):
+    return {'cells': [
+        {'cell_type': 'markdown', 'metadata': {}, 'source': '# Progress'},
+        *({'cell_type': 'code', 'metadata': {}, 'source': source, 'outputs': [], 'execution_count': None}
+          for source in sources),
+    ]}
+
+
+def test_progress_reports_phases_cells_and_pages():
+    events = []
+    pdf = nb2pdf.convert(_notebook('x = 1', '1 / 0', 'print(x)'), progress=events.append)
+    assert pdf.startswith(b'%PDF')
+    
+    phases = [event['phase'] for event in events if event['event'] == 'phase']
+    assert phases == ['execute', 'layout']
+    starts = [event for event in events if event['event'] == 'cell_start']
+    ends = [event for event in events if event['event'] == 'cell_end']
+    assert [event['index'] for event in starts] == [1, 2, 3, 4]
+    assert all(event['cells'] == 4 for event in starts)
+    assert [(event['index'], event['error']) for event in ends] == [(1, False), (2, False), (3, True), (4, False)]
+    assert all(event['seconds'] >= 0 for event in ends)
+    pages = [event['page'] for event in events if event['event'] == 'page']
+    assert pages and pages[0] == 1
+    assert events.index(starts[0]) < events.index({'event': 'phase', 'phase': 'layout'})
+
+
+def test_cancel_without_partial_raises_without_pdf():
+    with pytest.raises(nb2pdf.ExecutionCancelled) as info:
+        nb2pdf.convert(_notebook('x = 1', 'raise KeyboardInterrupt', 'y = 2'))
+    assert not info.value.partial
+    assert info.value.pdf is None
+    assert [result['index'] for result in info.value.results] == [1, 2, 3, 4]
+
+
+def test_cancel_writes_partial_pdf():
+    pymupdf = pytest.importorskip('pymupdf')
+    
+    with pytest.raises(nb2pdf.ExecutionCancelled) as info:
+        nb2pdf.convert(_notebook('print("ran first")', 'raise KeyboardInterrupt', 'print("never ran")'),
+                       partial_on_cancel=True)
+    assert info.value.partial
+    with pymupdf.open(stream=info.value.pdf, filetype='pdf') as doc:
+        text = ''.join(page.get_text() for page in doc)
+    assert 'ran first' in text
+    assert 'KeyboardInterrupt' in text
+    assert 'print("never ran")' in text
+
+
+@pytest.mark.parametrize('reproducible', [False, True])
+def test_save_pdf_keeps_partial_pdf(tmp_path, reproducible):
+    target = tmp_path / 'report.pdf'
+    
+    def render(out):
+        return nb2pdf.convert(_notebook('raise KeyboardInterrupt'), out=out, reproducible=reproducible,
+                              partial_on_cancel=True)
+    
+    with pytest.raises(nb2pdf.ExecutionCancelled) as info:
+        nb2pdf.save_pdf(target, render, reproducible=reproducible, overwrite=True)
+    assert info.value.output == target
+    assert target.read_bytes().startswith(b'%PDF')
+    assert list(tmp_path.iterdir()) == [target]
+
+
+def test_save_pdf_removes_output_when_cancelled_without_partial(tmp_path):
+    target = tmp_path / 'report.pdf'
+    
+    def render(out):
+        return nb2pdf.convert(_notebook('raise KeyboardInterrupt'), out=out)
+    
+    with pytest.raises(nb2pdf.ExecutionCancelled):
+        nb2pdf.save_pdf(target, render, overwrite=True)
+    assert list(tmp_path.iterdir()) == []
+
+
+@pytest.mark.skipif(not hasattr(signal, 'SIGKILL'), reason='needs POSIX signals')
+def test_progress_json_cancels_on_sigint_even_when_ignored(tmp_path):
+    notebook = tmp_path / 'slow.ipynb'
+    notebook.write_text(json.dumps(_notebook('print("started")', 'import time\ntime.sleep(60)')))
+    output = tmp_path / 'slow.pdf'
+    
+    def ignore_sigint():
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+    
+    child = subprocess.Popen([sys.executable, str(SCRIPT), str(notebook), '-o', str(output), '--progress-json'],
+                             cwd=tmp_path, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                             text=True, preexec_fn=ignore_sigint)
+    try:
+        events = []
+        for line in child.stdout:
+            events.append(json.loads(line))
+            if events[-1] == {'event': 'cell_start', 'index': 3, 'cells': 3}:
+                child.send_signal(signal.SIGINT)
+                break
+        events.extend(json.loads(line) for line in child.stdout)
+        assert child.wait(timeout=30) == 130
+    finally:
+        child.kill()
+    
+    assert events[-1] == {'event': 'cancelled', 'output': str(output)}
+    assert output.read_bytes().startswith(b'%PDF')
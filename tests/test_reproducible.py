@@ -0,0 +1,77 @@
+"""Tests for --reproducible output and SOURCE_DATE_EPOCH"""
+
+import os
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import nb2pdf  # noqa: E402
+
+NOTEBOOK = {'cells': [
+    {'cell_type': 'markdown', 'metadata': {}, 'source': '# Report\n\nSome *text*.'},
+    {'cell_type': 'code', 'metadata': {}, 'source': 'import matplotlib.pyplot as plt\n'
+                                                    'plt.plot([1, 3, 2])\nprint("done")',
+     'outputs': [], 'execution_count': None},
+]}
+
+
+@pytest.fixture(autouse=True)
+def no_epoch(monkeypatch):
+    monkeypatch.delenv('SOURCE_DATE_EPOCH', raising=False)
+    monkeypatch.setattr(nb2pdf, '_IGNORED_EPOCHS', set())
+
+
+def test_reproducible_output_is_byte_identical():
+    first = nb2pdf.convert(NOTEBOOK, reproducible=True)
+    assert nb2pdf.convert(NOTEBOOK, reproducible=True) == first
+    assert nb2pdf.convert(NOTEBOOK) != first
+
+
+def test_source_date_epoch_sets_the_report_date(monkeypatch):
+    assert nb2pdf.get_report_date(reproducible=True) is None
+    undated = nb2pdf.convert(NOTEBOOK, reproducible=True)
+    
+    monkeypatch.setenv('SOURCE_DATE_EPOCH', '1700000000')
+    assert nb2pdf.get_report_date() == datetime(2023, 11, 14, 22, 13, 20, tzinfo=timezone.utc)
+    dated = nb2pdf.convert(NOTEBOOK, reproducible=True)
+    assert dated != undated
+    assert nb2pdf.convert(NOTEBOOK, reproducible=True) == dated
+    
+    monkeypatch.setenv('SOURCE_DATE_EPOCH', '1800000000')
+    assert nb2pdf.convert(NOTEBOOK, reproducible=True) != dated
+
+
+@pytest.mark.parametrize('value', ['abc', '1.5e9'])
+def test_malformed_source_date_epoch_is_ignored(monkeypatch, capsys, value):
+    monkeypatch.setenv('SOURCE_DATE_EPOCH', value)
+    assert nb2pdf.get_report_date(reproducible=True) is None
+    assert isinstance(nb2pdf.get_report_date(), datetime)
+    
+    pdf = nb2pdf.convert(NOTEBOOK, reproducible=True)
+    assert pdf.startswith(b'%PDF')
+    assert os.environ['SOURCE_DATE_EPOCH'] == value
+    
+    err = capsys.readouterr().err
+    assert err.count('[WARN] Ignoring SOURCE_DATE_EPOCH') == 1
+    assert value in err
+    
+    monkeypatch.delenv('SOURCE_DATE_EPOCH')
+    assert nb2pdf.convert(NOTEBOOK, reproducible=True) == pdf
+
+
+def test_save_pdf_leaves_unchanged_output_untouched(tmp_path, capsys):
+    target = tmp_path / 'report.pdf'
+    
+    def render(out):
+        return nb2pdf.convert(NOTEBOOK, out=out, reproducible=True)
+    
+    assert nb2pdf.save_pdf(target, render, reproducible=True) == target
+    os.utime(target, (0, 0))
+    assert nb2pdf.save_pdf(target, render, reproducible=True) == target
+    assert target.stat().st_mtime == 0
+    assert 'Output unchanged' in capsys.readouterr().out
+    assert list(tmp_path.iterdir()) == [target]
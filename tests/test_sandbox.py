@@ -0,0 +1,66 @@
+"""Tests for --sandbox resource limits"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import nb2pdf  # noqa: E402
+
+pytestmark = pytest.mark.skipif(nb2pdf.resource is None, reason='needs the resource module')
+
+NO_LIMITS = dict.fromkeys(nb2pdf.DEFAULT_SANDBOX_LIMITS, 0)
+
+
+def _notebook(*sources):
+    cells = [{'cell_type': 'code', 'metadata': {}, 'source': source, 'outputs': [], 'execution_count': None}
+             for source in sources]
+    return {'cells': cells, 'metadata': {}, 'nbformat': 4, 'nbformat_minor': 5}
+
+
+def _run(limits, *sources):
+    return nb2pdf.execute_sandboxed(_notebook(*sources), {**NO_LIMITS, **limits})
+
+
+def _stdout(result):
+    return ''.join(event.get('text', '') for event in result['outputs'])
+
+
+def test_memory_limit_fails_only_the_cell():
+    results = _run({'memory_mb': 1024}, 'x = bytearray(8 * 1024**3)', 'print("after")')
+    assert 'MemoryError' in results[0]['error']
+    assert _stdout(results[1]) == 'after\n'
+
+
+def test_file_size_and_open_file_limits(tmp_path):
+    results = _run({'file_size_mb': 1, 'open_files': 64},
+                   f'open({str(tmp_path / "big")!r}, "wb").write(bytes(2 * 1024**2))',
+                   f'files = [open({str(tmp_path / "big")!r}, "rb") for _ in range(100)]',
+                   'print("after")')
+    assert 'File too large' in results[0]['error']
+    assert 'Too many open files' in results[1]['error']
+    assert _stdout(results[2]) == 'after\n'
+
+
+def test_cpu_limit_stops_execution_and_keeps_earlier_cells():
+    results = _run({'cpu_seconds': 1}, 'print("before")', 'while True:\n    pass', 'print("never")')
+    assert _stdout(results[0]) == 'before\n'
+    assert 'CPU time limit of 1s exceeded' in results[1]['error']
+    assert [result['index'] for result in results] == [1, 2, 3]
+    assert _stdout(results[2]) == ''
+
+
+def test_killed_child_is_reported_on_the_running_cell():
+    results = _run({}, 'print("before")', 'import os, signal\nos.kill(os.getpid(), signal.SIGKILL)',
+                   'print("never")')
+    assert _stdout(results[0]) == 'before\n'
+    assert 'killed by SIGKILL' in results[1]['error']
+    assert not results[2].get('error')
+
+
+def test_limits_do_not_leak_into_the_parent():
+    before = nb2pdf.resource.getrlimit(nb2pdf.resource.RLIMIT_AS)
+    _run({'memory_mb': 512}, 'x = 1')
+    assert nb2pdf.resource.getrlimit(nb2pdf.resource.RLIMIT_AS) == before
@@ -0,0 +1,62 @@
+"""Tests for --cells selection and Jupyter cell tags"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import nb2pdf  # noqa: E402
+
+
+def _cell(source, *tags):
+    return {'cell_type': 'code', 'metadata': {'tags': list(tags)}, 'source': source, 'outputs': [],
+            'execution_count': None}
+
+
+def _pdf_text(pdf):
+    pymupdf = pytest.importorskip('pymupdf')
+    with pymupdf.open(stream=pdf, filetype='pdf') as doc:
+        return ''.join(page.get_text() for page in doc)
+
+
+@pytest.mark.parametrize('spec, expected', [
+    ('3', {3}),
+    ('1-3,7', {1, 2, 3, 7}),
+    (' 2 - 4 , ,9', {2, 3, 4, 9}),
+])
+def test_parse_cell_ranges(spec, expected):
+    assert nb2pdf.parse_cell_ranges(spec) == expected
+
+
+@pytest.mark.parametrize('spec', ['0', '4-2', 'a', '1-x'])
+def test_parse_cell_ranges_rejects(spec):
+    with pytest.raises(ValueError):
+        nb2pdf.parse_cell_ranges(spec)
+
+
+def test_deselected_cells_are_not_executed():
+    nb = {'cells': [_cell('ran = [1]'), _cell('ran.append(2)'), _cell('ran.append(3)\nprint(ran)')]}
+    results = nb2pdf.execute_notebook(nb, select={1, 3})
+    assert [result['index'] for result in results] == [1, 3]
+    assert results[1]['outputs'][0]['text'] == '[1, 3]\n'
+
+
+def test_tags():
+    nb = {'cells': [
+        _cell('print("skipped")', 'skip-execution'),
+        _cell('print("no input")', 'remove-input'),
+        _cell('print("no output")', 'hide-output'),
+        _cell('print("no cell")', 'remove-cell'),
+    ]}
+    results = nb2pdf.execute_notebook(nb)
+    assert results[0]['outputs'] == []
+    assert [result['hidden'] for result in results] == [(), ('input',), ('output',), ('input', 'output')]
+    assert results[3]['outputs'][0]['text'] == 'no cell\n'
+    
+    text = _pdf_text(nb2pdf.convert(nb))
+    assert 'print("skipped")' in text
+    assert 'print("no input")' not in text and 'no input\n' in text
+    assert 'print("no output")' in text and 'no output\n' not in text
+    assert 'no cell' not in text
@@ -0,0 +1,149 @@
+"""Tests for the HTTP conversion service"""
+
+import http.client
+import json
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import nb2pdf  # noqa: E402
+
+NOTEBOOK = {'cells': [{'cell_type': 'markdown', 'metadata': {}, 'source': '# Hi'}],
+            'metadata': {}, 'nbformat': 4, 'nbformat_minor': 5}
+
+
+class FakePool:
+    """Stands in for ConversionPool so handler tests need no worker processes"""
+    def __init__(self, error=None, options=None):
+        self.error = error
+        self.options = options or {}
+        self.jobs = []
+
+    def submit(self, notebook, config=None):
+        self.jobs.append((notebook, config))
+        if self.error:
+            raise self.error
+        return b'%PDF-1.4 fake'
+
+    def metrics(self):
+        return {'completed': len(self.jobs)}
+
+
+@pytest.fixture
+def serve():
+    servers = []
+
+    def start(pool, max_body=1024 * 1024):
+        server = nb2pdf.ThreadingHTTPServer(('127.0.0.1', 0), nb2pdf.ConversionRequestHandler)
+        server.pool = pool
+        server.max_body = max_body
+        threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+        servers.append(server)
+        return server.server_port
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def request(port, method, path, body=None, headers=None):
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+    if body is not None and not isinstance(body, bytes):
+        body = json.dumps(body).encode('utf-8')
+    connection.request(method, path, body=body, headers=headers or {})
+    response = connection.getresponse()
+    data = response.read()
+    connection.close()
+    return response.status, dict(response.getheaders()), data
+
+
+@pytest.mark.parametrize('body', [
+    b'not json',
+    [1],
+    {'cells': [1]},
+    {'cells': 'x'},
+    {'notebook': {'cells': [None]}},
+    {'notebook': NOTEBOOK, 'config': [1]},
+    {'notebook': NOTEBOOK, 'config': 'name'},
+    {'notebook': NOTEBOOK, 'config': {'name': 1}},
+    {'notebook': NOTEBOOK, 'config': {'project_title': None}},
+])
+def test_bad_requests_get_400(serve, body):
+    pool = FakePool()
+    status, _, data = request(serve(pool), 'POST', '/convert', body)
+    assert status == 400
+    assert 'error' in json.loads(data)
+    assert pool.jobs == []
+
+
+def test_convert_strips_saved_outputs(serve):
+    pool = FakePool()
+    notebook = {'cells': [{'cell_type': 'code', 'metadata': {}, 'source': '1', 'execution_count': 1,
+                           'outputs': [{'output_type': 'stream', 'text': 'x'}]}]}
+    status, headers, data = request(serve(pool), 'POST', '/convert',
+                                    {'notebook': notebook, 'config': {'name': 'Ada'}})
+    assert status == 200 and headers['Content-Type'] == 'application/pdf' and data.startswith(b'%PDF')
+    (sent, config), = pool.jobs
+    assert 'outputs' not in sent['cells'][0] and config == {'name': 'Ada'}
+
+
+@pytest.mark.parametrize('error, status', [
+    (nb2pdf.QueueFullError('full'), 429),
+    (TimeoutError('too slow'), 504),
+    (nb2pdf.ConversionError('boom'), 500),
+])
+def test_pool_errors_map_to_status(serve, error, status):
+    got, headers, _ = request(serve(FakePool(error)), 'POST', '/convert', NOTEBOOK)
+    assert got == status
+    if status == 429:
+        assert headers['Retry-After'] == '1'
+
+
+def test_body_limit_and_routes(serve):
+    port = serve(FakePool(), max_body=16)
+    assert request(port, 'POST', '/convert', NOTEBOOK)[0] == 413
+    assert request(port, 'POST', '/other', {})[0] == 404
+    assert request(port, 'GET', '/health')[0] == 200
+    assert json.loads(request(port, 'GET', '/metrics')[2]) == {'completed': 0}
+
+
+def test_reproducible_responses_carry_an_etag(serve):
+    port = serve(FakePool(options={'reproducible': True}))
+    status, headers, _ = request(port, 'POST', '/convert', NOTEBOOK)
+    assert status == 200
+    status, _, data = request(port, 'POST', '/convert', NOTEBOOK, {'If-None-Match': headers['ETag']})
+    assert status == 304 and data == b''
+
+
+def test_pool_rejects_and_times_out():
+    pool = nb2pdf.ConversionPool(workers=1, queue_size=0, timeout=2)
+    slow = {'cells': [{'cell_type': 'code', 'metadata': {}, 'source': 'import time\ntime.sleep(30)',
+                       'outputs': [], 'execution_count': None}]}
+    errors = []
+
+    def submit_slow():
+        try:
+            pool.submit(slow)
+        except TimeoutError as e:
+            errors.append(e)
+
+    try:
+        thread = threading.Thread(target=submit_slow)
+        thread.start()
+        while not pool.in_flight:
+            time.sleep(0.01)
+        with pytest.raises(nb2pdf.QueueFullError):
+            pool.submit(NOTEBOOK)
+        thread.join()
+        assert len(errors) == 1
+        assert pool.submit(NOTEBOOK).startswith(b'%PDF')
+        metrics = pool.metrics()
+        assert (metrics['rejected'], metrics['timeouts'], metrics['completed']) == (1, 1, 1)
+    finally:
+        pool.close()
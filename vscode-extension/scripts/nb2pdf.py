@@ -8,6 +8,11 @@ Usage:
     python nb2pdf.py <notebook.ipynb> --output myreport.pdf
     python nb2pdf.py <notebook.ipynb> --config student_info.json
 
+Library usage:
+    import nb2pdf
+    pdf_bytes = nb2pdf.convert(notebook_dict, {'name': 'Jane Doe'})
+    nb2pdf.convert('analysis.ipynb', config, out=open('report.pdf', 'wb'))
+
 Author: Generated for IITM students
 License: Free to use and share
 """
@@ -22,15 +27,60 @@ import io
 import argparse
 import re
 import os
+import hashlib
+import zlib
+import ast
+import copy
+import tokenize
+import types
+import time
+import tracemalloc
+import base64
+import signal
+import threading
+import queue
+import collections
+import multiprocessing
+import unicodedata
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+try:
+    import resource  # Unix only; used by the execution sandbox
+except ImportError:
+    resource = None
+from html import unescape as unescape_html
+from html.parser import HTMLParser
 from pathlib import Path
-from datetime import datetime
+from datetime import datetime, timezone
 from reportlab.lib.pagesizes import A4
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import cm
 from reportlab.lib import colors
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, PageBreak, Table, TableStyle, Preformatted
+from reportlab import rl_config
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, PageBreak, Table, TableStyle
+from reportlab.platypus import Image as RLImage
+from reportlab.platypus.flowables import HRFlowable, Flowable
+from reportlab.platypus import paragraph as rl_paragraph, tables as rl_tables
+from reportlab.pdfbase.pdfmetrics import stringWidth, registerFont, getFont
+from reportlab.pdfbase.ttfonts import TTFont
+
+# Optional fast JSON parsers used by load_notebook()
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+# Optional PDF rewriter (qpdf bindings) used by optimize_pdf()
+try:
+    import pikepdf
+except ImportError:
+    pikepdf = None
 from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_RIGHT
 from reportlab.pdfgen import canvas
+from reportlab.pdfbase import pdfdoc
 
 
 def get_unique_output_path(output_path):
@@ -63,19 +113,101 @@ class NumberedCanvas(canvas.Canvas):
     def __init__(self, *args, **kwargs):
         canvas.Canvas.__init__(self, *args, **kwargs)
         self.pages = []
+        # Filled in by AnchoredParagraph and TableOfContents during layout. Pages
+        # are only emitted in save(), so destinations are created there too
+        self.outline = []
+        self.toc_blocks = []
 
     def showPage(self):
-        self.pages.append(dict(self.__dict__))
+        # Keep finished pages compressed until save(); their drawing
+        # operators are the bulk of layout memory on long documents
+        state = dict(self.__dict__)
+        state['_code'] = zlib.compress('\n'.join(self._code).encode('utf-8', 'surrogatepass'), 1)
+        self.pages.append(state)
         self._startPage()
 
     def save(self):
         page_count = len(self.pages)
+        outline = self.resolve_outline()
+        entry_pages = {}
+        page_anchors = collections.defaultdict(list)
+        for page, key, title, level, y in outline:
+            entry_pages.setdefault(key, page)
+            page_anchors[page].append((key, title, level, y))
+        page_tocs = collections.defaultdict(list)
+        for page, *block in self.toc_blocks:
+            page_tocs[page].append(block)
         for page_num in range(page_count):
             self.__dict__.update(self.pages[page_num])
+            self._code = [zlib.decompress(self._code).decode('utf-8', 'surrogatepass')]
+            self.pages[page_num] = None
             self.draw_page_number(page_num + 1, page_count)
+            for x, y, width, entries, style in page_tocs[page_num + 1]:
+                self.draw_toc(x, y, width, entries, style, entry_pages)
+            for key, title, level, y in page_anchors[page_num + 1]:
+                self.bookmarkHorizontal(key, 0, y)
+                if title is not None:
+                    self.addOutlineEntry(title, key, level)
             canvas.Canvas.showPage(self)
+        if any(title is not None for _, _, title, _, _ in outline):
+            self.showOutline()
+        if outline:
+            # reportlab resolves destinations inline; a /Dests dictionary also
+            # lets viewers open report.pdf#cell-12 by name
+            self._doc.Catalog.Dests = pdfdoc.PDFDictionary(
+                {key: self._destinations[key] for _, key, _, _, _ in outline})
         canvas.Canvas.save(self)
 
+    def resolve_outline(self):
+        """Turn recorded anchor depths into outline levels and unique keys.
+        
+        Levels nest by depth: an entry goes under the closest earlier entry
+        with a smaller depth, and depth None goes under the latest entry.
+        Repeated keys (e.g. two "Results" headings) get a -2, -3... suffix.
+        """
+        resolved = []
+        open_depths = []
+        seen = {}
+        for page, key, title, depth, y in self.outline:
+            if depth is None:
+                level = len(open_depths)
+            else:
+                while open_depths and open_depths[-1] >= depth:
+                    open_depths.pop()
+                level = len(open_depths)
+                open_depths.append(depth)
+            if key in seen:
+                seen[key] += 1
+                key = f"{key}-{seen[key]}"
+            else:
+                seen[key] = 1
+            resolved.append((page, key, title, level, y))
+        return resolved
+
+    def draw_toc(self, x, y, width, entries, style, entry_pages):
+        """Draw table of contents lines (title, dot leaders, page) linked to their entries"""
+        self.setFont(style.fontName, style.fontSize)
+        self.setFillColor(style.textColor)
+        for title, key in entries:
+            y -= style.leading
+            page = str(entry_pages.get(key, ''))
+            page_width = self.stringWidth(page, style.fontName, style.fontSize)
+            # Titles may need fallback fonts; draw them run by run
+            title_width = 0
+            for font, run in font_runs(title, style.fontName):
+                self.setFont(font, style.fontSize)
+                self.drawString(x + title_width, y, run)
+                title_width += self.stringWidth(run, font, style.fontSize)
+            self.setFont(style.fontName, style.fontSize)
+            self.drawRightString(x + width, y, page)
+            dot_width = self.stringWidth(' .', style.fontName, style.fontSize)
+            dots = int((width - title_width - page_width - dot_width) // dot_width)
+            if dots > 0:
+                self.drawRightString(x + width - page_width - dot_width / 2, y, ' .' * dots)
+            if page:
+                # Restoring page state rewinds the annotation counter, so name them here
+                self.linkRect('', key, (x, y - 2, x + width, y + style.fontSize), name=f'TOC.{key}', relative=0)
+
     def draw_page_number(self, page_num, page_count):
         self.setFont("Helvetica", 9)
         self.setFillColorRGB(0, 0, 0)
@@ -86,6 +218,459 @@ class NumberedCanvas(canvas.Canvas):
         )
 
 
+class AnchoredParagraph(Paragraph):
+    """Paragraph that adds named destinations, and outline entries, at its top.
+    
+    Anchoring to the paragraph itself keeps the destination on the page the
+    text lands on, without a keepWithNext group around every cell header.
+    
+    Args:
+        anchors: List of (key, title, depth). key is the destination name,
+            so links like report.pdf#key open this spot; title is the
+            outline text, or None for a destination only; depth is 0 for
+            notebooks in a merged PDF, 1-6 for markdown headings, or None
+            to nest under the previous entry (see resolve_outline())
+    """
+    
+    def __init__(self, text, style=None, anchors=(), **kwargs):
+        Paragraph.__init__(self, text, style, **kwargs)
+        self.anchors = anchors
+    
+    def split(self, availWidth, availHeight):
+        parts = Paragraph.split(self, availWidth, availHeight)
+        if parts:
+            parts[0].anchors = self.anchors
+        return parts
+    
+    def draw(self):
+        outline = getattr(self.canv, 'outline', None)
+        if outline is not None and self.anchors:
+            _, y = self.canv.absolutePosition(0, self.height)
+            page = self.canv.getPageNumber()
+            for key, title, depth in self.anchors:
+                outline.append((page, key, title, depth, y))
+        Paragraph.draw(self)
+
+
+# Process-wide layout memos. Notebooks measure the same words (keywords,
+# identifiers, table values) and lay out the same code lines over and over,
+# and reportlab's metrics are pure Python.
+_WIDTH_CACHE = {}
+_WIDTH_CACHE_SIZE = 65536
+_WRAP_CACHE = {}
+_WRAP_CACHE_SIZE = 4096
+_LAYOUT_CACHE_STATS = collections.Counter()
+# write_pdf() patches reportlab module globals for the length of a build;
+# builds hold this lock so concurrent ones never see each other's patches.
+# Reentrant, since a notebook cell may itself convert a notebook.
+_BUILD_LOCK = threading.RLock()
+
+
+def string_width(text, font_name, font_size, encoding='utf8'):
+    """pdfmetrics.stringWidth() memoized on (text, font, size).
+    
+    write_pdf() installs it in reportlab's paragraph and table modules for
+    the duration of a build, so line breaking and column sizing use it.
+    Only builds call it, so _BUILD_LOCK also covers the memo's eviction.
+    """
+    key = (text, font_name, font_size)
+    width = _WIDTH_CACHE.get(key)
+    if width is not None:
+        _LAYOUT_CACHE_STATS['width_hits'] += 1
+        return width
+    _LAYOUT_CACHE_STATS['width_misses'] += 1
+    if len(_WIDTH_CACHE) >= _WIDTH_CACHE_SIZE:
+        _WIDTH_CACHE.pop(next(iter(_WIDTH_CACHE)))
+    width = _WIDTH_CACHE[key] = stringWidth(text, font_name, font_size, encoding)
+    return width
+
+
+def layout_cache_stats():
+    """Snapshot of the width and wrap memo counters, for diffing around a build"""
+    return {key: _LAYOUT_CACHE_STATS[key] for key in ('width_hits', 'width_misses', 'wrap_hits', 'wrap_misses')}
+
+
+# The base-14 fonts only draw WinAnsi characters. Everything else goes to
+# TrueType fallback fonts, which reportlab embeds as subsets of the glyphs
+# used. (regular, bold) file names in order of preference; files listed in
+# NB2PDF_FONTS (os.pathsep separated) come first.
+_FALLBACK_FONT_FILES = {
+    'sans': (
+        ('DejaVuSans.ttf', 'DejaVuSans-Bold.ttf'),
+        ('NotoSans-Regular.ttf', 'NotoSans-Bold.ttf'),
+        ('Arial Unicode.ttf', None),
+        ('DroidSansFallbackFull.ttf', None),
+        ('NotoSansSymbols2-Regular.ttf', None),
+        ('NotoEmoji-Regular.ttf', None),
+        ('Symbola.ttf', None),
+        ('seguisym.ttf', None),
+    ),
+    'mono': (
+        ('DejaVuSansMono.ttf', 'DejaVuSansMono-Bold.ttf'),
+        ('NotoSansMono-Regular.ttf', 'NotoSansMono-Bold.ttf'),
+    ),
+}
+_FONT_DIRS = ('/usr/share/fonts', '/usr/local/share/fonts', '~/.local/share/fonts', '~/.fonts',
+              '/Library/Fonts', '/System/Library/Fonts', '~/Library/Fonts')
+_WINANSI_CHARS = frozenset(bytes(range(256)).decode('cp1252', 'ignore'))
+_MARKUP_TAG = re.compile(r'(<[^>]*>)')
+
+# Built once per process: font file index, registered fonts, and per
+# character fallback maps, so layout only does dictionary lookups
+_FONT_FILES = None
+_TTF_FONTS = {}
+_FALLBACK_MAPS = {}
+_FONT_RUNS_CACHE = {}
+_FONT_RUNS_CACHE_SIZE = 4096
+
+
+def _find_font_files():
+    """Index .ttf files in the system font folders and matplotlib's by lower-case name"""
+    global _FONT_FILES
+    if _FONT_FILES is None:
+        dirs = [os.path.expanduser(d) for d in _FONT_DIRS]
+        if os.name == 'nt':
+            dirs.append(os.path.join(os.environ.get('WINDIR', r'C:\Windows'), 'Fonts'))
+            dirs.append(os.path.join(os.environ.get('LOCALAPPDATA', ''), 'Microsoft', 'Windows', 'Fonts'))
+        # matplotlib ships DejaVu Sans and Sans Mono, so there is always a fallback
+        dirs.append(os.path.join(matplotlib.get_data_path(), 'fonts', 'ttf'))
+        files = {}
+        for directory in dirs:
+            for root, _, names in os.walk(directory):
+                for name in names:
+                    if name.lower().endswith('.ttf'):
+                        files.setdefault(name.lower(), os.path.join(root, name))
+        _FONT_FILES = files
+    return _FONT_FILES
+
+
+def _register_ttf(path):
+    """Register a TrueType font under its file stem; None if it cannot be loaded"""
+    if path not in _TTF_FONTS:
+        name = Path(path).stem
+        try:
+            registerFont(TTFont(name, path))
+        except Exception as e:
+            print(f"[WARN] Could not load font {path}: {e}")
+            name = None
+        _TTF_FONTS[path] = name
+    return _TTF_FONTS[path]
+
+
+def fallback_fonts(kind='sans'):
+    """Per-character fallback fonts, built on first use and kept for the process.
+    
+    Args:
+        kind: 'sans' for text set in Helvetica, 'mono' for Courier, which
+            prefers monospaced fallbacks before the sans ones.
+    
+    Returns:
+        dict mapping every non-WinAnsi character that some fallback font can
+        draw to the (regular, bold) names of the first such font.
+    """
+    fonts = _FALLBACK_MAPS.get(kind)
+    if fonts is not None:
+        return fonts
+    candidates = [(path, None) for path in os.environ.get('NB2PDF_FONTS', '').split(os.pathsep) if path]
+    files = _find_font_files()
+    preferred = _FALLBACK_FONT_FILES[kind] + (_FALLBACK_FONT_FILES['sans'] if kind == 'mono' else ())
+    for regular, bold in preferred:
+        if regular.lower() in files:
+            candidates.append((files[regular.lower()], bold and files.get(bold.lower())))
+    fonts = {}
+    for regular, bold in candidates:
+        regular = _register_ttf(regular)
+        if regular is None:
+            continue
+        names = (regular, (bold and _register_ttf(bold)) or regular)
+        for code in getFont(regular).face.charToGlyph:
+            char = chr(code)
+            if char not in _WINANSI_CHARS:
+                fonts.setdefault(char, names)
+    _FALLBACK_MAPS[kind] = fonts
+    return fonts
+
+
+def font_runs(text, font_name, kind='sans'):
+    """Split plain text into (font name, text) runs for canvas drawing.
+    
+    Characters font_name cannot draw get their fallback font; ones no
+    font covers stay in font_name. Results are memoized per string.
+    """
+    if text.isascii():
+        return ((font_name, text),)
+    key = (text, font_name, kind)
+    runs = _FONT_RUNS_CACHE.get(key)
+    if runs is None:
+        fonts = fallback_fonts(kind)
+        bold = 'Bold' in font_name
+        runs = []
+        for char in text:
+            names = fonts.get(char)
+            font = names[bold] if names else font_name
+            if runs and runs[-1][0] == font:
+                runs[-1][1].append(char)
+            else:
+                runs.append((font, [char]))
+        if len(_FONT_RUNS_CACHE) >= _FONT_RUNS_CACHE_SIZE:
+            _FONT_RUNS_CACHE.pop(next(iter(_FONT_RUNS_CACHE)))
+        runs = _FONT_RUNS_CACHE[key] = tuple((font, ''.join(chars)) for font, chars in runs)
+    return runs
+
+
+def font_fallback_markup(markup, font_name='Helvetica'):
+    """Wrap characters the base-14 fonts cannot draw in <font face> tags.
+    
+    Args:
+        markup: Paragraph markup; tags are copied unchanged.
+        font_name: The paragraph style's font. The bold fallback is used
+            when it is bold and inside <b> tags.
+    """
+    if markup.isascii():
+        return markup
+    fonts = fallback_fonts()
+    bold = 'Bold' in font_name
+    depth = 0
+    parts = []
+    for index, piece in enumerate(_MARKUP_TAG.split(markup)):
+        if index % 2:
+            # A tag; track <b> nesting and copy it as is
+            if piece == '<b>':
+                depth += 1
+            elif piece == '</b>':
+                depth -= 1
+            parts.append(piece)
+            continue
+        if piece.isascii():
+            parts.append(piece)
+            continue
+        current = None
+        for char in piece:
+            names = fonts.get(char)
+            font = names[bold or depth > 0] if names else None
+            if font != current:
+                if current:
+                    parts.append('</font>')
+                if font:
+                    parts.append(f'<font face="{font}">')
+                current = font
+            parts.append(char)
+        if current:
+            parts.append('</font>')
+    return ''.join(parts)
+
+
+def _line_breaks(text, font_name, font_size, width):
+    """Offsets where a monospace line wraps to fit `width` points.
+    
+    ASCII lines break every floor(width / advance) characters. Other lines
+    are measured a character at a time in the font that draws it, since a
+    fallback glyph need not be one column wide; those breaks are memoized
+    in _WRAP_CACHE.
+    """
+    if text.isascii():
+        cols = max(int(width // string_width(' ', font_name, font_size)), 1)
+        return range(cols, len(text), cols)
+    key = (text, font_name, font_size, width)
+    breaks = _WRAP_CACHE.get(key)
+    if breaks is not None:
+        _LAYOUT_CACHE_STATS['wrap_hits'] += 1
+        return breaks
+    _LAYOUT_CACHE_STATS['wrap_misses'] += 1
+    breaks = []
+    used = 0
+    i = 0
+    for font, run in font_runs(text, font_name, 'mono'):
+        for char in run:
+            advance = string_width(char, font, font_size)
+            if used + advance > width and i > (breaks[-1] if breaks else 0):
+                breaks.append(i)
+                used = 0
+            used += advance
+            i += 1
+    if len(_WRAP_CACHE) >= _WRAP_CACHE_SIZE:
+        _WRAP_CACHE.pop(next(iter(_WRAP_CACHE)))
+    _WRAP_CACHE[key] = breaks = tuple(breaks)
+    return breaks
+
+
+class MonospaceBlock(Flowable):
+    """Lines of code or output drawn directly with the canvas text API.
+    
+    Every character sits in a fixed-width column, so wrapping is column
+    arithmetic instead of Paragraph markup parsing and word fitting, and
+    whitespace is kept as written. Long lines wrap at the right edge; the
+    block splits between rows across pages and draws one background for
+    all of its rows, like a Preformatted with the style's backColor.
+    
+    Args:
+        lines: Each line is either a string, drawn in the style's textColor,
+            or a list of (text, color) runs such as highlight_python() makes.
+        style: ParagraphStyle supplying font, leading, indents, colors,
+            borderPadding and spaceBefore/spaceAfter.
+    """
+    
+    def __init__(self, lines, style):
+        Flowable.__init__(self)
+        self.lines = lines
+        self.style = style
+        self.spaceBefore = style.spaceBefore
+        self.spaceAfter = style.spaceAfter
+        self.rows = None
+    
+    def _wrap_rows(self, availWidth):
+        style = self.style
+        width = availWidth - style.leftIndent - style.rightIndent
+        rows = []
+        for line in self.lines:
+            runs = [(line, style.textColor)] if isinstance(line, str) else line
+            text = ''.join(run[0] for run in runs)
+            breaks = _line_breaks(text, style.fontName, style.fontSize, width)
+            if not breaks:
+                rows.append(runs)
+                continue
+            # Slice the runs at each break offset
+            row, start, stops = [], 0, iter(breaks)
+            stop = next(stops)
+            for run_text, color in runs:
+                end = start + len(run_text)
+                while stop is not None and stop < end:
+                    row.append((run_text[:stop - start], color))
+                    rows.append(row)
+                    row, run_text, start = [], run_text[stop - start:], stop
+                    stop = next(stops, None)
+                row.append((run_text, color))
+                start = end
+            rows.append(row)
+        return rows
+    
+    def wrap(self, availWidth, availHeight):
+        if self.rows is None or self.width != availWidth:
+            self.rows = self._wrap_rows(availWidth)
+        self.width = availWidth
+        self.height = len(self.rows) * self.style.leading
+        return self.width, self.height
+    
+    def split(self, availWidth, availHeight):
+        self.wrap(availWidth, availHeight)
+        count = int(availHeight // self.style.leading)
+        if count < 1 or count >= len(self.rows):
+            return []
+        parts = []
+        for rows in (self.rows[:count], self.rows[count:]):
+            part = MonospaceBlock(rows, self.style)
+            part.rows, part.width = rows, availWidth
+            parts.append(part)
+        parts[0].spaceAfter = parts[1].spaceBefore = 0
+        return parts
+    
+    def draw(self):
+        style = self.style
+        canvas = self.canv
+        if style.backColor is not None:
+            pad = style.borderPadding
+            canvas.saveState()
+            canvas.setFillColor(style.backColor)
+            canvas.rect(style.leftIndent - pad, -pad,
+                        self.width - style.leftIndent - style.rightIndent + 2 * pad,
+                        self.height + 2 * pad, stroke=0, fill=1)
+            canvas.restoreState()
+        text = canvas.beginText(style.leftIndent, self.height - style.fontSize)
+        text.setFont(style.fontName, style.fontSize, style.leading)
+        current = None
+        current_font = style.fontName
+        for row in self.rows:
+            for run_text, color in row:
+                if color is not current:
+                    text.setFillColor(color)
+                    current = color
+                for font, part in font_runs(run_text, style.fontName, 'mono'):
+                    if font != current_font:
+                        text.setFont(font, style.fontSize, style.leading)
+                        current_font = font
+                    text.textOut(part)
+            text.textLine()
+        canvas.drawText(text)
+
+
+class FallbackText(Flowable):
+    """Table cell text drawn run by run, so it can switch to fallback fonts.
+    
+    Unlike a Paragraph it has a fixed width, the width of its longest
+    line, so Table sizes its column as it would for a plain string.
+    """
+    
+    _fixedWidth = 1
+    
+    def __init__(self, text, font_name, font_size, color):
+        Flowable.__init__(self)
+        self.lines = [font_runs(line, font_name) for line in text.split('\n')]
+        self.font_size = font_size
+        self.color = color
+        self.leading = font_size * 1.2
+        self.width = max(sum(string_width(run, font, font_size) for font, run in line) for line in self.lines)
+        self.height = len(self.lines) * self.leading
+    
+    def wrap(self, availWidth, availHeight):
+        return self.width, self.height
+    
+    def draw(self):
+        canvas = self.canv
+        canvas.setFillColor(self.color)
+        y = self.height - self.font_size
+        for line in self.lines:
+            x = 0
+            for font, run in line:
+                canvas.setFont(font, self.font_size)
+                canvas.drawString(x, y, run)
+                x += string_width(run, font, self.font_size)
+            y -= self.leading
+
+
+def fallback_cell(value, font_name, font_size, color):
+    """Table cell value as is, or as FallbackText when its text needs fallback fonts"""
+    if not isinstance(value, str) or value.isascii():
+        return value
+    if all(font == font_name for font, _ in font_runs(value, font_name)):
+        return value
+    return FallbackText(value, font_name, font_size, color)
+
+
+class TableOfContents(Flowable):
+    """Reserves room for a table of contents drawn by NumberedCanvas.save().
+    
+    Page numbers are only known once layout is finished, so this flowable
+    just takes one line per entry and splits across pages when needed.
+    
+    Args:
+        entries: List of (title, key) pairs, key naming an AnchoredParagraph anchor
+        style: ParagraphStyle for the lines (font, size, leading, color)
+    """
+    
+    def __init__(self, entries, style):
+        Flowable.__init__(self)
+        self.entries = entries
+        self.style = style
+    
+    def wrap(self, availWidth, availHeight):
+        self.width = availWidth
+        self.height = len(self.entries) * self.style.leading
+        return self.width, self.height
+    
+    def split(self, availWidth, availHeight):
+        fits = int(availHeight // self.style.leading)
+        if fits <= 0 or fits >= len(self.entries):
+            return []
+        return [TableOfContents(self.entries[:fits], self.style),
+                TableOfContents(self.entries[fits:], self.style)]
+    
+    def draw(self):
+        toc_blocks = getattr(self.canv, 'toc_blocks', None)
+        if toc_blocks is not None:
+            x, y = self.canv.absolutePosition(0, self.height)
+            toc_blocks.append((self.canv.getPageNumber(), x, y, self.width, self.entries, self.style))
+
+
 def draw_footer(canvas_obj, doc):
     """Draw footer content (extension reference + clickable link)."""
     canvas_obj.saveState()
@@ -112,41 +697,52 @@ def draw_footer(canvas_obj, doc):
         canvas_obj.restoreState()
 
 
-def syntax_highlight_python(code):
-    """Apply VS Code-style syntax highlighting to Python code"""
-    # VS Code Dark+ theme colors
-    COLORS = {
-        'keyword': '#C586C0',      # Purple - if, for, def, class, return, etc.
-        'builtin': '#4EC9B0',      # Cyan - print, len, str, int, etc.
-        'string': '#CE9178',       # Orange - strings
-        'comment': '#6A9955',      # Green - comments
-        'function': '#DCDCAA',     # Yellow - function names
-        'number': '#B5CEA8',       # Light green - numbers
-        'default': '#000000'       # Black - default text for better readability
-    }
+# VS Code Dark+ theme colors, as Color objects so drawing needs no parsing
+SYNTAX_COLORS = {
+    'keyword': colors.HexColor('#C586C0'),      # Purple - if, for, def, class, return, etc.
+    'builtin': colors.HexColor('#4EC9B0'),      # Cyan - print, len, str, int, etc.
+    'string': colors.HexColor('#CE9178'),       # Orange - strings
+    'comment': colors.HexColor('#6A9955'),      # Green - comments
+    'function': colors.HexColor('#DCDCAA'),     # Yellow - function names
+    'number': colors.HexColor('#B5CEA8'),       # Light green - numbers
+    'default': colors.HexColor('#000000')       # Black - default text for better readability
+}
+
+# Python keywords
+_PY_KEYWORDS = {
+    'False', 'None', 'True', 'and', 'as', 'assert', 'async', 'await', 
+    'break', 'class', 'continue', 'def', 'del', 'elif', 'else', 
+    'except', 'finally', 'for', 'from', 'global', 'if', 'import', 
+    'in', 'is', 'lambda', 'nonlocal', 'not', 'or', 'pass', 'raise', 
+    'return', 'try', 'while', 'with', 'yield'
+}
+
+# Built-in functions
+_PY_BUILTINS = {
+    'print', 'len', 'str', 'int', 'float', 'list', 'dict', 'set', 
+    'tuple', 'range', 'enumerate', 'zip', 'map', 'filter', 'sum', 
+    'min', 'max', 'abs', 'all', 'any', 'bool', 'bytes', 'display',
+    'isinstance', 'type', 'open', 'sorted', 'append', 'setdefault'
+}
+
+
+def highlight_python(code):
+    """Split Python code into (text, color) runs with VS Code-style colors.
     
-    # Python keywords
-    keywords = {
-        'False', 'None', 'True', 'and', 'as', 'assert', 'async', 'await', 
-        'break', 'class', 'continue', 'def', 'del', 'elif', 'else', 
-        'except', 'finally', 'for', 'from', 'global', 'if', 'import', 
-        'in', 'is', 'lambda', 'nonlocal', 'not', 'or', 'pass', 'raise', 
-        'return', 'try', 'while', 'with', 'yield'
-    }
+    Adjacent runs of the same color are merged, so a typical line has a
+    handful of runs. Colors are SYNTAX_COLORS values.
+    """
+    runs = []
     
-    # Built-in functions
-    builtins = {
-        'print', 'len', 'str', 'int', 'float', 'list', 'dict', 'set', 
-        'tuple', 'range', 'enumerate', 'zip', 'map', 'filter', 'sum', 
-        'min', 'max', 'abs', 'all', 'any', 'bool', 'bytes', 'display',
-        'isinstance', 'type', 'open', 'sorted', 'append', 'setdefault'
-    }
+    def add(text, kind):
+        color = SYNTAX_COLORS[kind]
+        if runs and runs[-1][1] is color:
+            runs[-1] = (runs[-1][0] + text, color)
+        else:
+            runs.append((text, color))
     
-    # Tokenize and colorize
-    result = []
     i = 0
     while i < len(code):
-        # Skip already processed
         char = code[i]
         
         # Comments
@@ -154,8 +750,7 @@ def syntax_highlight_python(code):
             end = code.find('\n', i)
             if end == -1:
                 end = len(code)
-            comment = code[i:end].replace('<', '&lt;').replace('>', '&gt;').replace('&', '&amp;')
-            result.append(f'<font color="{COLORS["comment"]}">{comment}</font>')
+            add(code[i:end], 'comment')
             i = end
             continue
         
@@ -183,9 +778,7 @@ def syntax_highlight_python(code):
                     else:
                         j += 1
                 end = j
-            
-            string = code[i:end].replace('<', '&lt;').replace('>', '&gt;').replace('&', '&amp;')
-            result.append(f'<font color="{COLORS["string"]}">{string}</font>')
+            add(code[i:end], 'string')
             i = end
             continue
         
@@ -194,8 +787,7 @@ def syntax_highlight_python(code):
             j = i
             while j < len(code) and (code[j].isdigit() or code[j] == '.'):
                 j += 1
-            number = code[i:j]
-            result.append(f'<font color="{COLORS["number"]}">{number}</font>')
+            add(code[i:j], 'number')
             i = j
             continue
         
@@ -206,48 +798,597 @@ def syntax_highlight_python(code):
                 j += 1
             word = code[i:j]
             
-            if word in keywords:
-                result.append(f'<font color="{COLORS["keyword"]}">{word}</font>')
-            elif word in builtins:
-                result.append(f'<font color="{COLORS["builtin"]}">{word}</font>')
+            if word in _PY_KEYWORDS:
+                add(word, 'keyword')
+            elif word in _PY_BUILTINS:
+                add(word, 'builtin')
+            elif i > 0 and code[max(0,i-4):i].strip() == 'def':
+                # Function definition
+                add(word, 'function')
             else:
-                # Check if it's a function definition
-                if i > 0 and code[max(0,i-4):i].strip() == 'def':
-                    result.append(f'<font color="{COLORS["function"]}">{word}</font>')
-                else:
-                    result.append(f'<font color="{COLORS["default"]}">{word}</font>')
+                add(word, 'default')
             i = j
             continue
         
         # Everything else (operators, whitespace, etc.)
-        safe_char = char.replace('<', '&lt;').replace('>', '&gt;').replace('&', '&amp;')
-        result.append(f'<font color="{COLORS["default"]}">{safe_char}</font>')
+        add(char, 'default')
+        i += 1
+    
+    return runs
+
+
+# Parsed markdown block specs, keyed by SHA-1 of the cell source. Shared
+# template cells (assignment instructions) are parsed once per process.
+_MARKDOWN_CACHE = {}
+_MARKDOWN_CACHE_SIZE = 512
+
+_MD_FENCE = re.compile(r'^\s{0,3}(`{3,}|~{3,})\s*([\w+-]*)')
+_MD_HEADING = re.compile(r'^\s{0,3}(#{1,6})\s+(.*?)(?:\s+#+)?\s*$')
+_MD_RULE = re.compile(r'^\s{0,3}([-*_])(\s*\1){2,}\s*$')
+_MD_LIST_ITEM = re.compile(r'^(\s*)([-*+]|\d+[.)])\s+(.*)$')
+_MD_QUOTE = re.compile(r'^\s{0,3}>\s?(.*)$')
+_MD_TABLE_SEP = re.compile(r'^\s*\|?\s*:?-+:?\s*(\|\s*:?-+:?\s*)*\|?\s*$')
+
+_MD_IMAGE = re.compile(r'!\[([^\]]*)\]\([^)]*\)')
+_MD_LINK = re.compile(r'\[([^\]]+)\]\(\s*([^)\s]+)(?:\s+"[^"]*")?\s*\)')
+_MD_DELIMITER_RUN = re.compile(r'\*+|_+|~~+')
+
+
+_MD_ESCAPE = re.compile(r'\\([!-/:-@\[-`{-~])')
+_MD_ESCAPED = re.compile(r'\x01(\d+)\x01')
+_MD_CODE_OR_MATH = re.compile(r'(`+)(.+?)\1|(?<![\\$])\$(?![\s$])([^$\n]+?)(?<![\s\\])\$(?!\d)')
+
+# Rendered LaTeX expressions: in-memory index over an on-disk PNG cache keyed
+# by expression and font size, shared by every conversion on this machine.
+MATH_DPI = 300
+_MATH_CACHE = {}
+_math_cache_dir = None
+# Per-process directory for equations the shared cache could not store
+_math_private_dir = None
+
+
+def get_math_cache_dir():
+    """Return the directory used to cache rendered math images"""
+    global _math_cache_dir
+    if _math_cache_dir is None:
+        base = os.environ.get('NB2PDF_CACHE_DIR') or os.path.join(
+            os.environ.get('XDG_CACHE_HOME') or os.path.join(Path.home(), '.cache'), 'nb2pdf')
+        cache_dir = Path(base) / 'math'
+        try:
+            cache_dir.mkdir(parents=True, exist_ok=True)
+        except OSError:
+            import tempfile
+            cache_dir = Path(tempfile.gettempdir()) / 'nb2pdf-math'
+            try:
+                cache_dir.mkdir(parents=True, exist_ok=True)
+            except OSError:
+                pass  # render_math() falls back to a private temp directory
+        _math_cache_dir = cache_dir
+    return _math_cache_dir
+
+
+def _write_private_math_png(key, data):
+    """Store an equation PNG the shared cache rejected; returns its path, or None"""
+    global _math_private_dir
+    try:
+        if _math_private_dir is None:
+            import atexit
+            import shutil
+            import tempfile
+            _math_private_dir = Path(tempfile.mkdtemp(prefix='nb2pdf-math-'))
+            atexit.register(shutil.rmtree, _math_private_dir, ignore_errors=True)
+        path = _math_private_dir / f'{key}.png'
+        path.write_bytes(data)
+        return path
+    except OSError:
+        return None
+
+
+def render_math(tex, fontsize=10):
+    """Render a LaTeX expression with matplotlib mathtext.
+
+    Returns:
+        (png_path, width, height, depth) in points, or None if mathtext
+        cannot parse the expression
+    """
+    key = hashlib.sha1(f'{fontsize}:{tex}'.encode('utf-8')).hexdigest()
+    if key in _MATH_CACHE:
+        return _MATH_CACHE[key]
+
+    png_path = get_math_cache_dir() / f'{key}.png'
+    entry = None
+    if png_path.exists():
+        try:
+            from PIL import Image as PILImage
+            with PILImage.open(png_path) as png:
+                width_px, height_px = png.size
+                depth = float(png.info['nb2pdf-depth'])
+            entry = (str(png_path), width_px * 72.0 / MATH_DPI, height_px * 72.0 / MATH_DPI, depth)
+        except Exception:
+            entry = None
+
+    if entry is None:
+        from matplotlib.mathtext import MathTextParser
+        from matplotlib.figure import Figure
+        from matplotlib.font_manager import FontProperties
+        expression = f'${tex}$'
+        prop = FontProperties(size=fontsize)
+        try:
+            width, height, depth, _, _ = MathTextParser('path').parse(expression, dpi=72, prop=prop)
+            fig = Figure(figsize=(width / 72.0, height / 72.0))
+            fig.text(0, depth / height, expression, fontproperties=prop)
+            buf = io.BytesIO()
+            fig.savefig(buf, dpi=MATH_DPI, format='png', transparent=True,
+                        metadata={'nb2pdf-depth': str(depth)})
+        except Exception:
+            _MATH_CACHE[key] = None
+            return None
+        # Write atomically so concurrent conversions never read a partial file
+        tmp_path = png_path.with_suffix(f'.{os.getpid()}.tmp')
+        try:
+            tmp_path.write_bytes(buf.getvalue())
+            os.replace(tmp_path, png_path)
+        except OSError:
+            # Read-only or full cache: the PDF still needs a file to embed
+            try:
+                tmp_path.unlink()
+            except OSError:
+                pass
+            png_path = _write_private_math_png(key, buf.getvalue())
+            if png_path is None:
+                _MATH_CACHE[key] = None
+                return None
+        # Size from the PNG itself, exactly as a cache hit would, so output
+        # does not depend on whether the cache was warm
+        from PIL import Image as PILImage
+        with PILImage.open(buf) as png:
+            width_px, height_px = png.size
+        entry = (str(png_path), width_px * 72.0 / MATH_DPI, height_px * 72.0 / MATH_DPI, depth)
+
+    _MATH_CACHE[key] = entry
+    return entry
+
+
+def math_markup(tex, fontsize=10):
+    """Return Paragraph markup for an inline math expression"""
+    rendered = render_math(tex, fontsize)
+    if rendered is None:
+        return f'<font face="Courier">${escape_markup(tex)}$</font>'
+    path, width, height, depth = rendered
+    return f'<img src="{path}" width="{width:.2f}" height="{height:.2f}" valign="{-depth:.2f}"/>'
+
+
+def escape_markup(text):
+    """Escape text for use inside a ReportLab Paragraph"""
+    return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+
+def markdown_inline(text):
+    """Convert inline markdown (bold, italic, code, links, math) to ReportLab markup"""
+    # Mask backslash escapes so the escaped characters never open a code
+    # span, math or emphasis; they come back as literal text at the end
+    escaped = []
+
+    def mask(match):
+        escaped.append(match.group(1))
+        return f'\x01{len(escaped) - 1}\x01'
+
+    def keep_backslash(match):
+        return '\\' + escaped[int(match.group(1))]
+
+    text = _MD_ESCAPE.sub(mask, text)
+    parts = []
+    pos = 0
+    for match in _MD_CODE_OR_MATH.finditer(text):
+        parts.append(_markdown_inline_plain(text[pos:match.start()]))
+        if match.group(3) is not None:
+            parts.append(math_markup(_MD_ESCAPED.sub(keep_backslash, match.group(3))))
+        else:
+            # Backslashes are literal inside code spans
+            code = escape_markup(_MD_ESCAPED.sub(keep_backslash, match.group(2)).strip())
+            parts.append(f'<font face="Courier" color="#c7254e">{code}</font>')
+        pos = match.end()
+    parts.append(_markdown_inline_plain(text[pos:]))
+    return _MD_ESCAPED.sub(lambda m: escape_markup(escaped[int(m.group(1))]).replace('"', '&quot;'),
+                           ''.join(parts))
+
+
+def _markdown_inline_plain(text):
+    """Inline markdown conversion for text that contains no code spans or math"""
+    text = _MD_IMAGE.sub(lambda m: f'[image: {m.group(1)}]' if m.group(1) else '[image]', text)
+    links = []
+
+    def stash_link(match):
+        links.append((match.group(1), match.group(2)))
+        return f'\x00{len(links) - 1}\x00'
+
+    text = escape_markup(_MD_LINK.sub(stash_link, text))
+    text = _markdown_emphasis(text)
+
+    def restore_link(match):
+        label, url = links[int(match.group(1))]
+        href = escape_markup(url).replace('"', '&quot;')
+        return f'<link href="{href}" color="#1565c0"><u>{_markdown_inline_plain(label)}</u></link>'
+
+    return re.sub(r'\x00(\d+)\x00', restore_link, text)
+
+
+def _is_punctuation(char):
+    return unicodedata.category(char)[0] in 'PS'
+
+
+def _markdown_emphasis(text):
+    """Turn *, _ and ~~ delimiter runs into <i>, <b> and <strike> tags.
+    
+    Follows CommonMark's delimiter stack: a closer pairs with the nearest
+    compatible opener, and openers left between the two become literal
+    text, so the tags are always properly nested. Unpaired delimiters stay
+    as they were written.
+    """
+    tokens = []  # literal strings, and [char, count, can_open, can_close, opens, closes] lists
+    pos = 0
+    for match in _MD_DELIMITER_RUN.finditer(text):
+        start, end = match.span()
+        run = match.group()
+        before = text[start - 1] if start else ' '
+        after = text[end] if end < len(text) else ' '
+        left = not after.isspace() and (not _is_punctuation(after) or before.isspace() or _is_punctuation(before))
+        right = not before.isspace() and (not _is_punctuation(before) or after.isspace() or _is_punctuation(after))
+        if run[0] == '_':
+            # No intraword emphasis with underscores
+            can_open = left and (not right or _is_punctuation(before))
+            can_close = right and (not left or _is_punctuation(after))
+        else:
+            can_open, can_close = left, right
+        tokens.append(text[pos:start])
+        tokens.append([run[0], len(run), can_open, can_close, [], []])
+        pos = end
+    tokens.append(text[pos:])
+    
+    stack = []  # indexes of delimiter tokens that may still open
+    for index, token in enumerate(tokens):
+        if isinstance(token, str):
+            continue
+        char, _, can_open, can_close = token[:4]
+        while can_close and token[1]:
+            for depth in range(len(stack) - 1, -1, -1):
+                opener = tokens[stack[depth]]
+                if opener[0] != char or (char == '~' and opener[1] < 2):
+                    continue
+                # CommonMark's "rule of 3" for runs that can both open and close
+                if ((opener[3] or can_open) and (opener[1] + token[1]) % 3 == 0
+                        and not (opener[1] % 3 == 0 and token[1] % 3 == 0)):
+                    continue
+                break
+            else:
+                break
+            # Openers between the pair can no longer be closed
+            del stack[depth + 1:]
+            if char == '~':
+                if token[1] < 2:
+                    break
+                used, tag = 2, 'strike'
+            else:
+                used = 2 if opener[1] >= 2 and token[1] >= 2 else 1
+                tag = 'b' if used == 2 else 'i'
+            opener[1] -= used
+            token[1] -= used
+            opener[4].insert(0, f'<{tag}>')
+            token[5].append(f'</{tag}>')
+            if not opener[1]:
+                stack.pop()
+        if can_open and token[1]:
+            stack.append(index)
+    
+    parts = []
+    for token in tokens:
+        if isinstance(token, str):
+            parts.append(token)
+        else:
+            parts.extend(token[5])
+            parts.append(token[0] * token[1])
+            parts.extend(token[4])
+    return ''.join(parts)
+
+
+def _split_table_row(line):
+    """Split a markdown table row into stripped cell strings"""
+    line = line.strip()
+    if line.startswith('|'):
+        line = line[1:]
+    if line.endswith('|'):
+        line = line[:-1]
+    return [cell.strip() for cell in line.split('|')]
+
+
+def parse_markdown(source):
+    """Parse markdown into a tuple of block specs.
+
+    Each spec is a plain tuple such as ('heading', level, markup) or
+    ('list', [(depth, bullet, markup), ...]) so results can be cached and
+    turned into fresh flowables for every document.
+    """
+    key = hashlib.sha1(source.encode('utf-8')).hexdigest()
+    cached = _MARKDOWN_CACHE.get(key)
+    if cached is not None:
+        return cached
+
+    blocks = []
+    lines = source.split('\n')
+    paragraph = []
+    i = 0
+
+    def flush_paragraph():
+        if paragraph:
+            markup = ''
+            for n, line in enumerate(paragraph):
+                hard_break = line.endswith('  ') or line.endswith('\\')
+                markup += markdown_inline(line.strip().rstrip('\\'))
+                if n < len(paragraph) - 1:
+                    markup += '<br/>' if hard_break else ' '
+            blocks.append(('paragraph', markup))
+            paragraph.clear()
+
+    while i < len(lines):
+        line = lines[i]
+        stripped = line.strip()
+
+        if not stripped:
+            flush_paragraph()
+            i += 1
+            continue
+
+        # Fenced code block
+        fence = _MD_FENCE.match(line)
+        if fence:
+            flush_paragraph()
+            marker = fence.group(1)
+            code_lines = []
+            i += 1
+            while i < len(lines) and not lines[i].strip().startswith(marker):
+                code_lines.append(lines[i])
+                i += 1
+            blocks.append(('code', fence.group(2), '\n'.join(code_lines)))
+            i += 1
+            continue
+
+        # Display math block
+        if stripped.startswith('$$'):
+            flush_paragraph()
+            body = stripped[2:]
+            if body.endswith('$$') and len(body) >= 2:
+                blocks.append(('math', body[:-2].strip()))
+                i += 1
+                continue
+            math_lines = [body]
+            i += 1
+            while i < len(lines) and '$$' not in lines[i]:
+                math_lines.append(lines[i].strip())
+                i += 1
+            if i < len(lines):
+                math_lines.append(lines[i].strip().split('$$', 1)[0])
+            blocks.append(('math', ' '.join(l for l in math_lines if l)))
+            i += 1
+            continue
+
+        heading = _MD_HEADING.match(line)
+        if heading:
+            flush_paragraph()
+            blocks.append(('heading', len(heading.group(1)), markdown_inline(heading.group(2))))
+            i += 1
+            continue
+
+        if _MD_RULE.match(line):
+            flush_paragraph()
+            blocks.append(('rule',))
+            i += 1
+            continue
+
+        # Table: header row followed by a separator row
+        if '|' in line and i + 1 < len(lines) and _MD_TABLE_SEP.match(lines[i + 1]) and '-' in lines[i + 1]:
+            flush_paragraph()
+            rows = [[markdown_inline(cell) for cell in _split_table_row(line)]]
+            i += 2
+            while i < len(lines) and '|' in lines[i] and lines[i].strip():
+                rows.append([markdown_inline(cell) for cell in _split_table_row(lines[i])])
+                i += 1
+            blocks.append(('table', rows))
+            continue
+
+        if _MD_QUOTE.match(line):
+            flush_paragraph()
+            quote_lines = []
+            while i < len(lines) and lines[i].strip():
+                quoted = _MD_QUOTE.match(lines[i])
+                quote_lines.append(quoted.group(1) if quoted else lines[i].strip())
+                i += 1
+            blocks.append(('quote', markdown_inline(' '.join(quote_lines))))
+            continue
+
+        item = _MD_LIST_ITEM.match(line)
+        if item:
+            flush_paragraph()
+            items = []
+            while i < len(lines):
+                item = _MD_LIST_ITEM.match(lines[i])
+                if item:
+                    depth = len(item.group(1).expandtabs(4)) // 2
+                    marker = item.group(2)
+                    bullet = marker if marker[-1] in '.)' else '•'
+                    items.append([depth, bullet, item.group(3).strip()])
+                elif lines[i].strip() and lines[i][:1] in (' ', '\t') and items:
+                    # Lazy continuation of the previous item
+                    items[-1][2] += ' ' + lines[i].strip()
+                else:
+                    break
+                i += 1
+            blocks.append(('list', [(depth, bullet, markdown_inline(text)) for depth, bullet, text in items]))
+            continue
+
+        paragraph.append(line)
         i += 1
+
+    flush_paragraph()
+    blocks = tuple(blocks)
+
+    if len(_MARKDOWN_CACHE) >= _MARKDOWN_CACHE_SIZE:
+        _MARKDOWN_CACHE.pop(next(iter(_MARKDOWN_CACHE)))
+    _MARKDOWN_CACHE[key] = blocks
+    return blocks
+
+
+def markup_paragraph(markup, style, cls=Paragraph, **kwargs):
+    """Paragraph for converted markdown, with fallback fonts applied.
+    
+    If reportlab rejects the markup, the text is shown without formatting
+    rather than failing the whole conversion.
+    """
+    try:
+        return cls(font_fallback_markup(markup, style.fontName), style, **kwargs)
+    except ValueError:
+        plain = escape_markup(html_to_text(markup))
+        return cls(font_fallback_markup(plain, style.fontName), style, **kwargs)
+
+
+def markdown_to_flowables(source, styles, markdown_style, code_style, key_prefix=None):
+    """Render a markdown cell as a list of ReportLab flowables.
     
-    return ''.join(result)
+    With a key_prefix, headings also get outline entries whose destination
+    names are the prefix plus the heading text with dashes for spaces
+    (accents dropped, then ASCII letters, digits, '_', '.' and '-' only, as
+    reportlab does not escape other characters in PDF names).
+    """
+    story = []
+    list_styles = {}
+    for block in parse_markdown(source):
+        kind = block[0]
+        if kind == 'heading':
+            level = min(block[1], 6)
+            anchors = ()
+            if key_prefix is not None:
+                title = html_to_text(block[2])
+                slug = unicodedata.normalize('NFKD', re.sub(r'\s+', '-', title))
+                slug = re.sub(r'[^A-Za-z0-9_.-]', '', slug).strip('-') or 'heading'
+                anchors = [(key_prefix + slug, title, level)]
+            style = styles[f'Heading{level}']
+            story.append(markup_paragraph(block[2], style, AnchoredParagraph, anchors=anchors))
+        elif kind == 'paragraph':
+            story.append(markup_paragraph(block[1], markdown_style))
+        elif kind == 'list':
+            for depth, bullet, markup in block[1]:
+                if depth not in list_styles:
+                    list_styles[depth] = ParagraphStyle(
+                        f'MarkdownList{depth}',
+                        parent=markdown_style,
+                        leftIndent=markdown_style.leftIndent + 14 + depth * 14,
+                        bulletIndent=markdown_style.leftIndent + depth * 14,
+                        spaceAfter=2
+                    )
+                story.append(markup_paragraph(markup, list_styles[depth], bulletText=bullet))
+            story.append(Spacer(1, 0.15*cm))
+        elif kind == 'code':
+            story.append(MonospaceBlock(block[2].expandtabs(4).split('\n'), code_style))
+        elif kind == 'math':
+            rendered = render_math(block[1], fontsize=12)
+            if rendered is not None:
+                path, width, height, _ = rendered
+                story.append(RLImage(path, width=width, height=height, hAlign='CENTER'))
+                story.append(Spacer(1, 0.2*cm))
+            else:
+                story.append(Paragraph(
+                    f'<font face="Courier">{escape_markup(block[1])}</font>',
+                    ParagraphStyle('MarkdownMath', parent=markdown_style, alignment=TA_CENTER)
+                ))
+        elif kind == 'quote':
+            story.append(markup_paragraph(block[1], ParagraphStyle(
+                'MarkdownQuote',
+                parent=markdown_style,
+                leftIndent=markdown_style.leftIndent + 12,
+                textColor=colors.HexColor('#616161'),
+                fontName='Helvetica-Oblique'
+            )))
+        elif kind == 'table':
+            rows = block[1]
+            width = max(len(row) for row in rows)
+            cell_style = ParagraphStyle('MarkdownCell', parent=markdown_style, leftIndent=0, spaceAfter=0, fontSize=9)
+            data = [[markup_paragraph(cell, cell_style) for cell in row] + [''] * (width - len(row))
+                    for row in rows]
+            table = Table(data, repeatRows=1, hAlign='LEFT')
+            table.setStyle(TableStyle([
+                ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#e3f2fd')),
+                ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+                ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+                ('TOPPADDING', (0, 0), (-1, -1), 3),
+                ('BOTTOMPADDING', (0, 0), (-1, -1), 3),
+            ]))
+            story.append(table)
+            story.append(Spacer(1, 0.2*cm))
+        elif kind == 'rule':
+            story.append(HRFlowable(width='100%', thickness=0.5, color=colors.HexColor('#9e9e9e'),
+                                    spaceBefore=4, spaceAfter=8))
+    return story
+
+
+DEFAULT_CONFIG = {
+    "name": "Your Name",
+    "id": "",
+    "project_title": "",
+    "project_subtitle": ""
+}
 
 
 def load_config(config_path):
     """Load user info from config file"""
-    default_config = {
-        "name": "Your Name",
-        "id": "",
-        "project_title": "",
-        "project_subtitle": ""
-    }
-    
     if config_path and Path(config_path).exists():
         try:
             with open(config_path, 'r', encoding='utf-8') as f:
                 config = json.load(f)
-                return {**default_config, **config}
+                return {**DEFAULT_CONFIG, **config}
         except Exception as e:
             print(f"Warning: Could not load config: {e}")
     
-    return default_config
+    return dict(DEFAULT_CONFIG)
+
+
+# SOURCE_DATE_EPOCH values already warned about
+_IGNORED_EPOCHS = set()
+
+
+def source_date_epoch():
+    """SOURCE_DATE_EPOCH as integer seconds, or None.
+    
+    A value that is not an integer is ignored with a warning (once per
+    value), as if it were unset.
+    """
+    value = os.environ.get('SOURCE_DATE_EPOCH', '').strip()
+    if not value:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        if value not in _IGNORED_EPOCHS:
+            _IGNORED_EPOCHS.add(value)
+            print(f"[WARN] Ignoring SOURCE_DATE_EPOCH={value!r}: not an integer number of seconds",
+                  file=sys.stderr)
+        return None
+
+
+def get_report_date(reproducible=False):
+    """Date shown in the header.
+    
+    Honours SOURCE_DATE_EPOCH (as reportlab does for the PDF metadata).
+    Without it, returns today's date, or None in reproducible mode since the
+    conversion date is not part of the input.
+    """
+    epoch = source_date_epoch()
+    if epoch is not None:
+        return datetime.fromtimestamp(epoch, timezone.utc)
+    if reproducible:
+        return None
+    return datetime.now()
 
 
-def create_header(config):
+def create_header(config, reproducible=False):
     """Create a styled header for the PDF"""
     styles = getSampleStyleSheet()
     
@@ -283,9 +1424,13 @@ def create_header(config):
         ['ID:', config['id']] if config['id'] else None,
         ['Project Title:', config['project_title']] if config['project_title'] else None,
         ['Project SubTitle:', config['project_subtitle']] if config['project_subtitle'] else None,
-        ['Date:', datetime.now().strftime('%B %d, %Y')],
     ]
+    report_date = get_report_date(reproducible)
+    if report_date is not None:
+        info_data.append(['Date:', report_date.strftime('%B %d, %Y')])
     info_data = [row for row in info_data if row]  # Remove None rows
+    info_data = [[label, fallback_cell(value, 'Helvetica', 10, colors.HexColor('#424242'))]
+                 for label, value in info_data]
     
     info_table = Table(info_data, colWidths=[4*cm, 12*cm])
     info_table.setStyle(TableStyle([
@@ -315,150 +1460,702 @@ def create_header(config):
     return story
 
 
-def execute_notebook(notebook_path):
-    """Execute all cells in notebook and capture outputs"""
-    notebook_path = Path(notebook_path).resolve()
-    original_cwd = Path.cwd()
-    
-    # Change to notebook directory for execution so relative paths work
-    try:
-        os.chdir(notebook_path.parent)
-    except Exception as cwd_error:
-        print(f"[WARN] Could not change directory to notebook folder {notebook_path.parent}: {cwd_error}")
-    
-    try:
-        with open(notebook_path, 'r', encoding='utf-8') as f:
-            nb = json.load(f)
-        
-        cells = nb.get('cells', [])
-        results = []
-        
-        # Create global namespace for execution
-        glb = {'__name__': '__main__'}
-        
-        # Ensure matplotlib uses non-interactive backend in execution context
-        import matplotlib
-        matplotlib.use('Agg', force=True)
-        import matplotlib.pyplot as plt
-        plt.ioff()  # Turn off interactive mode
-        
-        # Storage for captured DataFrames and plots
-        captured_dataframes = []
-        captured_plots = []
-        
-        # Custom display function
-        def display(obj):
+DATAFRAME_MAX_ROWS = 50
+MAX_OUTPUT_LINES = 100
+
+# Rich representations in order of preference: images are embedded as-is,
+# markdown/LaTeX reuse the markdown renderer, HTML is the costliest to convert.
+_DISPLAY_REPR_METHODS = [
+    ('image/png', '_repr_png_'),
+    ('image/jpeg', '_repr_jpeg_'),
+    ('text/markdown', '_repr_markdown_'),
+    ('text/latex', '_repr_latex_'),
+    ('text/html', '_repr_html_'),
+]
+
+
+def get_display_data(obj):
+    """Pick the cheapest renderable representation of a displayed object.
+
+    Only the first representation that succeeds is computed, so objects with
+    an image repr never pay for their HTML or text repr.
+
+    Returns:
+        (mime, data) where mime is 'dataframe', an image/text MIME type, or
+        'text/plain' with the repr string
+    """
+    if isinstance(obj, type):
+        return 'text/plain', repr(obj)
+
+    module = type(obj).__module__ or ''
+    type_name = type(obj).__name__
+    if module.startswith('pandas'):
+        if type_name == 'DataFrame':
+            return 'dataframe', obj.head(DATAFRAME_MAX_ROWS + 1).copy()
+        if type_name == 'Styler':
+            # Render the underlying frame instead of the generated HTML
+            return 'dataframe', obj.data.head(DATAFRAME_MAX_ROWS + 1).copy()
+    if module.startswith('matplotlib') and hasattr(obj, 'savefig'):
+        buf = io.BytesIO()
+        obj.savefig(buf, format='png', dpi=150, bbox_inches='tight')
+        return 'image/png', buf.getvalue()
+
+    bundle = {}
+    if hasattr(obj, '_repr_mimebundle_'):
+        try:
+            bundle = obj._repr_mimebundle_(include=None, exclude=None) or {}
+            if isinstance(bundle, tuple):
+                bundle = bundle[0] or {}
+        except Exception:
+            bundle = {}
+
+    for mime, method_name in _DISPLAY_REPR_METHODS:
+        if mime in bundle:
+            data = bundle[mime]
+        else:
+            method = getattr(obj, method_name, None)
+            if not callable(method):
+                continue
             try:
-                import pandas as pd
-                if isinstance(obj, pd.DataFrame):
-                    # Store DataFrame for table rendering with a marker
-                    marker = f"__DATAFRAME_MARKER_{len(captured_dataframes)}__"
-                    captured_dataframes.append(obj.copy())
-                    # Print marker so we know where to insert the table
-                    print(marker)
-                    return
-            except:
-                pass
-            print(repr(obj))
-        
-        glb['display'] = display
-        
-        for idx, cell in enumerate(cells, 1):
-            cell_type = cell.get('cell_type')
-            source = ''.join(cell.get('source', []))
-            
-            # Reset DataFrame and plot capture for each cell
-            captured_dataframes.clear()
-            captured_plots.clear()
-            
-            cell_result = {
-                'index': idx,
-                'type': cell_type,
-                'source': source,
-                'output': '',
-                'error': None,
-                'dataframes': [],
-                'plots': []
-            }
-            
-            if cell_type == 'code':
-                # Capture stdout and stderr
-                old_stdout = sys.stdout
-                old_stderr = sys.stderr
-                buf_out = io.StringIO()
-                buf_err = io.StringIO()
-                sys.stdout = buf_out
-                sys.stderr = buf_err
-                
-                try:
-                    # Try to eval the last expression to capture its value like Jupyter does
-                    # Split into lines and check if last line is an expression
-                    lines = source.strip().split('\n')
-                    if lines:
-                        # Try to compile and exec all but last line, then eval last line
-                        try:
-                            if len(lines) > 1:
-                                exec('\n'.join(lines[:-1]), glb)
-                            # Try to evaluate the last line as an expression
-                            result = eval(lines[-1], glb)
-                            if result is not None:
-                                print(repr(result))
-                        except SyntaxError:
-                            # If last line isn't an expression, just exec everything
-                            exec(source, glb)
-                    else:
-                        exec(source, glb)
+                data = method()
+            except Exception:
+                continue
+        if isinstance(data, tuple):
+            data = data[0]  # (data, metadata) pairs
+        if not data:
+            continue
+        if mime.startswith('image/') and isinstance(data, str):
+            data = base64.b64decode(data)
+        return mime, data
+
+    if 'text/plain' in bundle:
+        return 'text/plain', bundle['text/plain']
+    return 'text/plain', repr(obj)
+
+
+class _HTMLTableParser(HTMLParser):
+    """Collect the rows of the first <table> in an HTML fragment"""
+    def __init__(self):
+        super().__init__()
+        self.rows = []
+        self._row = None
+        self._cell = None
+        self._done = False
+
+    def handle_starttag(self, tag, attrs):
+        if self._done:
+            return
+        if tag == 'tr':
+            self._row = []
+        elif tag in ('td', 'th') and self._row is not None:
+            self._cell = []
+
+    def handle_endtag(self, tag):
+        if self._done:
+            return
+        if tag in ('td', 'th') and self._cell is not None:
+            self._row.append(' '.join(''.join(self._cell).split()))
+            self._cell = None
+        elif tag == 'tr' and self._row is not None:
+            if self._row:
+                self.rows.append(self._row)
+            self._row = None
+        elif tag == 'table' and self.rows:
+            self._done = True
+
+    def handle_data(self, data):
+        if self._cell is not None:
+            self._cell.append(data)
+
+
+def html_to_text(html):
+    """Strip tags from an HTML fragment, keeping block-level line breaks"""
+    text = re.sub(r'(?is)<(script|style).*?</\1>', '', html)
+    text = re.sub(r'(?i)<br\s*/?>|</(p|div|li|h[1-6]|tr)>', '\n', text)
+    text = re.sub(r'<[^>]+>', '', text)
+    return unescape_html(text).strip()
+
+
+class OutputCapture(io.TextIOBase):
+    """Text stream that records writes as ordered 'stream' output events.
+
+    Consecutive writes to the same stream are merged into one event;
+    chunks are joined by finish_stream_events() once the cell is done.
+    """
+    encoding = 'utf-8'
+
+    def __init__(self, events, name):
+        super().__init__()
+        self.events = events
+        self.name = name
+
+    def writable(self):
+        return True
+
+    def write(self, text):
+        if not text:
+            return 0
+        last = self.events[-1] if self.events else None
+        if last is not None and last['type'] == 'stream' and last['name'] == self.name:
+            last['chunks'].append(text)
+        else:
+            self.events.append({'type': 'stream', 'name': self.name, 'chunks': [text]})
+        return len(text)
+
+
+def finish_stream_events(events):
+    """Join the buffered chunks of stream events into their 'text' field"""
+    for event in events:
+        if event['type'] == 'stream' and 'chunks' in event:
+            event['text'] = ''.join(event.pop('chunks'))
+
+
+# Notebooks larger than this are parsed incrementally when ijson is installed
+STREAMING_LOAD_BYTES = 64 * 1024 * 1024
+
+# Saved cell fields nb2pdf never reads: every cell is re-executed, so stored
+# outputs (mostly base64 images) and attachments are dropped while loading
+_SKIPPED_CELL_FIELDS = ('outputs', 'attachments')
+
+
+def parse_json(data):
+    """Parse JSON bytes or str, with orjson when it is installed"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def strip_saved_outputs(nb):
+    """Drop saved outputs and attachments from a parsed notebook in place"""
+    for cell in nb.get('cells', []):
+        for field in _SKIPPED_CELL_FIELDS:
+            cell.pop(field, None)
+    return nb
+
+
+def _load_notebook_streaming(f):
+    """Build the notebook from ijson events without decoding skipped fields"""
+    builder = ijson.ObjectBuilder()
+    skipped = tuple(f'cells.item.{field}' for field in _SKIPPED_CELL_FIELDS)
+    skipped_children = tuple(prefix + '.' for prefix in skipped)
+    try:
+        for prefix, event, value in ijson.parse(f, use_float=True):
+            if prefix == 'cells.item' and event == 'map_key' and value in _SKIPPED_CELL_FIELDS:
+                continue
+            if prefix in skipped or prefix.startswith(skipped_children):
+                continue
+            builder.event(event, value)
+    except ijson.JSONError as e:
+        raise ValueError(f"Invalid notebook JSON: {e}")
+    return builder.value
+
+
+def load_notebook(path, keep_outputs=False):
+    """Read an .ipynb file, skipping saved outputs unless keep_outputs is set.
+    
+    Parses with orjson when installed (falling back to json). Files over
+    STREAMING_LOAD_BYTES are streamed through ijson when available, which is
+    slower but drops output blobs as they are read, so peak memory stays flat
+    instead of growing to several times the file size.
+    
+    Raises:
+        ValueError: If the file is not valid JSON
+    """
+    path = Path(path)
+    if not keep_outputs and ijson is not None and path.stat().st_size > STREAMING_LOAD_BYTES:
+        with open(path, 'rb') as f:
+            return _load_notebook_streaming(f)
+    
+    with open(path, 'rb') as f:
+        nb = parse_json(f.read())
+    if not keep_outputs:
+        strip_saved_outputs(nb)
+    return nb
+
+
+# Jupyter cell tags and the parts of the cell they leave out of the PDF.
+# hide-* tags collapse content in HTML; on paper they behave like remove-*.
+CELL_TAG_HIDES = {
+    'remove-cell': ('input', 'output'),
+    'hide-cell': ('input', 'output'),
+    'remove-input': ('input',),
+    'hide-input': ('input',),
+    'remove-output': ('output',),
+    'hide-output': ('output',),
+}
+
+
+def parse_cell_ranges(spec):
+    """Parse a --cells value such as "1-10,15" into a set of 1-based indexes.
+    
+    Raises:
+        ValueError: If a part is not a number or an ascending range
+    """
+    selected = set()
+    for part in spec.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        first, sep, last = part.partition('-')
+        try:
+            first = int(first)
+            last = int(last) if sep else first
+        except ValueError:
+            raise ValueError(f"invalid cell range '{part}' (expected e.g. 1-10,15)")
+        if first < 1 or last < first:
+            raise ValueError(f"invalid cell range '{part}' (expected e.g. 1-10,15)")
+        selected.update(range(first, last + 1))
+    return selected
+
+
+def _new_cell_result(idx, cell):
+    """Build the result dict for a cell before it runs.
+    
+    Returns:
+        (cell_result, tags) where tags are the cell's Jupyter tags
+    """
+    tags = (cell.get('metadata') or {}).get('tags') or []
+    hidden = {part for tag in tags for part in CELL_TAG_HIDES.get(tag, ())}
+    cell_result = {
+        'index': idx,
+        'type': cell.get('cell_type'),
+        'source': ''.join(cell.get('source', [])),
+        'outputs': [],
+        'error': None,
+        'hidden': tuple(sorted(hidden))
+    }
+    return cell_result, tags
+
+
+class ExecutionCancelled(KeyboardInterrupt):
+    """Raised when Ctrl+C / SIGINT interrupts notebook execution.
+    
+    `results` holds the cells run so far, the interrupted one with a
+    KeyboardInterrupt error, followed by the remaining cells unexecuted.
+    convert(partial_on_cancel=True) sets `partial` once it has written a PDF
+    of them, with its bytes in `pdf` when it had no output target; save_pdf()
+    records the written path in `output`.
+    """
+    def __init__(self, results):
+        super().__init__("Execution cancelled")
+        self.results = results
+        self.partial = False
+        self.pdf = None
+        self.output = None
+
+
+def _add_unexecuted(results, cells, select=None, message=None):
+    """Append results for the cells missing from `results`, in cell order.
+    
+    `message` becomes the error of the first code cell added, explaining
+    why execution stopped there.
+    """
+    done = {result['index'] for result in results}
+    for idx, cell in enumerate(cells, 1):
+        if idx in done or (select is not None and idx not in select):
+            continue
+        cell_result, _ = _new_cell_result(idx, cell)
+        if message is not None and cell_result['type'] == 'code':
+            cell_result['error'] = f"{message}\nRemaining cells were not executed."
+            cell_result['outputs'].append({'type': 'error', 'traceback': cell_result['error']})
+            message = None
+        results.append(cell_result)
+    results.sort(key=lambda result: result['index'])
+    return results
+
+
+def ends_with_semicolon(source):
+    """True if the last Python token of source, ignoring comments, is ';'"""
+    last = None
+    try:
+        for token in tokenize.generate_tokens(io.StringIO(source).readline):
+            if token.type not in (tokenize.COMMENT, tokenize.NL, tokenize.NEWLINE, tokenize.INDENT,
+                                  tokenize.DEDENT, tokenize.ENDMARKER):
+                last = token
+    except (tokenize.TokenError, SyntaxError):
+        return False
+    return last is not None and last.type == tokenize.OP and last.string == ';'
+
+
+def execute_notebook(notebook, trace_memory=False, namespace=None, reuse=None, select=None,
+                     on_result=None, on_start=None):
+    """Execute all cells in notebook and capture outputs.
+    
+    `notebook` is a path to an .ipynb file, executed from the notebook's
+    folder so relative paths work, or an already-parsed notebook dict,
+    executed in the current working directory.
+    
+    Each code cell result carries a 'timings' dict with 'exec' and 'figures'
+    seconds; with trace_memory=True it also records 'peak_memory', the peak
+    bytes allocated above the pre-cell baseline (via tracemalloc).
+    
+    `namespace` is the globals dict cells run in (a fresh one by default);
+    `reuse` maps 1-based cell indexes to earlier results that are returned
+    as-is instead of executing the cell (used by --watch).
+    
+    `select` is an optional set of 1-based indexes; other cells are neither
+    executed nor returned. Cells tagged skip-execution are returned without
+    running, and CELL_TAG_HIDES tags set the result's 'hidden' tuple.
+    
+    `on_result` is called with each result as soon as its cell finishes, and
+    `on_start(index, count)` before each cell that is executed or rendered,
+    count being the number of cells in the notebook.
+    
+    Raises:
+        ExecutionCancelled: On KeyboardInterrupt (Ctrl+C, SIGINT), after the
+            interrupted cell has stopped and its output so far is recorded
+    """
+    if isinstance(notebook, dict):
+        nb = notebook
+        notebook_dir = None
+    else:
+        notebook_path = Path(notebook).resolve()
+        nb = load_notebook(notebook_path)
+        notebook_dir = notebook_path.parent
+    original_cwd = Path.cwd()
+    
+    # Change to notebook directory for execution so relative paths work
+    if notebook_dir is not None:
+        try:
+            os.chdir(notebook_dir)
+        except Exception as cwd_error:
+            print(f"[WARN] Could not change directory to notebook folder {notebook_dir}: {cwd_error}", file=sys.stderr)
+    
+    try:
+        cells = nb.get('cells', [])
+        results = []
+        
+        # Create global namespace for execution
+        glb = namespace if namespace is not None else {}
+        glb.setdefault('__name__', '__main__')
+        reuse = reuse or {}
+        
+        # Ensure matplotlib uses non-interactive backend in execution context
+        import matplotlib
+        matplotlib.use('Agg', force=True)
+        import matplotlib.pyplot as plt
+        plt.ioff()  # Turn off interactive mode
+        
+        # Ordered output events for the cell currently executing
+        events = []
+        # Open pyplot figures the cell already displayed, by figure number;
+        # the end-of-cell capture skips them
+        displayed_figures = {}
+        
+        # Custom display function
+        def display(*objs, **kwargs):
+            for obj in objs:
+                if hasattr(obj, 'number') and hasattr(obj, 'savefig') and plt.fignum_exists(obj.number):
+                    displayed_figures[obj.number] = obj
+                try:
+                    mime, data = get_display_data(obj)
+                except Exception:
+                    mime, data = 'text/plain', repr(obj)
+                if mime == 'text/plain':
+                    print(data)
+                else:
+                    events.append({'type': 'display', 'mime': mime, 'data': data})
+        
+        glb['display'] = display
+        
+        # Route `from IPython.display import display` to the same pipeline
+        ipython_display = None
+        if any('IPython' in ''.join(cell.get('source', [])) for cell in cells):
+            try:
+                import IPython.display as ipython_display
+                original_ipython_display = ipython_display.display
+                ipython_display.display = display
+            except Exception:
+                ipython_display = None
+        
+        started_tracing = trace_memory and not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+        
+        interrupted = False
+        try:
+            for idx, cell in enumerate(cells, 1):
+                # Filter before executing so deselected cells cost nothing
+                if select is not None and idx not in select:
+                    continue
+                if idx in reuse:
+                    results.append(reuse[idx])
+                    if on_result:
+                        on_result(reuse[idx])
+                    continue
+                if on_start:
+                    on_start(idx, len(cells))
+                
+                cell_result, tags = _new_cell_result(idx, cell)
+                source = cell_result['source']
+                
+                # Each cell records its own event list
+                events = cell_result['outputs']
+                displayed_figures.clear()
+                
+                if cell_result['type'] == 'code' and 'skip-execution' not in tags:
+                    # Capture stdout and stderr as stream events
+                    old_stdout = sys.stdout
+                    old_stderr = sys.stderr
+                    sys.stdout = OutputCapture(events, 'stdout')
+                    sys.stderr = OutputCapture(events, 'stderr')
+                    
+                    cell_timings = {'exec': 0.0, 'figures': 0.0}
+                    cell_result['timings'] = cell_timings
+                    if trace_memory:
+                        tracemalloc.reset_peak()
+                        memory_before = tracemalloc.get_traced_memory()[0]
+                    cell_start = time.perf_counter()
                     
-                    # Capture matplotlib figures after execution
                     try:
-                        import matplotlib.pyplot as plt
-                        # Get all figure numbers before capturing
-                        fig_nums = plt.get_fignums()
-                        if fig_nums:
-                            for fig_num in fig_nums:
-                                try:
-                                    fig = plt.figure(fig_num)
-                                    # Save figure to BytesIO
-                                    buf = io.BytesIO()
-                                    fig.savefig(buf, format='png', dpi=150, bbox_inches='tight')
-                                    buf.seek(0)
-                                    captured_plots.append(buf.getvalue())
-                                except Exception as fig_err:
-                                    print(f"Warning: Could not capture figure {fig_num}: {fig_err}", file=sys.stderr)
-                            plt.close('all')  # Close all figures to free memory
-                    except Exception as plt_err:
-                        print(f"Warning: Error capturing plots: {plt_err}", file=sys.stderr)
+                        # Evaluate a trailing expression to capture its value like Jupyter does;
+                        # a trailing ';' suppresses it
+                        filename = f'<cell {idx}>'
+                        tree = ast.parse(source, filename)
+                        last_expr = None
+                        if tree.body and isinstance(tree.body[-1], ast.Expr) and not ends_with_semicolon(source):
+                            last_expr = ast.Expression(tree.body.pop().value)
+                        exec(compile(tree, filename, 'exec'), glb)
+                        if last_expr is not None:
+                            result = eval(compile(last_expr, filename, 'eval'), glb)
+                            if result is not None:
+                                display(result)
+                        cell_timings['exec'] = time.perf_counter() - cell_start
                         
-                except Exception as e:
-                    import traceback
-                    cell_result['error'] = traceback.format_exc()
-                finally:
-                    sys.stdout = old_stdout
-                    sys.stderr = old_stderr
-                
-                output = buf_out.getvalue()
-                errors = buf_err.getvalue()
-                
-                if output:
-                    cell_result['output'] = output
-                if errors:
-                    cell_result['output'] += '\n[STDERR]\n' + errors
+                        # Capture matplotlib figures after execution
+                        figures_start = time.perf_counter()
+                        try:
+                            # Get all figure numbers before capturing
+                            fig_nums = plt.get_fignums()
+                            if fig_nums:
+                                for fig_num in fig_nums:
+                                    try:
+                                        fig = plt.figure(fig_num)
+                                        if displayed_figures.get(fig_num) is fig:
+                                            continue
+                                        # Save figure to BytesIO
+                                        buf = io.BytesIO()
+                                        fig.savefig(buf, format='png', dpi=150, bbox_inches='tight')
+                                        events.append({'type': 'display', 'mime': 'image/png', 'data': buf.getvalue()})
+                                    except Exception as fig_err:
+                                        print(f"Warning: Could not capture figure {fig_num}: {fig_err}", file=sys.stderr)
+                                plt.close('all')  # Close all figures to free memory
+                        except Exception as plt_err:
+                            print(f"Warning: Error capturing plots: {plt_err}", file=sys.stderr)
+                        cell_timings['figures'] = time.perf_counter() - figures_start
+                            
+                    except KeyboardInterrupt:
+                        cell_timings['exec'] = time.perf_counter() - cell_start
+                        import traceback
+                        cell_result['error'] = (traceback.format_exc()
+                                                + "Execution cancelled; remaining cells were not executed.")
+                        events.append({'type': 'error', 'traceback': cell_result['error']})
+                        plt.close('all')
+                        interrupted = True
+                    except Exception as e:
+                        cell_timings['exec'] = time.perf_counter() - cell_start
+                        import traceback
+                        cell_result['error'] = traceback.format_exc()
+                        events.append({'type': 'error', 'traceback': cell_result['error']})
+                    finally:
+                        sys.stdout = old_stdout
+                        sys.stderr = old_stderr
+                    
+                    if trace_memory:
+                        cell_timings['peak_memory'] = max(0, tracemalloc.get_traced_memory()[1] - memory_before)
+                    
+                    finish_stream_events(events)
                 
-                # Store captured DataFrames and plots
-                if captured_dataframes:
-                    cell_result['dataframes'] = [df.copy() for df in captured_dataframes]
-                if captured_plots:
-                    cell_result['plots'] = captured_plots.copy()
-            
-            results.append(cell_result)
+                results.append(cell_result)
+                if on_result:
+                    on_result(cell_result)
+                if interrupted:
+                    break
+        except KeyboardInterrupt:
+            # Arrived between cells rather than inside one
+            interrupted = True
+        finally:
+            if ipython_display is not None:
+                ipython_display.display = original_ipython_display
+            if started_tracing:
+                tracemalloc.stop()
         
+        if interrupted:
+            raise ExecutionCancelled(_add_unexecuted(results, cells, select))
         return results
     finally:
         # Restore original working directory
         os.chdir(original_cwd)
 
 
-def dataframe_to_table(df, max_rows=50):
+# Limits used by --sandbox; each --max-* flag overrides its own entry
+DEFAULT_SANDBOX_LIMITS = {
+    'memory_mb': 2048,
+    'cpu_seconds': 300,
+    'file_size_mb': 100,
+    'open_files': 256,
+}
+
+
+class ResourceLimitError(Exception):
+    """Raised in a sandboxed cell that runs past the CPU time limit"""
+
+
+def _apply_limits(limits):
+    """Set rlimits on the current (sandbox) process.
+    
+    Returns:
+        State dict whose 'cpu_exceeded' flag is set once SIGXCPU arrives
+    """
+    state = {'cpu_exceeded': False}
+    mb = 1024 * 1024
+    caps = [
+        (resource.RLIMIT_AS, limits.get('memory_mb'), mb),
+        (resource.RLIMIT_FSIZE, limits.get('file_size_mb'), mb),
+        (resource.RLIMIT_NOFILE, limits.get('open_files'), 1),
+    ]
+    for which, value, unit in caps:
+        if value:
+            _, hard = resource.getrlimit(which)
+            cap = int(value * unit)
+            if hard != resource.RLIM_INFINITY:
+                cap = min(cap, hard)
+            resource.setrlimit(which, (cap, cap))
+    
+    # Oversized writes fail with EFBIG (an OSError in the cell) instead of
+    # killing the process
+    signal.signal(signal.SIGXFSZ, signal.SIG_IGN)
+    
+    cpu_seconds = limits.get('cpu_seconds')
+    if cpu_seconds:
+        def on_cpu_limit(signum, frame):
+            # The kernel repeats SIGXCPU every second; only interrupt once
+            if not state['cpu_exceeded']:
+                state['cpu_exceeded'] = True
+                raise ResourceLimitError(f"CPU time limit of {cpu_seconds}s exceeded; "
+                                         f"remaining cells were not executed")
+        signal.signal(signal.SIGXCPU, on_cpu_limit)
+        # The hard limit (SIGKILL) catches code that never returns to Python
+        resource.setrlimit(resource.RLIMIT_CPU, (int(cpu_seconds), int(cpu_seconds) + 5))
+    return state
+
+
+def _sandbox_child(conn, nb, notebook_dir, limits, trace_memory, select, report_starts=False):
+    """Sandbox process: apply limits, execute, and stream results to the parent"""
+    if notebook_dir is not None:
+        try:
+            os.chdir(notebook_dir)
+        except Exception as cwd_error:
+            print(f"[WARN] Could not change directory to notebook folder {notebook_dir}: {cwd_error}", file=sys.stderr)
+    state = _apply_limits(limits)
+    
+    def on_result(result):
+        try:
+            conn.send(('cell', result))
+        except Exception:
+            # Fall back to text for display objects that cannot be pickled
+            for event in result['outputs']:
+                if event['type'] == 'display':
+                    event.update(type='stream', name='stdout', text=repr(event.pop('data')))
+                    del event['mime']
+            conn.send(('cell', result))
+        if state['cpu_exceeded']:
+            raise ResourceLimitError('CPU time limit exceeded')
+    
+    def on_start(index, count):
+        conn.send(('start', (index, count)))
+    
+    try:
+        execute_notebook(nb, trace_memory, select=select, on_result=on_result,
+                         on_start=on_start if report_starts else None)
+    except ResourceLimitError:
+        conn.send(('done', None))
+    except BaseException as e:
+        conn.send(('failed', f"{type(e).__name__}: {e}"))
+    else:
+        conn.send(('done', None))
+    conn.close()
+
+
+def execute_sandboxed(notebook, limits, trace_memory=False, select=None, on_result=None, on_start=None):
+    """Run execute_notebook() in a child process under resource limits.
+    
+    `limits` has the DEFAULT_SANDBOX_LIMITS keys (falsy values mean no cap).
+    Breaches are reported as cell errors: MemoryError for the address-space
+    cap, OSError for file size and open files, ResourceLimitError for CPU
+    time. When execution stops early (CPU limit, or the child is killed),
+    the results so far are kept and the remaining cells are returned
+    unexecuted, so a partial PDF can still be rendered.
+    
+    `on_result` and `on_start` are called as in execute_notebook(), as the
+    child reports each cell.
+    
+    Raises:
+        RuntimeError: If the platform has no resource module (Windows)
+        ExecutionCancelled: On KeyboardInterrupt; the child is killed at once
+    """
+    if resource is None:
+        raise RuntimeError("The execution sandbox needs a Unix system (the resource module is unavailable)")
+    
+    if isinstance(notebook, dict):
+        nb = notebook
+        notebook_dir = None
+    else:
+        notebook_path = Path(notebook).resolve()
+        nb = load_notebook(notebook_path)
+        notebook_dir = notebook_path.parent
+    
+    # fork shares already-imported modules with the child for free
+    method = 'fork' if 'fork' in multiprocessing.get_all_start_methods() else 'spawn'
+    context = multiprocessing.get_context(method)
+    parent_conn, child_conn = context.Pipe(duplex=False)
+    process = context.Process(target=_sandbox_child, daemon=True,
+                              args=(child_conn, nb, notebook_dir, limits, trace_memory, select,
+                                    on_start is not None))
+    process.start()
+    child_conn.close()
+    
+    results = []
+    status, message = None, None
+    try:
+        while status is None:
+            try:
+                kind, payload = parent_conn.recv()
+            except EOFError:
+                break
+            if kind == 'cell':
+                results.append(payload)
+                if on_result:
+                    on_result(payload)
+            elif kind == 'start':
+                on_start(*payload)
+            else:
+                status, message = kind, payload
+    except KeyboardInterrupt:
+        # Don't wait for the cell: free its CPU and memory right away
+        process.kill()
+        process.join()
+        raise ExecutionCancelled(_add_unexecuted(results, nb.get('cells', []), select,
+                                                 "Execution cancelled while running this cell"))
+    finally:
+        parent_conn.close()
+    process.join()
+    
+    if status == 'failed':
+        message = f"Execution stopped: {message}"
+    elif status is None:
+        exitcode = process.exitcode
+        if exitcode is not None and exitcode < 0:
+            cause = f"killed by {signal.Signals(-exitcode).name}"
+        else:
+            cause = f"exited with status {exitcode}"
+        message = f"Sandbox process {cause} while running this cell\n(likely a resource limit)"
+    
+    # Cells the child never reported were not executed
+    return _add_unexecuted(results, nb.get('cells', []), select, message)
+
+
+def dataframe_to_table(df, max_rows=DATAFRAME_MAX_ROWS):
     """Convert a pandas DataFrame to a ReportLab Table"""
     # Limit rows to prevent huge tables
     if len(df) > max_rows:
@@ -484,8 +2181,28 @@ def dataframe_to_table(df, max_rows=50):
         for _, row in df.iterrows():
             data.append([str(val) for val in row])
     
+    return rows_to_table(data), truncated
+
+
+def rows_to_table(data):
+    """Create a styled ReportLab Table whose first row is the header"""
+    # Pad ragged rows (e.g. HTML tables with spanning cells)
+    width = max(len(row) for row in data)
+    data = [list(row) + [''] * (width - len(row)) for row in data]
+    
+    # Cells with characters Helvetica lacks are drawn with fallback fonts
+    fonts = [('Helvetica-Bold', 9, colors.whitesmoke)] + [('Helvetica', 8, colors.black)] * (len(data) - 1)
+    cells = [[fallback_cell(value, *font) for value in row] for row, font in zip(data, fonts)]
+    col_widths = None
+    if cells != data:
+        # Table leaves out the padding when sizing flowables, so size columns here
+        col_widths = [12 + max(value.width if isinstance(value, FallbackText) else
+                               max(string_width(line, font[0], font[1]) for line in str(value).split('\n'))
+                               for value, font in zip(column, fonts))
+                      for column in zip(*cells)]
+    
     # Create table with styling
-    table = Table(data, repeatRows=1)
+    table = Table(cells, colWidths=col_widths, repeatRows=1)
     
     # Apply table style
     table.setStyle(TableStyle([
@@ -515,37 +2232,66 @@ def dataframe_to_table(df, max_rows=50):
         ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f5f5f5')]),
     ]))
     
-    return table, truncated
+    return table
 
 
-def create_pdf(notebook_path, output_path, config):
-    """Create PDF from notebook execution results"""
-    print(f"[*] Loading notebook: {notebook_path}")
-    
-    # Check if output file exists and get unique path if needed
-    output_path = get_unique_output_path(Path(output_path))
-    output_path.parent.mkdir(parents=True, exist_ok=True)
-    
-    # Execute notebook
-    print("[*] Executing cells...")
-    results = execute_notebook(notebook_path)
-    
-    # Create PDF
-    print(f"[*] Generating PDF: {output_path}")
-    doc = SimpleDocTemplate(
-        str(output_path),
-        pagesize=A4,
-        rightMargin=2*cm,
-        leftMargin=2*cm,
-        topMargin=2.5*cm,
-        bottomMargin=3.5*cm  # Increased to avoid text trimming near page numbers
-    )
+def image_flowable(image_data, max_width=16*cm):
+    """Create an Image flowable from PNG/JPEG bytes, scaled to fit the page width"""
+    img = RLImage(io.BytesIO(image_data))
+    if img.drawWidth > max_width:
+        aspect = img.drawHeight / img.drawWidth
+        img.drawWidth = max_width
+        img.drawHeight = max_width * aspect
+    return img
+
+
+def display_to_flowables(mime, data, styles, markdown_style, code_style, output_style):
+    """Render one rich display item from execute_notebook as flowables"""
+    story = []
+    if mime == 'dataframe':
+        story.append(Spacer(1, 0.1*cm))
+        table, truncated = dataframe_to_table(data)
+        story.append(table)
+        if truncated:
+            story.append(Paragraph(f"<i>... (showing first {DATAFRAME_MAX_ROWS} rows)</i>", styles['Italic']))
+        story.append(Spacer(1, 0.1*cm))
+    elif mime.startswith('image/'):
+        story.append(image_flowable(data))
+        story.append(Spacer(1, 0.2*cm))
+    elif mime == 'text/markdown':
+        story.extend(markdown_to_flowables(data, styles, markdown_style, code_style))
+    elif mime == 'text/latex':
+        tex = data.strip().strip('$').replace('\\displaystyle', '').strip()
+        story.extend(markdown_to_flowables(f'$${tex}$$', styles, markdown_style, code_style))
+    elif mime == 'text/html':
+        parser = _HTMLTableParser()
+        parser.feed(data)
+        if parser.rows:
+            rows = parser.rows[:DATAFRAME_MAX_ROWS + 1]
+            story.append(Spacer(1, 0.1*cm))
+            story.append(rows_to_table(rows))
+            if len(parser.rows) > len(rows):
+                story.append(Paragraph(f"<i>... (showing first {DATAFRAME_MAX_ROWS} rows)</i>", styles['Italic']))
+            story.append(Spacer(1, 0.1*cm))
+        else:
+            lines = [line for line in html_to_text(data).split('\n') if line.strip()]
+            if lines:
+                story.append(MonospaceBlock(lines, output_style))
+    return story
+
+
+def create_styles():
+    """Create the stylesheet for notebook content.
     
+    Returns the ReportLab sample stylesheet extended with the cell styles
+    'CellCode', 'CellOutput', 'CellError', 'CellHeader' and 'Markdown', and
+    the --merge styles 'NotebookTitle' and 'TOCEntry'.
+    """
     styles = getSampleStyleSheet()
     
     # Custom styles
-    code_style = ParagraphStyle(
-        'Code',
+    styles.add(ParagraphStyle(
+        'CellCode',
         parent=styles['Code'],
         fontSize=9,
         fontName='Courier',
@@ -557,10 +2303,10 @@ def create_pdf(notebook_path, output_path, config):
         spaceBefore=5,
         spaceAfter=5,
         leading=14  # Increased line spacing (was 9, now 14 = ~1.5x line height)
-    )
+    ))
     
-    output_style = ParagraphStyle(
-        'Output',
+    styles.add(ParagraphStyle(
+        'CellOutput',
         parent=styles['Code'],
         fontSize=9,
         fontName='Courier',
@@ -572,10 +2318,10 @@ def create_pdf(notebook_path, output_path, config):
         spaceBefore=5,
         spaceAfter=5,
         leading=14  # Increased line spacing for better readability
-    )
+    ))
     
-    error_style = ParagraphStyle(
-        'Error',
+    styles.add(ParagraphStyle(
+        'CellError',
         parent=styles['Code'],
         fontSize=9,
         fontName='Courier',
@@ -584,172 +2330,1346 @@ def create_pdf(notebook_path, output_path, config):
         textColor=colors.HexColor('#c62828'),
         backColor=colors.HexColor('#ffebee'),
         borderPadding=5,
+        spaceBefore=5,
+        spaceAfter=5,
         leading=14  # Increased line spacing for error messages
-    )
+    ))
     
-    cell_header_style = ParagraphStyle(
+    styles.add(ParagraphStyle(
         'CellHeader',
         parent=styles['Heading3'],
         fontSize=11,
         textColor=colors.HexColor('#1976d2'),
         spaceAfter=5,
         fontName='Helvetica-Bold'
-    )
+    ))
     
-    markdown_style = ParagraphStyle(
+    styles.add(ParagraphStyle(
         'Markdown',
         parent=styles['Normal'],
         fontSize=10,
         leftIndent=10,
         spaceAfter=10
-    )
+    ))
+    
+    styles.add(ParagraphStyle(
+        'NotebookTitle',
+        parent=styles['Heading1'],
+        fontSize=16,
+        textColor=colors.HexColor('#1a237e'),
+        spaceAfter=10,
+        fontName='Helvetica-Bold'
+    ))
+    
+    styles.add(ParagraphStyle(
+        'TOCEntry',
+        parent=styles['Normal'],
+        fontSize=10,
+        leading=16,
+        textColor=colors.HexColor('#424242')
+    ))
+    
+    return styles
+
+
+def cell_to_flowables(result, styles, annotate_timings=False, bookmark_cells=False, key_prefix=''):
+    """Render one execute_notebook() result as a list of flowables.
+    
+    The cell gets a named destination (key_prefix + 'cell-N') and its
+    markdown headings get outline entries; bookmark_cells=True also lists
+    the cell itself in the outline.
+    """
+    code_style = styles['CellCode']
+    output_style = styles['CellOutput']
+    error_style = styles['CellError']
+    cell_header_style = styles['CellHeader']
+    markdown_style = styles['Markdown']
+    
+    hidden = result.get('hidden', ())
+    if 'input' in hidden and ('output' in hidden or result['type'] != 'code'):
+        return []
     
     story = []
     
-    # Add header
-    story.extend(create_header(config))
+    # Cell header, with a destination (and optional outline entry) for the cell
+    icon, cell_type_label = ('📝', 'Markdown') if result['type'] == 'markdown' else ('💻', 'Code')
+    if icon in fallback_fonts():
+        # Only with a font that has the emoji; a missing glyph box looks broken
+        cell_type_label = f"{icon} {cell_type_label}"
+    header_text = font_fallback_markup(f"Cell {result['index']}: {cell_type_label}", cell_header_style.fontName)
+    if annotate_timings and result.get('timings'):
+        header_text += f' <font size="8" color="#757575">({result["timings"]["exec"]:.2f}s)</font>'
+    title = None
+    if bookmark_cells:
+        first_line = next((line.strip() for line in result['source'].split('\n') if line.strip()), '')
+        title = f"Cell {result['index']}: {first_line.lstrip('#').strip()[:60]}"
+    story.append(AnchoredParagraph(header_text, cell_header_style,
+                                   [(f"{key_prefix}cell-{result['index']}", title, None)]))
     
-    # Add cells
-    for result in results:
-        # Cell header
-        cell_type_label = "📝 Markdown" if result['type'] == 'markdown' else "💻 Code"
-        header_text = f"Cell {result['index']}: {cell_type_label}"
-        story.append(Paragraph(header_text, cell_header_style))
-        
-        if result['type'] == 'markdown':
-            # Render markdown as paragraph
-            md_text = result['source'].replace('<', '&lt;').replace('>', '&gt;')
-            # Simple markdown rendering
-            lines = md_text.split('\n')
-            for line in lines:
-                if line.strip():
-                    # Convert markdown headings
-                    if line.startswith('# '):
-                        story.append(Paragraph(f"<b>{line[2:]}</b>", styles['Heading1']))
-                    elif line.startswith('## '):
-                        story.append(Paragraph(f"<b>{line[3:]}</b>", styles['Heading2']))
-                    elif line.startswith('### '):
-                        story.append(Paragraph(f"<b>{line[4:]}</b>", styles['Heading3']))
-                    else:
-                        story.append(Paragraph(line, markdown_style))
-        
-        elif result['type'] == 'code':
-            # Add code with syntax highlighting
-            if result['source'].strip():
-                # Split code into lines and apply highlighting per line
-                code_lines = result['source'].split('\n')
-                for line in code_lines:
-                    if line.strip():
-                        # Apply syntax highlighting to non-empty lines
-                        highlighted = syntax_highlight_python(line)
-                        try:
-                            story.append(Paragraph(highlighted, code_style))
-                        except:
-                            # Fallback to plain text if highlighting fails
-                            safe_line = line.replace('<', '&lt;').replace('>', '&gt;').replace('&', '&amp;')
-                            story.append(Preformatted(safe_line, code_style))
-                    else:
-                        # Empty line
-                        story.append(Spacer(1, 0.1*cm))
+    if result['type'] == 'markdown':
+        story.extend(markdown_to_flowables(result['source'], styles, markdown_style, code_style, key_prefix))
+    
+    elif result['type'] == 'code':
+        # Add code with syntax highlighting
+        if result['source'].strip() and 'input' not in hidden:
+            # Highlight the whole cell so strings and comments spanning
+            # lines keep their colour, then cut the runs into lines
+            code_lines = [[]]
+            for text, color in highlight_python(result['source'].expandtabs(4)):
+                pieces = text.split('\n')
+                for index, piece in enumerate(pieces):
+                    if index:
+                        code_lines.append([])
+                    if piece:
+                        code_lines[-1].append((piece, color))
+            while not ''.join(text for text, _ in code_lines[-1]).strip():
+                code_lines.pop()
+            while not ''.join(text for text, _ in code_lines[0]).strip():
+                code_lines.pop(0)
+            story.append(MonospaceBlock(code_lines, code_style))
+        
+        # Render output events in the order they were produced
+        output_label_added = False
+        lines_left = MAX_OUTPUT_LINES
+        outputs = result['outputs'] if 'output' not in hidden else []
+        for event in outputs:
+            if event['type'] == 'error':
+                story.append(Spacer(1, 0.2*cm))
+                story.append(Paragraph("<b>Error:</b>", styles['Normal']))
+                story.append(MonospaceBlock(event['traceback'].expandtabs(4).rstrip('\n').split('\n'), error_style))
+                continue
             
-            # Process output - combine text and DataFrames
-            if result.get('output') or result.get('dataframes'):
+            if not output_label_added:
                 story.append(Spacer(1, 0.2*cm))
                 story.append(Paragraph("<b>Output:</b>", styles['Normal']))
                 story.append(Spacer(1, 0.1*cm))
-                
-                # If we have DataFrames, split output by markers and insert tables
-                if result.get('dataframes'):
-                    output_text = result.get('output', '')
-                    dataframes = result['dataframes']
-                    
-                    # Split by DataFrame markers
-                    parts = output_text.split('__DATAFRAME_MARKER_')
-                    
-                    for i, part in enumerate(parts):
-                        # First part is text before first DataFrame
-                        if i == 0:
-                            if part.strip():
-                                for line in part.split('\n'):
-                                    if line.strip():
-                                        safe_line = line.replace('<', '&lt;').replace('>', '&gt;')
-                                        story.append(Preformatted(safe_line, output_style))
-                        else:
-                            # Extract DataFrame index and remaining text
-                            if '__' in part:
-                                df_idx_str, remaining = part.split('__', 1)
-                                try:
-                                    df_idx = int(df_idx_str)
-                                    if df_idx < len(dataframes):
-                                        # Add the DataFrame as a table
-                                        story.append(Spacer(1, 0.1*cm))
-                                        table, truncated = dataframe_to_table(dataframes[df_idx])
-                                        story.append(table)
-                                        if truncated:
-                                            story.append(Paragraph(f"<i>... (showing first 50 rows)</i>", styles['Italic']))
-                                        story.append(Spacer(1, 0.1*cm))
-                                        
-                                        # Add remaining text after this DataFrame
-                                        if remaining.strip():
-                                            for line in remaining.split('\n'):
-                                                if line.strip():
-                                                    safe_line = line.replace('<', '&lt;').replace('>', '&gt;')
-                                                    story.append(Preformatted(safe_line, output_style))
-                                except (ValueError, IndexError):
-                                    # If parsing fails, just show as text
-                                    safe_line = part.replace('<', '&lt;').replace('>', '&gt;')
-                                    story.append(Preformatted(safe_line, output_style))
-                
-                # If no DataFrames, just show text output
-                elif result.get('output'):
-                    output_lines = result['output'].split('\n')
-                    for line in output_lines[:100]:  # Limit output lines
-                        safe_line = line.replace('<', '&lt;').replace('>', '&gt;')
-                        story.append(Preformatted(safe_line, output_style))
-                    if len(output_lines) > 100:
-                        story.append(Paragraph(f"<i>... ({len(output_lines)-100} more lines truncated)</i>", styles['Italic']))
+                output_label_added = True
             
-            # Add matplotlib plots
-            if result.get('plots'):
-                from reportlab.platypus import Image as RLImage
-                story.append(Spacer(1, 0.2*cm))
-                for plot_data in result['plots']:
-                    try:
-                        # Create image from bytes
-                        img = RLImage(io.BytesIO(plot_data))
-                        # Scale to fit page width (max 16cm to leave margins)
-                        max_width = 16*cm
-                        if img.drawWidth > max_width:
-                            aspect = img.drawHeight / img.drawWidth
-                            img.drawWidth = max_width
-                            img.drawHeight = max_width * aspect
-                        story.append(img)
-                        story.append(Spacer(1, 0.2*cm))
-                    except Exception as e:
-                        story.append(Paragraph(f"<i>[Error rendering plot: {str(e)}]</i>", styles['Italic']))
-            
-            # Add error
-            if result['error']:
-                story.append(Spacer(1, 0.2*cm))
-                story.append(Paragraph("<b>Error:</b>", styles['Normal']))
-                error_lines = result['error'].split('\n')
-                for line in error_lines:
-                    safe_line = line.replace('<', '&lt;').replace('>', '&gt;')
-                    story.append(Preformatted(safe_line, error_style))
-        
-        story.append(Spacer(1, 0.5*cm))
-    
-    # Build PDF with page numbers and footer
-    doc.build(
-        story,
-        onFirstPage=draw_footer,
-        onLaterPages=draw_footer,
-        canvasmaker=NumberedCanvas
+            if event['type'] == 'stream':
+                # Limit output lines per cell; stderr uses the error colours
+                stream_style = error_style if event['name'] == 'stderr' else output_style
+                output_lines = event['text'].rstrip('\n').expandtabs(8).split('\n')
+                if lines_left > 0:
+                    story.append(MonospaceBlock(output_lines[:lines_left], stream_style))
+                lines_left -= len(output_lines)
+            elif event['type'] == 'display':
+                try:
+                    story.extend(display_to_flowables(
+                        event['mime'], event['data'], styles, markdown_style, code_style, output_style))
+                except Exception as e:
+                    story.append(Paragraph(font_fallback_markup(f"<i>[Error rendering {event['mime']} output: {escape_markup(str(e))}]</i>"),
+                                           styles['Italic']))
+        
+        if lines_left < 0:
+            story.append(Paragraph(f"<i>... ({-lines_left} more lines truncated)</i>", styles['Italic']))
+    
+    story.append(Spacer(1, 0.5*cm))
+    
+    return story
+
+
+def build_story(results, config, annotate_timings=False, cache=None, reproducible=False, bookmark_cells=False):
+    """Turn execute_notebook() results into a list of flowables.
+    
+    `cache` is an optional dict kept between calls: results that are the
+    same objects as last time reuse their flowables instead of being
+    rendered again. Entries for results no longer present are dropped.
+    With reproducible=True the header only carries a SOURCE_DATE_EPOCH date;
+    bookmark_cells=True adds every cell to the PDF outline.
+    
+    Returns:
+        (story, cell_flowables) where cell_flowables[i] is the number of
+        flowables generated for results[i]
+    """
+    chunks = iter_story(results, config, annotate_timings, cache, reproducible, bookmark_cells)
+    story = list(next(chunks))
+    cell_flowables = []
+    for flowables in chunks:
+        story.extend(flowables)
+        cell_flowables.append(len(flowables))
+    return story, cell_flowables
+
+
+def iter_story(results, config, annotate_timings=False, cache=None, reproducible=False, bookmark_cells=False):
+    """Yield the story in chunks: the header, then each result's flowables.
+    
+    Cells are rendered only when their chunk is requested, so wrapping this
+    in a StoryStream renders them as layout reaches them; see build_story()
+    for the arguments.
+    """
+    styles = create_styles()
+    yield create_header(config, reproducible)
+    
+    for result in results:
+        cached = cache.get(id(result)) if cache is not None else None
+        if cached is not None and cached[0] is result:
+            flowables = cached[1]
+            # reportlab marks flowables pushed to the next frame and never
+            # clears it; a stale mark makes the next build raise LayoutError
+            for flowable in flowables:
+                flowable.__dict__.pop('_postponed', None)
+        else:
+            flowables = cell_to_flowables(result, styles, annotate_timings, bookmark_cells)
+            if cache is not None:
+                cache[id(result)] = (result, flowables)
+        yield flowables
+    
+    if cache is not None:
+        live = {id(result) for result in results}
+        for key in [key for key in cache if key not in live]:
+            del cache[key]
+
+
+class StoryStream(list):
+    """Story that pulls flowables from an iterable of chunks as layout consumes it.
+    
+    doc.build() takes flowables off the front of the list and checks len()
+    before each one, so refilling in __len__ keeps only the chunk being laid
+    out in memory. A trailing keepWithNext flowable pulls in the next chunk
+    so it can still be kept with what follows.
+    
+    chunk_sizes and seconds record each chunk's length and the total time
+    spent producing chunks, which layout time otherwise includes.
+    """
+    
+    def __init__(self, chunks):
+        list.__init__(self)
+        self._chunks = iter(chunks)
+        self.chunk_sizes = []
+        self.seconds = 0.0
+    
+    def __len__(self):
+        # Layout only changes the front of the list, so the tail checked
+        # below stays valid until the list runs low again
+        if self._chunks is not None and list.__len__(self) < 2:
+            while self._chunks is not None and (
+                    list.__len__(self) < 2 or self[-1].getKeepWithNext()):
+                start = time.perf_counter()
+                chunk = next(self._chunks, None)
+                self.seconds += time.perf_counter() - start
+                if chunk is None:
+                    self._chunks = None
+                else:
+                    self.chunk_sizes.append(len(chunk))
+                    self.extend(chunk)
+        return list.__len__(self)
+
+
+def write_pdf(story, target, reproducible=False, binary_streams=False, on_page=None):
+    """Lay out a story as an A4 PDF written to a path or binary file object.
+    
+    With reproducible=True, reportlab's invariant mode makes the document ID
+    a digest of the content and fixes the creation date (SOURCE_DATE_EPOCH,
+    else 2000-01-01), so identical stories produce identical bytes.
+    
+    reportlab ASCII85-encodes every compressed stream by default, adding 25%
+    to content and image data; binary_streams=True writes them raw.
+    
+    `on_page(number)` is called as layout starts each page.
+    
+    Builds in other threads wait for this one (see _BUILD_LOCK).
+    """
+    doc = SimpleDocTemplate(
+        target,
+        pagesize=A4,
+        rightMargin=2*cm,
+        leftMargin=2*cm,
+        topMargin=2.5*cm,
+        bottomMargin=3.5*cm,  # Increased to avoid text trimming near page numbers
+        invariant=True if reproducible else None
     )
+    if on_page:
+        doc.setProgressCallBack(lambda kind, value: on_page(value) if kind == 'PAGE' else None)
+    
+    with _BUILD_LOCK:
+        # useA85 is read while streams are created, so it only needs to hold
+        # for the duration of this build
+        use_a85 = rl_config.useA85
+        if binary_streams:
+            rl_config.useA85 = 0
+        # Likewise route reportlab's text measuring through the width memo
+        measure = rl_paragraph.stringWidth, rl_tables.stringWidth
+        rl_paragraph.stringWidth = rl_tables.stringWidth = string_width
+        # reportlab's timestamp raises on a SOURCE_DATE_EPOCH that is not an
+        # integer; hide it so the build falls back like get_report_date()
+        ignored_epoch = None
+        if os.environ.get('SOURCE_DATE_EPOCH', '').strip() and source_date_epoch() is None:
+            ignored_epoch = os.environ.pop('SOURCE_DATE_EPOCH')
+        try:
+            # Build PDF with page numbers and footer
+            doc.build(
+                story,
+                onFirstPage=draw_footer,
+                onLaterPages=draw_footer,
+                canvasmaker=NumberedCanvas
+            )
+        finally:
+            rl_config.useA85 = use_a85
+            rl_paragraph.stringWidth, rl_tables.stringWidth = measure
+            if ignored_epoch is not None:
+                os.environ['SOURCE_DATE_EPOCH'] = ignored_epoch
+
+
+# Options for --optimize; the --compression-level and --linearize flags override them
+DEFAULT_OPTIMIZE = {
+    'compression_level': 9,
+    'object_streams': True,
+    'linearize': False,
+}
+
+
+# Streams reportlab ASCII85-encodes by default: page contents, images and forms
+_PDF_STREAM_OBJECT = re.compile(rb'(\d+) 0 obj\n<<\n((?:(?!endobj).)*?)>>\nstream\n', re.S)
+_PDF_STREAM_LENGTH = re.compile(rb'/Length (\d+)')
+_PDF_PAGE_CONTENTS = re.compile(rb'/Contents (\d+) 0 R')
+_PDF_ENCODED_SUBTYPE = re.compile(rb'/Subtype /(?:Image|Form)\b')
+
+
+def default_pdf_size(data):
+    """Size a binary_streams=True build from write_pdf() would have had with
+    reportlab's default ASCII85 streams, without laying it out again.
+    """
+    contents = set(_PDF_PAGE_CONTENTS.findall(data))
+    size = len(data)
+    pos = 0
+    while True:
+        match = _PDF_STREAM_OBJECT.search(data, pos)
+        if not match:
+            return size
+        number, dictionary = match.groups()
+        length = int(_PDF_STREAM_LENGTH.search(dictionary).group(1))
+        pos = match.end() + length
+        if number in contents or _PDF_ENCODED_SUBTYPE.search(dictionary):
+            # Encoded data ends with '~>' and the filter list gains /ASCII85Decode
+            encoded = len(base64.a85encode(data[match.end():pos])) + 2
+            size += encoded - length + len(b'/ASCII85Decode ') + len(str(encoded)) - len(str(length))
+
+
+def optimize_pdf(data, options=None, reproducible=False, log=None):
+    """Rewrite PDF bytes with pikepdf (qpdf) to make them smaller.
+    
+    Recompresses every stream at options['compression_level'], packs objects
+    and the cross-reference table into compressed object streams, and can
+    linearize the file so viewers show page 1 before the download finishes.
+    Returns the data unchanged when pikepdf is not installed.
+    """
+    requested = options or {}
+    options = {**DEFAULT_OPTIMIZE, **requested}
+    if pikepdf is None:
+        if log:
+            log("[WARN] pikepdf is not installed (pip install pikepdf); "
+                "skipping object streams and recompression")
+            if 'compression_level' in requested:
+                log(f"[WARN] --compression-level {requested['compression_level']} needs pikepdf and was not applied")
+            if options['linearize']:
+                log("[WARN] --linearize needs pikepdf; the PDF is not linearized")
+        return data
+    
+    pikepdf.settings.set_flate_compression_level(options['compression_level'])
+    if options['object_streams']:
+        object_stream_mode = pikepdf.ObjectStreamMode.generate
+    else:
+        object_stream_mode = pikepdf.ObjectStreamMode.preserve
+    out = io.BytesIO()
+    with pikepdf.open(io.BytesIO(data)) as pdf:
+        pdf.save(
+            out,
+            compress_streams=True,
+            recompress_flate=True,
+            stream_decode_level=pikepdf.StreamDecodeLevel.generalized,
+            object_stream_mode=object_stream_mode,
+            linearize=options['linearize'],
+            deterministic_id=reproducible
+        )
+    return out.getvalue()
+
+
+class ByteCountingWriter:
+    """Write-only proxy that counts the bytes passed to a binary file object"""
+    def __init__(self, stream):
+        self.stream = stream
+        self.count = 0
+
+    def write(self, data):
+        self.count += len(data)
+        return self.stream.write(data)
+
+
+def write_output(story, out, reproducible=False, optimize=None, log=None, progress=None):
+    """Lay out a story and deliver it to `out` (see convert()).
+    
+    `progress` receives 'page' and 'phase' events as described in convert().
+    
+    Returns:
+        Dict with 'pdf' (bytes when out is None, else None), 'pdf_bytes',
+        'raw_bytes' (size of the default, unoptimized build, or None) and 'build_done'
+        (perf_counter time when layout finished)
+    """
+    is_path = isinstance(out, (str, os.PathLike))
+    
+    # Buffers and streams (e.g. stdout) skip the filesystem entirely
+    buffer = io.BytesIO() if out is None else None
+    if optimize is not None:
+        # The optimizer rewrites the whole file, so lay it out in memory first
+        target = io.BytesIO()
+    elif is_path:
+        target = str(out)
+    else:
+        target = ByteCountingWriter(buffer if out is None else out)
+    on_page = None
+    if progress:
+        def report_page(number):
+            progress({'event': 'page', 'page': number})
+        on_page = report_page
+    write_pdf(story, target, reproducible, binary_streams=optimize is not None, on_page=on_page)
+    build_done = time.perf_counter()
+    
+    raw_bytes = None
+    if optimize is not None:
+        if progress:
+            progress({'event': 'phase', 'phase': 'optimize'})
+        raw = target.getvalue()
+        # Compare against what a plain build would have written, ASCII85 and all
+        raw_bytes = default_pdf_size(raw)
+        pdf = optimize_pdf(raw, optimize, reproducible, log)
+        if log:
+            log(f"[INFO] PDF size: {raw_bytes / 1024:.1f} KB -> {len(pdf) / 1024:.1f} KB "
+                f"({(len(pdf) - raw_bytes) / raw_bytes:+.0%}) after optimization")
+        if is_path:
+            Path(out).write_bytes(pdf)
+        else:
+            (buffer if out is None else out).write(pdf)
+        pdf_bytes = len(pdf)
+    else:
+        pdf_bytes = Path(out).stat().st_size if is_path else target.count
+    
+    return {
+        'pdf': buffer.getvalue() if buffer is not None else None,
+        'pdf_bytes': pdf_bytes,
+        'raw_bytes': raw_bytes,
+        'build_done': build_done
+    }
+
+
+def convert(notebook, config=None, out=None, timings=None, annotate_timings=False, log=None, select=None,
+            limits=None, reproducible=False, optimize=None, bookmark_cells=False, progress=None,
+            partial_on_cancel=False):
+    """Convert a notebook to PDF (library entry point).
+    
+    Nothing is printed unless `log` is given, and no temp files are used.
+    
+    Args:
+        notebook: Path to a .ipynb file or an already-parsed notebook dict
+            (dicts execute in the current working directory)
+        config: Header info dict; missing keys fall back to DEFAULT_CONFIG
+        out: Output path, a writable binary file object (e.g.
+            sys.stdout.buffer), or None to return the PDF as bytes. Only
+            paths touch the filesystem.
+        timings: Optional dict filled with phase and per-cell timings
+            (enables tracemalloc memory tracking while executing)
+        annotate_timings: Append each code cell's runtime to its header
+        log: Optional callable receiving progress messages (e.g. print)
+        select: Optional set of 1-based cell indexes to execute and render
+            (see parse_cell_ranges); cell tags are honoured either way
+        limits: Optional dict of resource limits (see DEFAULT_SANDBOX_LIMITS);
+            cells then run in a separate, capped process via execute_sandboxed()
+        reproducible: Produce byte-identical output for identical inputs
+            (fixed metadata and document ID; dates from SOURCE_DATE_EPOCH)
+        optimize: Optional dict of size optimizations (see DEFAULT_OPTIMIZE,
+            optimize_pdf()); the PDF is then laid out in memory and rewritten
+        bookmark_cells: List every cell in the PDF outline, not just markdown
+            headings (cells always get a cell-N named destination)
+        progress: Optional callable receiving event dicts as work proceeds:
+            {'event': 'phase', 'phase': 'execute' | 'layout' | 'optimize'},
+            {'event': 'cell_start', 'index', 'cells'} and
+            {'event': 'cell_end', 'index', 'seconds', 'error'} per cell run,
+            and {'event': 'page', 'page'} as layout starts each page
+        partial_on_cancel: When execution is interrupted, still write a PDF
+            of the cells run so far before raising ExecutionCancelled
+    
+    Returns:
+        PDF bytes when out is None, otherwise None
+    
+    Raises:
+        ExecutionCancelled: If execution is interrupted (Ctrl+C, SIGINT)
+    
+    Example:
+        >>> import nb2pdf, io
+        >>> buffer = io.BytesIO()
+        >>> nb2pdf.convert(notebook_dict, {'name': 'Jane'}, buffer)
+    """
+    start = time.perf_counter()
+    config = {**DEFAULT_CONFIG, **(config or {})}
+    is_path = isinstance(out, (str, os.PathLike))
+    
+    on_start = on_result = None
+    if progress:
+        progress({'event': 'phase', 'phase': 'execute'})
+        
+        started = {}
+        
+        def report_start(index, count):
+            started[index] = time.perf_counter()
+            progress({'event': 'cell_start', 'index': index, 'cells': count})
+        
+        def report_result(result):
+            # Reused cells report a result without having started
+            start = started.pop(result['index'], None)
+            if start is not None:
+                progress({'event': 'cell_end', 'index': result['index'],
+                          'seconds': round(time.perf_counter() - start, 3),
+                          'error': result['error'] is not None})
+        
+        on_start, on_result = report_start, report_result
+    
+    # Execute notebook
+    if log:
+        log("[*] Executing cells...")
+    cancelled = None
+    try:
+        if limits:
+            results = execute_sandboxed(notebook, limits, trace_memory=timings is not None, select=select,
+                                        on_result=on_result, on_start=on_start)
+        else:
+            results = execute_notebook(notebook, trace_memory=timings is not None, select=select,
+                                       on_result=on_result, on_start=on_start)
+    except ExecutionCancelled as e:
+        if not partial_on_cancel:
+            raise
+        if log:
+            log("[WARN] Execution cancelled; writing a PDF of the cells run so far")
+        results, cancelled = e.results, e
+    execute_done = time.perf_counter()
+    
+    # Create PDF; cells are rendered as layout reaches them, so only the
+    # flowables of the page being laid out are alive at any time
+    if log:
+        log(f"[*] Generating PDF: {out}" if is_path else "[*] Generating PDF...")
+    if progress:
+        progress({'event': 'phase', 'phase': 'layout'})
+    story = StoryStream(iter_story(results, config, annotate_timings, reproducible=reproducible,
+                                   bookmark_cells=bookmark_cells))
+    cache_before = layout_cache_stats()
+    output = write_output(story, out, reproducible, optimize, log, progress)
+    build_done = output['build_done']
+    optimize_done = time.perf_counter()
+    
+    if timings is not None:
+        # Report rendering as its own phase, as if it had run before layout
+        story_done = execute_done + story.seconds
+        cells = []
+        for result, flowables in zip(results, story.chunk_sizes[1:]):
+            cells.append({
+                'index': result['index'],
+                'type': result['type'],
+                **result.get('timings', {}),
+                'flowables': flowables
+            })
+        timings.update({
+            'notebook': None if isinstance(notebook, dict) else str(notebook),
+            'output': str(out) if is_path else None,
+            'execute': execute_done - start,
+            'story': story_done - execute_done,
+            'build': build_done - story_done,
+            'optimize': optimize_done - build_done,
+            'total': optimize_done - start,
+            'pdf_bytes': output['pdf_bytes'],
+            'pdf_bytes_unoptimized': output['raw_bytes'],
+            'layout_cache': {key: count - cache_before[key] for key, count in layout_cache_stats().items()},
+            'cells': cells
+        })
+    
+    if cancelled is not None:
+        cancelled.partial = True
+        cancelled.pdf = output['pdf']
+        raise cancelled
+    return output['pdf']
+
+
+def merge_notebooks(notebooks, config=None, out=None, log=None, annotate_timings=False, limits=None,
+                    reproducible=False, optimize=None, bookmark_cells=False):
+    """Convert several notebooks into one PDF with a section per notebook.
+    
+    The bundle opens with the usual header and a table of contents; every
+    notebook starts on a new page under its file name and gets an outline
+    entry. Fonts and images are shared document resources, so they are
+    stored once however many notebooks use them.
+    
+    Notebooks are executed and rendered one at a time while the document is
+    laid out (see StoryStream), so memory holds one notebook's flowables
+    rather than the whole bundle. A notebook that cannot be loaded gets a
+    section with the error instead of aborting the bundle.
+    
+    Args:
+        notebooks: List of notebook paths
+        config, out, log, annotate_timings, limits, reproducible, optimize,
+        bookmark_cells: As for convert(); cell and heading destinations are
+            prefixed with the notebook's, e.g. notebook-2.cell-5
+        
+    Returns:
+        PDF bytes when out is None, otherwise None
+    """
+    config = {**DEFAULT_CONFIG, **(config or {})}
+    styles = create_styles()
+    notebooks = [Path(notebook) for notebook in notebooks]
+    keys = [f"notebook-{index}" for index in range(1, len(notebooks) + 1)]
+    
+    def chunks():
+        yield create_header(config, reproducible) + [
+            Paragraph("Contents", styles['NotebookTitle']),
+            TableOfContents([(path.name, key) for path, key in zip(notebooks, keys)],
+                            styles['TOCEntry'])
+        ]
+        for index, (path, key) in enumerate(zip(notebooks, keys), 1):
+            if log:
+                log(f"[*] Executing notebook {index}/{len(notebooks)}: {path}")
+            section = [PageBreak(),
+                       AnchoredParagraph(font_fallback_markup(escape_markup(path.name), styles['NotebookTitle'].fontName),
+                                         styles['NotebookTitle'], [(key, path.name, 0)])]
+            try:
+                if limits:
+                    results = execute_sandboxed(path, limits)
+                else:
+                    results = execute_notebook(path)
+            except Exception as e:
+                if log:
+                    log(f"[ERROR] {path}: {e}")
+                section.append(MonospaceBlock(f"Could not convert this notebook:\n{e}".split('\n'), styles['CellError']))
+                yield section
+                continue
+            yield section
+            for result in results:
+                yield cell_to_flowables(result, styles, annotate_timings, bookmark_cells, f"{key}.")
+    
+    if log:
+        log(f"[*] Generating PDF: {out}" if isinstance(out, (str, os.PathLike)) else "[*] Generating PDF...")
+    return write_output(StoryStream(chunks()), out, reproducible, optimize, log)['pdf']
+
+
+def create_pdf(notebook_path, output_path, config, timings=None, annotate_timings=False, select=None,
+               limits=None, reproducible=False, optimize=None, bookmark_cells=False, progress=None,
+               partial_on_cancel=False, overwrite=False):
+    """Create PDF from notebook execution results (command-line entry point).
+    
+    Prints progress and writes as described in save_pdf(); see convert()
+    for the arguments.
+    
+    Returns:
+        Path of the written PDF
+    """
+    print(f"[*] Loading notebook: {notebook_path}")
+    
+    def render(out):
+        return convert(notebook_path, config, out, timings=timings, annotate_timings=annotate_timings,
+                       log=print, select=select, limits=limits, reproducible=reproducible,
+                       optimize=optimize, bookmark_cells=bookmark_cells, progress=progress,
+                       partial_on_cancel=partial_on_cancel)
+    
+    output_path = save_pdf(output_path, render, reproducible, overwrite)
+    if timings is not None:
+        timings['output'] = str(output_path)
+    return output_path
+
+
+def create_merged_pdf(notebook_paths, output_path, config, annotate_timings=False, limits=None,
+                      reproducible=False, optimize=None, bookmark_cells=False, overwrite=False):
+    """Create one PDF from several notebooks (command-line entry point for --merge).
+    
+    Writes like create_pdf(); see merge_notebooks() for the arguments.
+    
+    Returns:
+        Path of the written PDF
+    """
+    print(f"[*] Merging {len(notebook_paths)} notebooks")
+    
+    def render(out):
+        return merge_notebooks(notebook_paths, config, out, log=print, annotate_timings=annotate_timings,
+                               limits=limits, reproducible=reproducible, optimize=optimize,
+                               bookmark_cells=bookmark_cells)
+    
+    return save_pdf(output_path, render, reproducible, overwrite)
+
+
+def save_pdf(output_path, render, reproducible=False, overwrite=False):
+    """Write a report with render(out), which takes a convert()-style target.
+    
+    Writes to a unique path next to any existing file. With overwrite=True
+    an existing file is replaced atomically, so PDF viewers never load a
+    half-written one. In reproducible mode the output path is overwritten
+    too, and left untouched when its bytes would not change.
+    
+    If render() is interrupted, a partial PDF it produced is kept (and its
+    path set as the ExecutionCancelled's `output`); anything half-written
+    is removed.
+    
+    Returns:
+        Path of the written PDF
+    """
+    if reproducible:
+        output_path = Path(output_path)
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            pdf = render(None)
+        except ExecutionCancelled as e:
+            if e.partial:
+                output_path.write_bytes(e.pdf)
+                print(f"[WARN] Partial PDF written: {output_path}")
+                e.output = output_path
+            raise
+        if output_path.exists() and output_path.read_bytes() == pdf:
+            print(f"[INFO] Output unchanged: {output_path}")
+        else:
+            output_path.write_bytes(pdf)
+            print(f"[SUCCESS] PDF created successfully: {output_path}")
+        print(f"[INFO] SHA-256: {hashlib.sha256(pdf).hexdigest()}")
+        return output_path
+    
+    if overwrite:
+        output_path = Path(output_path)
+        target = output_path.with_name(output_path.name + '.tmp')
+    else:
+        # Check if output file exists and get unique path if needed
+        output_path = get_unique_output_path(Path(output_path))
+        target = output_path
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    
+    try:
+        render(target)
+    except KeyboardInterrupt as e:
+        if isinstance(e, ExecutionCancelled) and e.partial:
+            os.replace(target, output_path)
+            print(f"[WARN] Partial PDF written: {output_path}")
+            e.output = output_path
+        else:
+            target.unlink(missing_ok=True)
+        raise
+    except Exception:
+        if overwrite:
+            target.unlink(missing_ok=True)
+        raise
+    os.replace(target, output_path)
     print(f"[SUCCESS] PDF created successfully: {output_path}")
+    return output_path
+
+
+def _cell_key(cell):
+    tags = (cell.get('metadata') or {}).get('tags') or []
+    return (cell.get('cell_type'), ''.join(cell.get('source', [])), tuple(tags))
+
+
+# Largest namespace --watch copies to resume from; bigger ones re-run from cell 1
+SNAPSHOT_MAX_BYTES = 64 * 1024 * 1024
+
+
+def _namespace_size(namespace, limit):
+    """Approximate bytes held by a namespace's values, or None once over `limit`.
+    
+    Follows containers and instance attributes; numpy and pandas objects
+    report their data through sys.getsizeof. Modules, classes and functions
+    are shared by snapshots, so they are not counted.
+    """
+    shared = (types.ModuleType, type, types.FunctionType, types.BuiltinFunctionType)
+    stack = [value for name, value in namespace.items() if name != '__builtins__']
+    seen = set()
+    total = 0
+    while stack:
+        value = stack.pop()
+        if id(value) in seen or isinstance(value, shared):
+            continue
+        seen.add(id(value))
+        total += sys.getsizeof(value, 0)
+        if total > limit:
+            return None
+        if isinstance(value, dict):
+            stack.extend(value.keys())
+            stack.extend(value.values())
+        elif isinstance(value, (list, tuple, set, frozenset)):
+            stack.extend(value)
+        elif isinstance(getattr(value, '__dict__', None), dict):
+            stack.extend(value.__dict__.values())
+    return total
+
+
+def snapshot_namespace(namespace, max_bytes=SNAPSHOT_MAX_BYTES):
+    """Deep copy of a cell namespace, or None if it is larger than `max_bytes`
+    or a value cannot be copied.
+    
+    Modules and builtins are shared rather than copied.
+    """
+    if _namespace_size(namespace, max_bytes) is None:
+        return None
+    shared = {id(value): value for value in namespace.values() if isinstance(value, types.ModuleType)}
+    shared[id(namespace.get('__builtins__'))] = namespace.get('__builtins__')
+    try:
+        return copy.deepcopy(namespace, shared)
+    except Exception:
+        return None
+
+
+class WatchSession:
+    """Incremental execution state for `--watch`.
+    
+    Keeps the previous run's results and a single namespace snapshot, taken
+    just before the first code cell the last edit touched. A later edit at or
+    below that cell resumes from the snapshot; any other edit, or a namespace
+    too large to snapshot, re-runs the notebook from cell 1.
+    """
+    def __init__(self, select=None, max_snapshot_bytes=SNAPSHOT_MAX_BYTES):
+        self.select = select
+        self.max_snapshot_bytes = max_snapshot_bytes
+        self.namespace = {}
+        self.keys = []
+        self.results = []
+        # (1-based index of the next cell to run, namespace copy) or None
+        self.snapshot = None
+
+    def run(self, nb):
+        """Execute the cells of `nb` that changed since the last run, and those below.
+        
+        Returns:
+            Tuple of (results, code cells executed, cells reused)
+        """
+        keys = [_cell_key(cell) for cell in nb.get('cells', [])]
+        
+        # Re-execute from the first code cell that changed, moved or was removed
+        restart = len(keys)
+        for i in range(max(len(keys), len(self.keys))):
+            old = self.keys[i] if i < len(self.keys) else (None, None)
+            new = keys[i] if i < len(keys) else (None, None)
+            if old != new and 'code' in (old[0], new[0]):
+                restart = i
+                break
+        code_changed = restart < max(len(keys), len(self.keys))
+        
+        # Cells before `resume` keep their results; the rest run in self.namespace
+        if not code_changed:
+            resume = len(keys)
+        elif self.snapshot is not None and self.snapshot[0] - 1 <= restart:
+            resume, self.namespace = self.snapshot[0] - 1, self.snapshot[1]
+        else:
+            resume, self.namespace = 0, {}
+        if code_changed:
+            # Release the old copy before taking the next one
+            self.snapshot = None
+        
+        previous_results = {result['index']: result for result in self.results}
+        reuse = {}
+        for i, key in enumerate(keys[:len(self.keys)]):
+            if key == self.keys[i] and (i < resume or key[0] != 'code') and i + 1 in previous_results:
+                reuse[i + 1] = previous_results[i + 1]
+        executed = sum(1 for i, key in enumerate(keys[resume:], resume + 1)
+                       if key[0] == 'code' and (self.select is None or i in self.select))
+        
+        pending = [restart + 1] if code_changed else []
+        
+        def on_start(index, count):
+            if pending and index >= pending[0]:
+                pending.clear()
+                snapshot = snapshot_namespace(self.namespace, self.max_snapshot_bytes)
+                if snapshot is not None:
+                    self.snapshot = (index, snapshot)
+        
+        self.results = execute_notebook(nb, namespace=self.namespace, reuse=reuse, select=self.select,
+                                        on_start=on_start)
+        self.keys = keys
+        return self.results, executed, len(reuse)
+
+
+def watch_notebook(notebook_path, output_path, config, interval=0.5, annotate_timings=False, select=None,
+                   bookmark_cells=False):
+    """Re-render the PDF every time the notebook is saved (`--watch`).
+    
+    Like "Run All Below" in Jupyter, only cells from the first changed code
+    cell onward are re-executed when a namespace snapshot allows it (see
+    WatchSession). Unchanged cells keep their results and flowables. Runs
+    until interrupted.
+    """
+    notebook_path = Path(notebook_path).resolve()
+    output_path = Path(output_path).resolve()
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = output_path.with_name(output_path.name + '.tmp')
+    
+    # The watcher owns the process, so run cells from the notebook folder
+    os.chdir(notebook_path.parent)
+    
+    session = WatchSession(select)
+    flowable_cache = {}
+    last_stat = None
+    print(f"[*] Watching {notebook_path} (Ctrl+C to stop)")
+    
+    while True:
+        try:
+            stat = notebook_path.stat()
+            stat_key = (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            stat_key = None
+        if stat_key is None or stat_key == last_stat:
+            time.sleep(interval)
+            continue
+        
+        try:
+            nb = load_notebook(notebook_path)
+        except ValueError:
+            # The editor is still writing the file; retry on the next poll
+            time.sleep(interval)
+            continue
+        last_stat = stat_key
+        start = time.perf_counter()
+        
+        try:
+            results, executed, reused = session.run(nb)
+            story, _ = build_story(results, config, annotate_timings, cache=flowable_cache,
+                                   bookmark_cells=bookmark_cells)
+            # Replace atomically so PDF viewers never load a half-written file
+            write_pdf(story, str(temp_path))
+            os.replace(temp_path, output_path)
+        except Exception as e:
+            print(f"[ERROR] Error creating PDF: {e}")
+        else:
+            print(f"[SUCCESS] {output_path.name} updated in {time.perf_counter() - start:.2f}s "
+                  f"({executed} code cells executed, {reused} cells reused)")
+
+
+class QueueFullError(Exception):
+    """Raised when the conversion service has no room for another job"""
+
+
+class ConversionError(Exception):
+    """Raised when a worker fails to convert a notebook"""
+
+
+# Modules `serve` and `batch` import once so each conversion starts warm
+DEFAULT_PRELOAD = 'numpy,pandas,matplotlib.pyplot'
+
+
+def preload_modules(names):
+    """Import the named modules up front, and build the font fallback maps.
+    
+    Modules that are missing are skipped.
+    """
+    import importlib
+    for module_name in names:
+        try:
+            importlib.import_module(module_name)
+        except Exception:
+            pass
+    fallback_fonts()
+    fallback_fonts('mono')
+
+
+def _serve_worker(conn, preload, options=None):
+    """Worker process loop for `serve`: pre-import modules, then convert jobs"""
+    preload_modules(preload)
+    conn.send(('ready', None))
+    while True:
+        try:
+            job = conn.recv()
+        except EOFError:
+            break
+        if job is None:
+            break
+        notebook, config = job
+        try:
+            conn.send(('ok', convert(notebook, config, **(options or {}))))
+        except Exception as e:
+            conn.send(('error', f"{type(e).__name__}: {e}"))
+
+
+class _Worker:
+    """A conversion worker process and the parent end of its pipe"""
+    def __init__(self, context, preload, options=None):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_serve_worker, args=(child_conn, preload, options), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.ready = False
+        self.jobs = 0
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+        except (OSError, ValueError):
+            pass
+        self.process.join(timeout=1)
+        if self.process.is_alive():
+            self.process.kill()
+        self.conn.close()
+
+
+class ConversionPool:
+    """Pre-warmed worker processes with a bounded job queue.
+    
+    At most `workers + queue_size` jobs are accepted at once; submit() raises
+    QueueFullError beyond that. A job that runs past `timeout` seconds has its
+    worker killed and replaced. Workers are recycled after `max_jobs` jobs so
+    state leaked by user code does not accumulate. `options` are extra
+    convert() keyword arguments applied to every job (e.g. reproducible).
+    """
+    def __init__(self, workers=2, queue_size=8, timeout=120, preload=(), max_jobs=100, options=None):
+        # spawn is safe with the server's threads and works on every platform
+        self._context = multiprocessing.get_context('spawn')
+        self.workers = workers
+        self.capacity = workers + queue_size
+        self.timeout = timeout
+        self.preload = list(preload)
+        self.max_jobs = max_jobs
+        self.options = dict(options or {})
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.counters = {'completed': 0, 'failed': 0, 'rejected': 0, 'timeouts': 0}
+        self.latencies = collections.deque(maxlen=1000)
+        for _ in range(workers):
+            self._idle.put(_Worker(self._context, self.preload, self.options))
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def submit(self, notebook, config=None):
+        """Convert a notebook dict in a worker and return the PDF bytes"""
+        with self._lock:
+            if self.in_flight >= self.capacity:
+                self.counters['rejected'] += 1
+                raise QueueFullError(f"{self.in_flight} jobs in flight")
+            self.in_flight += 1
+        start = time.perf_counter()
+        worker = self._idle.get()
+        try:
+            if not worker.ready:
+                # Wait for pre-imports outside of the job's time budget
+                if not worker.conn.poll(300):
+                    raise EOFError("worker did not start")
+                worker.conn.recv()
+                worker.ready = True
+            worker.conn.send((notebook, config))
+            finished = worker.conn.poll(self.timeout)
+            if finished:
+                status, payload = worker.conn.recv()
+        except (EOFError, OSError) as e:
+            worker.process.kill()
+            worker = _Worker(self._context, self.preload, self.options)
+            self._count('failed')
+            raise ConversionError(f"worker crashed: {e}")
+        else:
+            if not finished:
+                worker.process.kill()
+                worker = _Worker(self._context, self.preload, self.options)
+            else:
+                worker.jobs += 1
+                if worker.jobs >= self.max_jobs:
+                    worker.stop()
+                    worker = _Worker(self._context, self.preload, self.options)
+        finally:
+            self._idle.put(worker)
+            with self._lock:
+                self.in_flight -= 1
+        
+        with self._lock:
+            self.latencies.append(time.perf_counter() - start)
+        if not finished:
+            self._count('timeouts')
+            raise TimeoutError(f"conversion exceeded {self.timeout:g}s")
+        if status == 'error':
+            self._count('failed')
+            raise ConversionError(payload)
+        self._count('completed')
+        return payload
+
+    def metrics(self):
+        """Queue depth, counters and latency percentiles (milliseconds)"""
+        with self._lock:
+            latencies = sorted(self.latencies)
+            in_flight = self.in_flight
+            counters = dict(self.counters)
+        busy = max(0, self.workers - self._idle.qsize())
+        percentiles = {}
+        for p in (50, 90, 99):
+            if latencies:
+                value = latencies[min(len(latencies) - 1, int(round(p / 100 * (len(latencies) - 1))))]
+                percentiles[f'p{p}'] = round(value * 1000, 1)
+            else:
+                percentiles[f'p{p}'] = None
+        return {
+            'workers': self.workers,
+            'busy_workers': busy,
+            'queue_depth': max(0, in_flight - busy),
+            'in_flight': in_flight,
+            'capacity': self.capacity,
+            **counters,
+            'latency_ms': percentiles
+        }
+
+    def close(self):
+        while not self._idle.empty():
+            self._idle.get_nowait().stop()
+
+
+class ConversionRequestHandler(BaseHTTPRequestHandler):
+    """HTTP API for `serve`: POST /convert, GET /metrics and GET /health"""
+    server_version = 'nb2pdf'
+    
+    def _send(self, status, body, content_type='application/json', headers=None):
+        if isinstance(body, (dict, list)):
+            body = json.dumps(body).encode('utf-8')
+        elif isinstance(body, str):
+            body = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def do_GET(self):
+        path = self.path.split('?', 1)[0]
+        if path == '/metrics':
+            self._send(200, self.server.pool.metrics())
+        elif path == '/health':
+            self._send(200, {'status': 'ok'})
+        else:
+            self._send(404, {'error': 'not found'})
+    
+    def do_POST(self):
+        if self.path.split('?', 1)[0] != '/convert':
+            self._send(404, {'error': 'not found'})
+            return
+        length = int(self.headers.get('Content-Length') or 0)
+        if length > self.server.max_body:
+            self._send(413, {'error': f'request body exceeds {self.server.max_body} bytes'})
+            return
+        try:
+            payload = parse_json(self.rfile.read(length))
+        except ValueError as e:
+            self._send(400, {'error': f'invalid JSON: {e}'})
+            return
+        
+        # Accept a bare notebook or {"notebook": {...}, "config": {...}}
+        if isinstance(payload, dict) and 'cells' in payload:
+            notebook, config = payload, None
+        elif isinstance(payload, dict) and isinstance(payload.get('notebook'), dict):
+            notebook, config = payload['notebook'], payload.get('config')
+        else:
+            self._send(400, {'error': 'expected a notebook or {"notebook": ..., "config": ...}'})
+            return
+        cells = notebook.get('cells', [])
+        if not isinstance(cells, list) or not all(isinstance(cell, dict) for cell in cells):
+            self._send(400, {'error': '"cells" must be a list of cell objects'})
+            return
+        if config is not None and not isinstance(config, dict):
+            self._send(400, {'error': '"config" must be an object'})
+            return
+        for key in DEFAULT_CONFIG:
+            if config and key in config and not isinstance(config[key], str):
+                self._send(400, {'error': f'"config.{key}" must be a string'})
+                return
+        # Saved outputs are never used, so don't pay to pickle them to a worker
+        strip_saved_outputs(notebook)
+        
+        try:
+            pdf = self.server.pool.submit(notebook, config)
+        except QueueFullError:
+            self._send(429, {'error': 'conversion queue is full'}, headers={'Retry-After': '1'})
+        except TimeoutError as e:
+            self._send(504, {'error': str(e)})
+        except ConversionError as e:
+            self._send(500, {'error': str(e)})
+        else:
+            headers = {}
+            if self.server.pool.options.get('reproducible'):
+                # Output is a pure function of the request, so it can be cached
+                etag = f'"{hashlib.sha256(pdf).hexdigest()}"'
+                if etag in (self.headers.get('If-None-Match') or ''):
+                    self.send_response(304)
+                    self.send_header('ETag', etag)
+                    self.end_headers()
+                    return
+                headers['ETag'] = etag
+            self._send(200, pdf, content_type='application/pdf', headers=headers)
+
+
+def serve_main(argv):
+    """Run the HTTP conversion service (`nb2pdf.py serve --http`)"""
+    parser = argparse.ArgumentParser(
+        prog='nb2pdf.py serve',
+        description='Run nb2pdf as an HTTP conversion service',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Endpoints:
+  POST /convert   notebook JSON (or {"notebook": ..., "config": ...}) -> application/pdf
+  GET  /metrics   queue depth, counters and latency percentiles
+  GET  /health    liveness check
+
+Example:
+  python nb2pdf.py serve --http --port 8000 --workers 4
+  curl -X POST --data-binary @notebook.ipynb http://localhost:8000/convert -o report.pdf
+        """
+    )
+    parser.add_argument('--http', action='store_true', help='Serve over HTTP (the default and only transport)')
+    parser.add_argument('--host', default='127.0.0.1', help='Interface to bind (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8000, help='Port to listen on (default: 8000)')
+    parser.add_argument('--workers', type=int, default=max(1, (os.cpu_count() or 2) // 2),
+                        help='Worker processes (default: half the CPU count)')
+    parser.add_argument('--queue-size', type=int, default=8, help='Jobs allowed to wait for a worker before 429 (default: 8)')
+    parser.add_argument('--timeout', type=float, default=120, help='Per-job timeout in seconds (default: 120)')
+    parser.add_argument('--preload', default=DEFAULT_PRELOAD,
+                        help='Comma-separated modules each worker imports at startup')
+    parser.add_argument('--max-body', type=int, default=50, help='Maximum request size in MB (default: 50)')
+    parser.add_argument('--reproducible', action='store_true',
+                        help='Byte-identical PDFs for identical requests, served with an ETag')
+    parser.add_argument('--optimize', action='store_true',
+                        help='Serve smaller, linearized PDFs (see the converter\'s --optimize)')
+    args = parser.parse_args(argv)
+    
+    preload = [name.strip() for name in args.preload.split(',') if name.strip()]
+    options = {'reproducible': args.reproducible}
+    if args.optimize:
+        options['optimize'] = {'linearize': True}
+    pool = ConversionPool(args.workers, args.queue_size, args.timeout, preload, options=options)
+    server = ThreadingHTTPServer((args.host, args.port), ConversionRequestHandler)
+    server.daemon_threads = True
+    server.pool = pool
+    server.max_body = args.max_body * 1024 * 1024
+    print(f"[*] nb2pdf service listening on http://{args.host}:{server.server_port} "
+          f"({args.workers} workers, queue {args.queue_size}, timeout {args.timeout:g}s)", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("[*] Shutting down")
+    finally:
+        server.server_close()
+        pool.close()
+
+
+def _batch_convert(job):
+    """Convert one notebook inside a freshly forked `batch` worker"""
+    notebook_path, output_path, config = job
+    start = time.perf_counter()
+    try:
+        convert(notebook_path, config, output_path)
+        error = None
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    return {
+        'notebook': str(notebook_path),
+        'output': str(output_path),
+        'seconds': time.perf_counter() - start,
+        'error': error
+    }
+
+
+def batch_main(argv):
+    """Convert many notebooks in parallel (`nb2pdf.py batch`)"""
+    parser = argparse.ArgumentParser(
+        prog='nb2pdf.py batch',
+        description='Convert many notebooks in parallel from a warm fork server',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+The parent process imports the --preload modules once, then forks a fresh
+child per notebook: every notebook gets a clean interpreter state, but
+inherits the already-imported modules instead of importing them again.
+
+Example:
+  python nb2pdf.py batch submissions/*.ipynb --output-dir reports --jobs 8
+  python nb2pdf.py batch *.ipynb --preload numpy,pandas,sklearn
+        """
+    )
+    parser.add_argument('notebooks', nargs='+', help='Notebooks (.ipynb) to convert')
+    parser.add_argument('--output-dir', '-d', help='Folder for the PDFs (default: next to each notebook)')
+    parser.add_argument('--config', '-c', help='Student info config file (default: student_info.json)')
+    parser.add_argument('--jobs', '-j', type=int, default=os.cpu_count() or 1,
+                        help='Notebooks converted at once (default: CPU count)')
+    parser.add_argument('--preload', default=DEFAULT_PRELOAD,
+                        help='Comma-separated modules to import once before forking')
+    args = parser.parse_args(argv)
+    
+    config = load_config(args.config or 'student_info.json')
+    jobs = []
+    targets = set()
+    for notebook in args.notebooks:
+        notebook_path = Path(notebook)
+        if not notebook_path.exists() or notebook_path.suffix != '.ipynb':
+            print(f"[ERROR] Not a notebook: {notebook_path}")
+            sys.exit(1)
+        if args.output_dir:
+            output_path = Path(args.output_dir) / notebook_path.with_suffix('.pdf').name
+        else:
+            output_path = notebook_path.with_suffix('.pdf')
+        # Notebooks with the same name (b1/x.ipynb, b2/x.ipynb) must not share a PDF
+        candidate, count = get_unique_output_path(output_path), 1
+        while candidate.resolve() in targets:
+            count += 1
+            candidate = get_unique_output_path(output_path.with_name(f"{output_path.stem}_{count}.pdf"))
+        if count > 1:
+            print(f"[INFO] {notebook_path} has the same output name as an earlier notebook. Creating: {candidate.name}")
+        output_path = candidate
+        targets.add(output_path.resolve())
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        jobs.append((notebook_path, output_path, config))
+    
+    preload = [name.strip() for name in args.preload.split(',') if name.strip()]
+    start = time.perf_counter()
+    if 'fork' in multiprocessing.get_all_start_methods():
+        # Import once here; each single-use worker is forked from this state
+        preload_modules(preload)
+        context = multiprocessing.get_context('fork')
+        pool_options = {'maxtasksperchild': 1}
+    else:
+        # Without fork, warm each long-lived worker once instead
+        context = multiprocessing.get_context('spawn')
+        pool_options = {'initializer': preload_modules, 'initargs': (preload,)}
+    print(f"[*] Converting {len(jobs)} notebooks with {args.jobs} workers "
+          f"(preloaded in {time.perf_counter() - start:.2f}s)")
+    
+    failed = 0
+    with context.Pool(min(args.jobs, len(jobs)), **pool_options) as pool:
+        for result in pool.imap_unordered(_batch_convert, jobs):
+            if result['error']:
+                failed += 1
+                print(f"[ERROR] {result['notebook']}: {result['error']}")
+            else:
+                print(f"[SUCCESS] {result['output']} ({result['seconds']:.2f}s)")
+    
+    print(f"[*] Done in {time.perf_counter() - start:.2f}s: "
+          f"{len(jobs) - failed} converted, {failed} failed")
+    if failed:
+        sys.exit(1)
+
+
+def print_timings(timings, top=5):
+    """Print a conversion profile with the slowest cells first"""
+    optimize = f", optimize {timings['optimize']:.3f}s" if timings.get('pdf_bytes_unoptimized') else ''
+    print(f"[TIME] Total: {timings['total']:.3f}s "
+          f"(execute {timings['execute']:.3f}s, story {timings['story']:.3f}s, "
+          f"layout/write {timings['build']:.3f}s{optimize}, {timings['pdf_bytes'] / 1024:.1f} KB)")
+    cache = timings.get('layout_cache')
+    if cache:
+        parts = []
+        for name, label in (('width', 'string widths'), ('wrap', 'line wraps')):
+            lookups = cache[f'{name}_hits'] + cache[f'{name}_misses']
+            if lookups:
+                parts.append(f"{label} {cache[f'{name}_hits'] / lookups:.0%} of {lookups}")
+        if parts:
+            print(f"[TIME] Layout cache hits: {', '.join(parts)}")
+    code_cells = [cell for cell in timings['cells'] if 'exec' in cell]
+    hot_cells = sorted(code_cells, key=lambda cell: cell['exec'] + cell['figures'], reverse=True)[:top]
+    for cell in hot_cells:
+        line = (f"[TIME]   Cell {cell['index']}: exec {cell['exec']:.3f}s, "
+                f"figures {cell['figures']:.3f}s, {cell['flowables']} flowables")
+        if 'peak_memory' in cell:
+            line += f", peak +{cell['peak_memory'] / (1024 * 1024):.1f} MB"
+        print(line)
 
 
 def main():
+    if len(sys.argv) > 1 and sys.argv[1] == 'serve':
+        serve_main(sys.argv[2:])
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == 'batch':
+        batch_main(sys.argv[2:])
+        return
+    
     parser = argparse.ArgumentParser(
         description='Convert Jupyter Notebook to Professional PDF',
         formatter_class=argparse.RawDescriptionHelpFormatter,
@@ -757,29 +3677,130 @@ def main():
 Examples:
   python nb2pdf.py mynotebook.ipynb
   python nb2pdf.py mynotebook.ipynb --output report.pdf
+  python nb2pdf.py mynotebook.ipynb --overwrite
+  python nb2pdf.py mynotebook.ipynb --output - | aws s3 cp - s3://bucket/report.pdf
   python nb2pdf.py mynotebook.ipynb --config student_info.json
+  python nb2pdf.py mynotebook.ipynb --timings --timings-json profile.json
+  python nb2pdf.py mynotebook.ipynb --watch
+  python nb2pdf.py mynotebook.ipynb --cells 1-10,15
+  python nb2pdf.py mynotebook.ipynb --sandbox --max-memory 1024 --max-cpu 60
+  SOURCE_DATE_EPOCH=1700000000 python nb2pdf.py mynotebook.ipynb --reproducible
+  python nb2pdf.py mynotebook.ipynb --optimize --linearize
+  python nb2pdf.py submissions/*.ipynb --merge --output bundle.pdf
+  python nb2pdf.py mynotebook.ipynb --bookmark-cells
+  python nb2pdf.py mynotebook.ipynb --progress-json 2> nb2pdf.log
+  python nb2pdf.py serve --http --port 8000
+  python nb2pdf.py batch submissions/*.ipynb --output-dir reports
         """
     )
     
-    parser.add_argument('notebook', help='Path to Jupyter notebook (.ipynb)')
-    parser.add_argument('--output', '-o', help='Output PDF path (default: notebook_name.pdf)')
+    parser.add_argument('notebooks', nargs='+', metavar='notebook',
+                        help='Path to Jupyter notebook (.ipynb); several with --merge')
+    parser.add_argument('--output', '-o', help='Output PDF path, or - to write the PDF to stdout '
+                                               '(default: notebook_name.pdf, or merged.pdf with --merge)')
     parser.add_argument('--config', '-c', help='Student info config file (default: student_info.json)')
+    parser.add_argument('--timings', action='store_true', help='Print per-cell and per-phase timings')
+    parser.add_argument('--timings-json', metavar='PATH', help='Write timings as JSON to PATH')
+    parser.add_argument('--annotate-timings', action='store_true', help='Show each code cell runtime in its PDF header')
+    parser.add_argument('--cells', metavar='RANGES',
+                        help='Only execute and include these cells, e.g. 1-10,15 (numbers as shown in the PDF)')
+    parser.add_argument('--sandbox', action='store_true',
+                        help='Execute cells in a child process under resource limits (Unix only)')
+    parser.add_argument('--max-memory', type=int, metavar='MB',
+                        help=f"Sandbox address-space limit (default: {DEFAULT_SANDBOX_LIMITS['memory_mb']}); implies --sandbox")
+    parser.add_argument('--max-cpu', type=int, metavar='SECONDS',
+                        help=f"Sandbox CPU time limit (default: {DEFAULT_SANDBOX_LIMITS['cpu_seconds']}); implies --sandbox")
+    parser.add_argument('--max-file-size', type=int, metavar='MB',
+                        help=f"Sandbox limit per written file (default: {DEFAULT_SANDBOX_LIMITS['file_size_mb']}); implies --sandbox")
+    parser.add_argument('--max-open-files', type=int, metavar='N',
+                        help=f"Sandbox open file limit (default: {DEFAULT_SANDBOX_LIMITS['open_files']}); implies --sandbox")
+    parser.add_argument('--reproducible', action='store_true',
+                        help='Byte-identical output for identical inputs (dates from SOURCE_DATE_EPOCH)')
+    parser.add_argument('--optimize', action='store_true',
+                        help='Smaller PDF: binary streams, plus object streams and recompression when pikepdf is installed')
+    parser.add_argument('--compression-level', type=int, choices=range(10), metavar='0-9',
+                        help=f"Flate level used by --optimize (default: {DEFAULT_OPTIMIZE['compression_level']}); implies --optimize")
+    parser.add_argument('--linearize', action='store_true',
+                        help='Linearize for fast web view (needs pikepdf); implies --optimize')
+    parser.add_argument('--watch', action='store_true',
+                        help='Keep running and update the PDF on every save, re-executing only changed cells')
+    parser.add_argument('--merge', action='store_true',
+                        help='Combine all given notebooks into one PDF with a table of contents')
+    parser.add_argument('--bookmark-cells', action='store_true',
+                        help='List every cell in the PDF outline, not just markdown headings')
+    parser.add_argument('--overwrite', action='store_true',
+                        help='Replace an existing output file instead of writing a timestamped copy')
+    parser.add_argument('--progress-json', action='store_true',
+                        help='Print progress as one JSON event per line on stdout (messages go to stderr)')
     
     args = parser.parse_args()
     
-    # Validate notebook path
-    notebook_path = Path(args.notebook)
-    if not notebook_path.exists():
-        print(f"[ERROR] Notebook not found: {notebook_path}")
-        sys.exit(1)
+    if len(args.notebooks) > 1 and not args.merge:
+        parser.error("several notebooks need --merge (one PDF), or use the batch subcommand (one PDF each)")
+    if args.merge:
+        for flag, used in (('--watch', args.watch), ('--cells', args.cells),
+                           ('--timings', args.timings), ('--timings-json', args.timings_json)):
+            if used:
+                parser.error(f"{flag} cannot be combined with --merge")
+    if args.progress_json:
+        for flag, used in (('--watch', args.watch), ('--merge', args.merge), ('--output -', args.output == '-')):
+            if used:
+                parser.error(f"{flag} cannot be combined with --progress-json")
     
-    if not notebook_path.suffix == '.ipynb':
-        print(f"[ERROR] File must be a Jupyter notebook (.ipynb)")
+    # Validate notebook paths
+    for notebook_path in map(Path, args.notebooks):
+        if not notebook_path.exists():
+            print(f"[ERROR] Notebook not found: {notebook_path}")
+            sys.exit(1)
+        
+        if not notebook_path.suffix == '.ipynb':
+            print(f"[ERROR] File must be a Jupyter notebook (.ipynb)")
+            sys.exit(1)
+    notebook_path = Path(args.notebooks[0])
+    
+    select = None
+    if args.cells:
+        try:
+            select = parse_cell_ranges(args.cells)
+        except ValueError as e:
+            parser.error(f"--cells: {e}")
+    
+    limits = None
+    overrides = {
+        'memory_mb': args.max_memory,
+        'cpu_seconds': args.max_cpu,
+        'file_size_mb': args.max_file_size,
+        'open_files': args.max_open_files,
+    }
+    if args.sandbox or any(value is not None for value in overrides.values()):
+        limits = dict(DEFAULT_SANDBOX_LIMITS)
+        limits.update({key: value for key, value in overrides.items() if value is not None})
+        if resource is None:
+            parser.error("--sandbox needs a Unix system")
+        if args.watch:
+            parser.error("--sandbox cannot be combined with --watch")
+    
+    optimize = None
+    if args.optimize or args.compression_level is not None or args.linearize:
+        # Only explicit flags, so optimize_pdf() can say which ones it could not apply
+        optimize = {'linearize': args.linearize}
+        if args.compression_level is not None:
+            optimize['compression_level'] = args.compression_level
+    
+    if args.watch and args.output == '-':
+        print("[ERROR] --watch needs an output file, not stdout")
         sys.exit(1)
     
     # Determine output path
-    if args.output:
+    pdf_stream = None
+    if args.output == '-':
+        # Keep stdout clean for the PDF bytes; all messages go to stderr
+        pdf_stream = sys.stdout.buffer
+        sys.stdout = sys.stderr
+    elif args.output:
         output_path = Path(args.output)
+    elif args.merge:
+        output_path = notebook_path.with_name('merged.pdf')
     else:
         output_path = notebook_path.with_suffix('.pdf')
     
@@ -787,14 +3808,87 @@ Examples:
     config_path = args.config or 'student_info.json'
     config = load_config(config_path)
     
+    if args.watch:
+        try:
+            watch_notebook(notebook_path, output_path, config, annotate_timings=args.annotate_timings, select=select,
+                           bookmark_cells=args.bookmark_cells)
+        except KeyboardInterrupt:
+            print("\n[*] Stopped watching")
+        return
+    
+    progress = None
+    if args.progress_json:
+        # stdout carries only the events; cell output is captured separately
+        progress_stream = sys.stdout
+        sys.stdout = sys.stderr
+        
+        def write_event(event):
+            progress_stream.write(json.dumps(event) + '\n')
+            progress_stream.flush()
+        
+        progress = write_event
+    
+    # Stop on SIGTERM (e.g. from an editor or job runner) as on Ctrl+C
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    if args.progress_json:
+        # Background launchers may start us with SIGINT ignored, which
+        # Python then leaves in place; the extension cancels with it
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+    
     # Create PDF
+    timings = {} if (args.timings or args.timings_json) else None
+    start = time.perf_counter()
     try:
-        create_pdf(notebook_path, output_path, config)
+        if args.merge and pdf_stream is not None:
+            merge_notebooks(args.notebooks, config, pdf_stream, log=print,
+                            annotate_timings=args.annotate_timings, limits=limits,
+                            reproducible=args.reproducible, optimize=optimize,
+                            bookmark_cells=args.bookmark_cells)
+            pdf_stream.flush()
+            print("[SUCCESS] PDF written to stdout")
+        elif args.merge:
+            create_merged_pdf(args.notebooks, output_path, config, annotate_timings=args.annotate_timings,
+                              limits=limits, reproducible=args.reproducible, optimize=optimize,
+                              bookmark_cells=args.bookmark_cells, overwrite=args.overwrite)
+        elif pdf_stream is not None:
+            print(f"[*] Loading notebook: {notebook_path}")
+            convert(notebook_path, config, pdf_stream, timings=timings,
+                    annotate_timings=args.annotate_timings, log=print, select=select, limits=limits,
+                    reproducible=args.reproducible, optimize=optimize, bookmark_cells=args.bookmark_cells,
+                    partial_on_cancel=True)
+            pdf_stream.flush()
+            print("[SUCCESS] PDF written to stdout")
+        else:
+            output_path = create_pdf(notebook_path, output_path, config, timings=timings,
+                                     annotate_timings=args.annotate_timings, select=select, limits=limits,
+                                     reproducible=args.reproducible, optimize=optimize,
+                                     bookmark_cells=args.bookmark_cells, progress=progress,
+                                     partial_on_cancel=True, overwrite=args.overwrite)
+    except KeyboardInterrupt as e:
+        # ExecutionCancelled carries the path of any partial PDF
+        output = getattr(e, 'output', None)
+        print("[WARN] Conversion cancelled")
+        if progress:
+            progress({'event': 'cancelled', 'output': str(output) if output else None})
+        sys.exit(130)
     except Exception as e:
         print(f"[ERROR] Error creating PDF: {e}")
         import traceback
         traceback.print_exc()
+        if progress:
+            progress({'event': 'error', 'message': str(e)})
         sys.exit(1)
+    
+    if progress:
+        progress({'event': 'done', 'output': str(output_path), 'bytes': output_path.stat().st_size,
+                  'seconds': round(time.perf_counter() - start, 3)})
+    
+    if args.timings:
+        print_timings(timings)
+    if args.timings_json:
+        with open(args.timings_json, 'w', encoding='utf-8') as f:
+            json.dump(timings, f, indent=2)
+        print(f"[INFO] Timings written to: {args.timings_json}")
 
 
 if __name__ == '__main__':
@@ -1,11 +1,83 @@
 import * as vscode from 'vscode';
 import * as path from 'path';
 import * as fs from 'fs';
-import { exec } from 'child_process';
+import * as os from 'os';
+import { exec, spawn } from 'child_process';
 import { promisify } from 'util';
 
 const execAsync = promisify(exec);
 
+// Share of the progress bar given to executing cells; layout gets the rest
+const EXECUTE_SHARE = 80;
+
+// After a cancel, how long nb2pdf may go without progress (writing the partial PDF) before it is killed
+const CANCEL_GRACE_MS = 5000;
+
+// Conversions run at the same time each get their own config file
+let configFileCount = 0;
+
+/**
+ * Converts notebooks as they are saved (nb2pdf.convertOnSave), one queue per workspace folder.
+ * Saves are debounced per notebook, a notebook waiting in the queue is converted once with its
+ * latest version however often it is saved, and at most nb2pdf.maxConcurrentConversions
+ * conversions run at a time. A notebook saved while it is converting runs again afterwards.
+ */
+class AutoConvertQueue {
+    private timers = new Map<string, NodeJS.Timeout>();
+    private pending = new Set<string>();
+    private running = new Set<string>();
+
+    schedule(notebookPath: string) {
+        const delay = vscode.workspace.getConfiguration('nb2pdf').get<number>('convertOnSaveDelay', 1500);
+        clearTimeout(this.timers.get(notebookPath));
+        this.timers.set(notebookPath, setTimeout(() => {
+            this.timers.delete(notebookPath);
+            this.pending.add(notebookPath);
+            this.next();
+        }, delay));
+    }
+
+    private next() {
+        const limit = Math.max(1, vscode.workspace.getConfiguration('nb2pdf').get<number>('maxConcurrentConversions', 1));
+        for (const notebookPath of this.pending) {
+            if (this.running.size >= limit) {
+                break;
+            }
+            if (this.running.has(notebookPath)) {
+                continue;
+            }
+            this.pending.delete(notebookPath);
+            this.running.add(notebookPath);
+            autoConvertNotebook(notebookPath).finally(() => {
+                this.running.delete(notebookPath);
+                this.next();
+            });
+        }
+    }
+
+    dispose() {
+        this.timers.forEach(timer => clearTimeout(timer));
+        this.timers.clear();
+        this.pending.clear();
+    }
+}
+
+const autoConvertQueues = new Map<string, AutoConvertQueue>();
+
+function onNotebookSaved(uri: vscode.Uri) {
+    if (uri.scheme !== 'file' || !uri.fsPath.endsWith('.ipynb')
+        || !vscode.workspace.getConfiguration('nb2pdf', uri).get<boolean>('convertOnSave', false)) {
+        return;
+    }
+    const key = vscode.workspace.getWorkspaceFolder(uri)?.uri.toString() || '';
+    let queue = autoConvertQueues.get(key);
+    if (!queue) {
+        queue = new AutoConvertQueue();
+        autoConvertQueues.set(key, queue);
+    }
+    queue.schedule(uri.fsPath);
+}
+
 // Migrate old settings to new field names (v1.1.7)
 function migrateSettings() {
     const config = vscode.workspace.getConfiguration('nb2pdf');
@@ -71,7 +143,13 @@ export function activate(context: vscode.ExtensionContext) {
         await checkDependencies(true);
     });
 
-    context.subscriptions.push(convertCommand, convertCustomCommand, configureCommand, checkDepsCommand);
+    // Convert on save; notebooks opened as JSON text count too
+    let notebookSaved = vscode.workspace.onDidSaveNotebookDocument(notebook => onNotebookSaved(notebook.uri));
+    let textSaved = vscode.workspace.onDidSaveTextDocument(document => onNotebookSaved(document.uri));
+    let stopQueues = new vscode.Disposable(() => autoConvertQueues.forEach(queue => queue.dispose()));
+
+    context.subscriptions.push(convertCommand, convertCustomCommand, configureCommand, checkDepsCommand,
+                               notebookSaved, textSaved, stopQueues);
 }
 
 async function convertNotebookToPdf(uri?: vscode.Uri, customName: boolean = false) {
@@ -133,21 +211,39 @@ async function convertNotebookToPdf(uri?: vscode.Uri, customName: boolean = fals
         await vscode.window.withProgress({
             location: vscode.ProgressLocation.Notification,
             title: 'Converting notebook to PDF',
-            cancellable: false
-        }, async (progress) => {
-            progress.report({ message: 'Executing notebook cells...' });
+            cancellable: true
+        }, async (progress, token) => {
+            progress.report({ message: 'Starting Python...' });
 
-            // Build command
-            const cmd = `"${pythonPath}" "${nb2pdfScript}" "${notebookPath}" --output "${outputPath}" --config "${configPath}"`;
+            const args = [nb2pdfScript, notebookPath, '--output', outputPath, '--config', configPath];
+            const timeoutSeconds = vscode.workspace.getConfiguration('nb2pdf').get<number>('progressTimeout', 60);
 
             try {
-                // Execute nb2pdf
-                const { stdout, stderr } = await execAsync(cmd, {
-                    cwd: path.dirname(nb2pdfScript),
-                    timeout: 60000 // 60 second timeout
+                // Execute nb2pdf, following its progress events
+                const done = await runNb2pdf(pythonPath, args, path.dirname(nb2pdfScript), timeoutSeconds * 1000, token, event => {
+                    switch (event.event) {
+                        case 'phase':
+                            if (event.phase === 'layout') {
+                                progress.report({ message: 'Generating PDF...' });
+                            } else if (event.phase === 'optimize') {
+                                progress.report({ message: 'Optimizing PDF...' });
+                            }
+                            break;
+                        case 'cell_start':
+                            progress.report({ message: `Executing cell ${event.index}/${event.cells}...` });
+                            break;
+                        case 'cell_end':
+                            progress.report({ increment: EXECUTE_SHARE / event.cells });
+                            break;
+                        case 'page':
+                            progress.report({ message: `Generating PDF (page ${event.page})...` });
+                            break;
+                    }
                 });
 
-                progress.report({ message: 'PDF generated successfully!' });
+                // nb2pdf picks a new name rather than overwrite an existing PDF
+                outputPath = done.output;
+                progress.report({ message: 'PDF generated successfully!', increment: 100 });
 
                 // Clean up temp config
                 try {
@@ -192,10 +288,26 @@ async function convertNotebookToPdf(uri?: vscode.Uri, customName: boolean = fals
                 } catch (e) {
                     // Ignore
                 }
+
+                if (error.cancelled) {
+                    if (!error.partialOutput) {
+                        vscode.window.showInformationMessage('PDF conversion cancelled');
+                        return;
+                    }
+                    const selection = await vscode.window.showInformationMessage(
+                        `PDF conversion cancelled. Partial PDF with the cells run so far: ${path.basename(error.partialOutput)}`,
+                        'Open PDF'
+                    );
+                    if (selection === 'Open PDF') {
+                        vscode.env.openExternal(vscode.Uri.file(error.partialOutput));
+                    }
+                    return;
+                }
                 
                 // IMPORTANT: Check if PDF was actually created despite stderr output
                 // Sometimes warnings go to stderr but PDF is still generated successfully
-                if (fs.existsSync(outputPath)) {
+                // A killed run never wrote one, so an existing file is from before
+                if (!error.killed && fs.existsSync(outputPath)) {
                     const stats = fs.statSync(outputPath);
                     if (stats.size > 0) {
                         // PDF was created successfully despite stderr warnings
@@ -238,6 +350,134 @@ async function convertNotebookToPdf(uri?: vscode.Uri, customName: boolean = fals
     }
 }
 
+/**
+ * Convert a saved notebook to notebook_name.pdf, replacing the previous PDF, with
+ * progress in the status bar instead of a notification
+ */
+async function autoConvertNotebook(notebookPath: string) {
+    const nb2pdfScript = await findNb2pdfScript();
+    if (!nb2pdfScript) {
+        return;
+    }
+    const pythonPath = await getPythonPath();
+    const configPath = await createStudentInfoFile();
+    const outputPath = notebookPath.replace(/\.ipynb$/, '.pdf');
+    const args = [nb2pdfScript, notebookPath, '--output', outputPath, '--config', configPath, '--overwrite'];
+    const timeoutSeconds = vscode.workspace.getConfiguration('nb2pdf').get<number>('progressTimeout', 60);
+
+    try {
+        await vscode.window.withProgress({
+            location: vscode.ProgressLocation.Window,
+            title: `nb2pdf: ${path.basename(notebookPath)}`
+        }, (progress, token) => runNb2pdf(pythonPath, args, path.dirname(nb2pdfScript), timeoutSeconds * 1000, token, event => {
+            if (event.event === 'cell_start') {
+                progress.report({ message: `cell ${event.index}/${event.cells}` });
+            } else if (event.event === 'phase' && event.phase === 'layout') {
+                progress.report({ message: 'generating PDF' });
+            }
+        }));
+        vscode.window.setStatusBarMessage(`$(file-pdf) ${path.basename(outputPath)} updated`, 5000);
+    } catch (error: any) {
+        handleConversionError(error, notebookPath);
+    } finally {
+        try {
+            fs.unlinkSync(configPath);
+        } catch (e) {
+            // Ignore cleanup errors
+        }
+    }
+}
+
+/**
+ * Run nb2pdf.py with --progress-json, passing each progress event to onEvent as it
+ * arrives. The timeout restarts with every event, so a long notebook can run as long
+ * as its cells keep finishing; it only fails after timeoutMs without progress (0 = never).
+ * Cancelling or timing out interrupts the running cell with SIGINT; nb2pdf then writes a
+ * PDF of the cells run so far, and is killed if it stalls for CANCEL_GRACE_MS.
+ * Resolves with the final 'done' event; rejects like exec() does, with `killed` set
+ * when the process was stopped, `cancelled` when the user cancelled, and
+ * `partialOutput` when a partial PDF was written.
+ */
+function runNb2pdf(pythonPath: string, args: string[], cwd: string, timeoutMs: number,
+                   token: vscode.CancellationToken, onEvent: (event: any) => void): Promise<any> {
+    return new Promise((resolve, reject) => {
+        const child = spawn(pythonPath, [...args, '--progress-json'], { cwd });
+        let stderr = '';
+        let pending = '';
+        let done: any;
+        let partialOutput: string | undefined;
+        let stopped: string | undefined;
+        let timer: NodeJS.Timeout | undefined;
+
+        const restartTimer = () => {
+            clearTimeout(timer);
+            if (stopped) {
+                timer = setTimeout(() => child.kill('SIGKILL'), CANCEL_GRACE_MS);
+            } else if (timeoutMs > 0) {
+                timer = setTimeout(() => stop(`Conversion timed out: no progress for ${timeoutMs / 1000} seconds`), timeoutMs);
+            }
+        };
+        const stop = (reason: string) => {
+            if (stopped) {
+                return;
+            }
+            stopped = reason;
+            // Raises KeyboardInterrupt in the running cell (Windows has no SIGINT and kills outright)
+            child.kill('SIGINT');
+            restartTimer();
+        };
+        const cancellation = token.onCancellationRequested(() => stop('Conversion cancelled'));
+        restartTimer();
+
+        child.stdout.setEncoding('utf8');
+        child.stdout.on('data', (chunk: string) => {
+            const lines = (pending + chunk).split('\n');
+            pending = lines.pop() || '';
+            for (const line of lines) {
+                let event;
+                try {
+                    event = JSON.parse(line);
+                } catch (e) {
+                    continue; // Not an event (e.g. a cell writing to the real stdout)
+                }
+                restartTimer();
+                if (event.event === 'done') {
+                    done = event;
+                } else if (event.event === 'cancelled') {
+                    partialOutput = event.output || undefined;
+                }
+                onEvent(event);
+            }
+        });
+        child.stderr.setEncoding('utf8');
+        child.stderr.on('data', (chunk: string) => {
+            stderr += chunk;
+        });
+
+        const finish = (error?: any) => {
+            clearTimeout(timer);
+            cancellation.dispose();
+            if (error) {
+                reject(error);
+            } else {
+                resolve(done);
+            }
+        };
+        child.on('error', error => finish(error));
+        child.on('close', code => {
+            if (code === 0 && done && !stopped) {
+                finish();
+                return;
+            }
+            const error: any = new Error(`${stopped || `Command failed with exit code ${code}`}\n${stderr}`);
+            error.killed = stopped !== undefined;
+            error.cancelled = token.isCancellationRequested;
+            error.partialOutput = partialOutput;
+            finish(error);
+        });
+    });
+}
+
 /**
  * Check if all required dependencies are installed
  */
@@ -474,9 +714,8 @@ async function createStudentInfoFile(): Promise<string> {
         project_subtitle: config.get<string>('projectSubtitle') || ''
     };
 
-    // Create temp file
-    const tempDir = vscode.workspace.workspaceFolders?.[0]?.uri.fsPath || process.cwd();
-    const configPath = path.join(tempDir, '.nb2pdf_config.json');
+    // Create temp file, unique per conversion since they can overlap
+    const configPath = path.join(os.tmpdir(), `nb2pdf_config_${process.pid}_${++configFileCount}.json`);
     
     fs.writeFileSync(configPath, JSON.stringify(studentInfo, null, 2));
     